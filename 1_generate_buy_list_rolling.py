@@ -3,7 +3,9 @@ import numpy as np
 import os
 import glob
 import shutil
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from db_pool import get_engine
+from trade_calendar import get_calendar
 import datetime
 
 # --- 配置部分 ---
@@ -20,11 +22,12 @@ PERFORMANCE_TABLE = "my_holdings_performance"
 
 DEFAULT_START_CAPITAL = 1000000.0 
 FRICTION_RATE = 0.003 
+NEXT_OPEN_WINDOW = 20   # 寻找 T+1 行情时最多向后看的交易日数
 
 os.makedirs(HISTORY_DIR, exist_ok=True)
 
 def get_db_engine():
-    return create_engine(DSN)
+    return get_engine(DSN)
 
 def ensure_performance_table(engine):
     """
@@ -144,6 +147,10 @@ def get_next_open_batch(current_date_str, symbol_list):
     if not symbol_list: return None
     engine = get_db_engine()
     symbols_str = "'" + "','".join(symbol_list) + "'"
+    # 用交易日历把扫描范围限定在 T+1 ~ T+NEXT_OPEN_WINDOW（停牌股取窗口内首个有行情的日期）
+    cal = get_calendar(engine)
+    next_date = cal.next_open(current_date_str).strftime('%Y-%m-%d')
+    window_end = cal.offset(next_date, NEXT_OPEN_WINDOW, clip=True).strftime('%Y-%m-%d')
     sql = f"""
     SELECT DISTINCT ON (symbol) 
         symbol, 
@@ -151,7 +158,7 @@ def get_next_open_batch(current_date_str, symbol_list):
         trade_date as next_date,
         volume
     FROM stock_history
-    WHERE trade_date > '{current_date_str}' 
+    WHERE trade_date BETWEEN '{next_date}' AND '{window_end}'
       AND symbol IN ({symbols_str})
     ORDER BY symbol, trade_date ASC
     """
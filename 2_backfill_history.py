@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from db_pool import get_engine
 from dotenv import load_dotenv
 import os
 
@@ -19,7 +20,7 @@ TOTAL_BUDGET = 1000000.0  # 假设你最初投入了 100 万
 END_DATE_STR = '2026-02-05'
 
 def get_db_engine():
-    return create_engine(DSN)
+    return get_engine(DSN)
 
 def backfill_history():
     engine = get_db_engine()
@@ -1,13 +1,16 @@
 from sqlalchemy import create_engine, Column, String, Float, DateTime, Date
 from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime
 import pandas as pd
 import akshare as ak
 import logging
 import argparse
 import sys
-from typing import Dict, List
+from typing import Dict, List, Tuple
+from bulk_loader import HASH_COLUMN, copy_upsert, copy_upsert_changed
+from cn_number import parse_numeric_columns, unparsed_count
+from db_pool import pooled_connection
+from schema_registry import refresh_columns
 
 # 设置日志
 logging.basicConfig(
@@ -23,6 +26,13 @@ logger = logging.getLogger(__name__)
 # 创建 Base
 Base = declarative_base()
 
+TABLE_NAME = 'financial_indicators'
+KEY_COLUMNS = ['symbol', 'report_date']
+TIMESTAMP_COLUMNS = ['create_time', 'update_time']
+# 不是指标的列：时间戳与 copy_upsert_changed 维护的内容哈希
+NON_METRIC_COLUMNS = TIMESTAMP_COLUMNS + [HASH_COLUMN]
+_TEXT_TYPES = {'character varying', 'character', 'text'}
+
 class FinancialIndicator(Base):
     __tablename__ = 'financial_indicators'
     
@@ -140,8 +150,94 @@ class FinancialIndicator(Base):
     update_time = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
 
+def _primary_key(conn, table_name: str) -> Tuple[str, List[str]]:
+    """(主键约束名, 主键列)"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.conname, a.attname
+            FROM pg_constraint c
+            JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)
+            WHERE c.conrelid = %s::regclass AND c.contype = 'p'
+            ORDER BY array_position(c.conkey, a.attnum)
+        """, (table_name,))
+        rows = cur.fetchall()
+    if not rows:
+        raise ValueError(f"{table_name} 没有主键")
+    return rows[0][0], [r[1] for r in rows]
+
+
+def text_metric_columns(conn, table_name: str = TABLE_NAME) -> List[str]:
+    """仍以字符串存储的指标列（主键、时间戳、row_hash 除外）；表不存在时为空"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s)", (table_name,))
+        if cur.fetchone()[0] is None:
+            return []
+    column_types = refresh_columns(conn, table_name)
+    _, pk = _primary_key(conn, table_name)
+    return [c for c, t in column_types.items()
+            if t in _TEXT_TYPES and c not in pk and c not in NON_METRIC_COLUMNS]
+
+
+def migrate_to_numeric(db_config: Dict, table_name: str = TABLE_NAME, batch_size: int = 20000) -> int:
+    """
+    把 VARCHAR 存储的指标列迁移为 DOUBLE PRECISION，返回迁移行数
+    - 新建同结构的 <表>_typed（指标列为数值类型），服务端游标分批读出旧表，parse_cn_number 解析后 COPY 写入
+    - 同一事务内旧表改名为 <表>_legacy、新表接替原名并建报告期索引；任何一步失败整体回滚，原表不受影响
+    - 旧表保留供核对，确认无误后手工 DROP
+    """
+    typed, legacy = f'{table_name}_typed', f'{table_name}_legacy'
+    with pooled_connection(db_config) as conn:
+        metrics = text_metric_columns(conn, table_name)
+        if not metrics:
+            logger.info(f"{table_name} 的指标列已是数值类型，无需迁移")
+            return 0
+        pk_name, pk = _primary_key(conn, table_name)
+        columns = list(refresh_columns(conn, table_name))
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass(%s)", (legacy,))
+                if cur.fetchone()[0] is not None:
+                    raise ValueError(f"{legacy} 已存在，请核对并删除上一次迁移留下的旧表后重试")
+                cur.execute(f"DROP TABLE IF EXISTS {typed}")
+                cur.execute(f"CREATE TABLE {typed} (LIKE {table_name} INCLUDING DEFAULTS)")
+                cur.execute(f"ALTER TABLE {typed} " + ', '.join(
+                    f"ALTER COLUMN {c} TYPE DOUBLE PRECISION USING NULL" for c in metrics))
+                cur.execute(f"ALTER TABLE {typed} ADD CONSTRAINT {typed}_pkey PRIMARY KEY ({', '.join(pk)})")
+
+            total, unparsed = 0, 0
+            # 服务端游标：不把整张旧表读进内存；与写入共用同一事务
+            with conn.cursor(name=f'{table_name}_migrate') as src:
+                src.itersize = batch_size
+                src.execute(f"SELECT {', '.join(columns)} FROM {table_name}")
+                while True:
+                    rows = src.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    raw = pd.DataFrame(rows, columns=columns)
+                    parsed = parse_numeric_columns(raw, columns=metrics)
+                    unparsed += sum(unparsed_count(raw[c], parsed[c]) for c in metrics)
+                    total += copy_upsert(conn, parsed, typed, pk_columns=pk)
+                    logger.info(f"{table_name} 已迁移 {total} 行")
+
+            with conn.cursor() as cur:
+                cur.execute(f"ALTER TABLE {table_name} RENAME TO {legacy}")
+                cur.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {pk_name} TO {legacy}_pkey")
+                cur.execute(f"ALTER TABLE {typed} RENAME TO {table_name}")
+                cur.execute(f"ALTER TABLE {table_name} RENAME CONSTRAINT {typed}_pkey TO {table_name}_pkey")
+                cur.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_period_idx ON {table_name} ({pk[-1]})")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        refresh_columns(conn, table_name)
+    logger.info(f"{table_name} 迁移完成：{total} 行，{len(metrics)} 个指标列转为数值，"
+                f"无法解析置空 {unparsed} 个值；旧数据保留在 {legacy}")
+    return total
+
+
 class FinancialIndicatorCollector:
     def __init__(self, db_config: Dict):
+        self.db_config = db_config
         self.db_url = f"postgresql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
         self.engine = create_engine(self.db_url)
         self.Session = sessionmaker(bind=self.engine)
@@ -275,9 +371,9 @@ class FinancialIndicatorCollector:
         # 转换日期格式
         df['report_date'] = pd.to_datetime(df['report_date']).dt.date
         
-        # 只选择已映射的列
+        # 只选择已映射的列；指标值（'12.3亿'、'45.6%'、'--' 等）整列解析为数值
         columns = ['symbol', 'report_date'] + [v for v in column_mapping.values() if v != 'report_date']
-        return df[columns]
+        return parse_numeric_columns(df.reindex(columns=columns), exclude=KEY_COLUMNS)
 
         
     def save_to_database(self, df: pd.DataFrame):
@@ -285,38 +381,23 @@ class FinancialIndicatorCollector:
         if df.empty:
             return
             
-        session = self.Session()
-        try:
-            # 获取所有列名（除了主键和时间戳）
-            update_columns = [col for col in df.columns 
-                            if col not in ['symbol', 'report_date', 'create_time', 'update_time']]
-            
-            # 构建 upsert 语句
-            stmt = insert(FinancialIndicator).values(df.to_dict('records'))
-            
-            # 构建更新字典
-            update_dict = {col: stmt.excluded[col] for col in update_columns}  # 使用字典索引而不是 getattr
-            update_dict['update_time'] = datetime.now()
-            
-            # 添加 on_conflict_do_update
-            stmt = stmt.on_conflict_do_update(
-                constraint=FinancialIndicator.__table__.primary_key,
-                set_=update_dict
-            )
-            
-            session.execute(stmt)
-            session.commit()
-            logger.info(f"成功保存 {len(df)} 条记录")
-        except Exception as e:
-            session.rollback()
-            logger.error(f"数据保存失败: {str(e)}")
-            raise
-        finally:
-            session.close()
+        with pooled_connection(self.db_config) as conn:
+            try:
+                stats = copy_upsert_changed(conn, df, TABLE_NAME, pk_columns=KEY_COLUMNS)
+                conn.commit()
+                logger.info(f"成功保存 {len(df)} 条记录：新增 {stats.inserted}，更新 {stats.updated}，"
+                            f"未变化 {stats.unchanged}")
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"数据保存失败: {str(e)}")
+                raise
 
             
     def collect_data(self, start_year: str):
         """收集财务指标数据"""
+        with pooled_connection(self.db_config) as conn:
+            if text_metric_columns(conn):
+                logger.warning(f"{TABLE_NAME} 仍有字符串类型的指标列，请先运行 --migrate 转为数值类型")
         stock_list = self.get_stock_list()
         total = len(stock_list)
         
@@ -340,6 +421,15 @@ def main():
         default="2008",
         help='开始年份 (默认: 2008)'
     )
+    parser.add_argument(
+        '--migrate',
+        nargs='?',
+        const=TABLE_NAME,
+        default=None,
+        metavar='TABLE',
+        help=f'把该表中 VARCHAR 存储的指标列迁移为数值类型后退出（缺省 {TABLE_NAME}；'
+             f'同花顺指标表为 financial_indicators_ths）'
+    )
     
     args = parser.parse_args()
     
@@ -352,6 +442,10 @@ def main():
         'database': 'Financialdata'
     }
     
+    if args.migrate:
+        migrate_to_numeric(db_config, args.migrate)
+        return
+
     collector = FinancialIndicatorCollector(db_config)
     
     try:
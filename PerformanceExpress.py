@@ -2,6 +2,7 @@ import akshare as ak
 import pandas as pd
 from datetime import datetime, timedelta
 import psycopg2
+from db_pool import pooled_connection
 from psycopg2.extras import execute_values
 import logging
 from typing import List, Optional
@@ -30,7 +31,7 @@ class PerformanceExpressCollector:
     
     def get_db_connection(self):
         """获取数据库连接"""
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def get_latest_report_period(self) -> Optional[str]:
         """获取数据库中最新的报告期"""
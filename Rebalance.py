@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from db_pool import get_engine
 from dotenv import load_dotenv
 import os
 from datetime import timedelta
@@ -21,7 +22,7 @@ START_DATE_STR = '2026-03-08'
 END_DATE_STR = '2026-03-12'
 
 def get_db_engine():
-    return create_engine(DSN)
+    return get_engine(DSN)
 
 def backfill_history_v2():
     engine = get_db_engine()
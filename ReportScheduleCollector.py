@@ -2,10 +2,12 @@ import akshare as ak
 import pandas as pd
 from datetime import datetime, timedelta
 import psycopg2
+from db_pool import pooled_connection
 from psycopg2.extras import execute_batch
 import logging
 from typing import Optional, List, Dict
 import time
+from resilience import BAIDU, CircuitOpenError, get_breaker
 
 class ReportScheduleCollector:
     def __init__(self, db_params: Dict):
@@ -38,12 +40,12 @@ class ReportScheduleCollector:
 
     def get_connection(self):
         """获取数据库连接"""
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def fetch_report_schedule(self, date_str: str) -> Optional[pd.DataFrame]:
         """获取指定日期的财报发行数据"""
         try:
-            df = ak.news_report_time_baidu(date=date_str)
+            df = get_breaker(BAIDU).call(ak.news_report_time_baidu, date=date_str)
             if df is not None and not df.empty:
                 # 将日期字符串转换为datetime对象
                 report_date = datetime.strptime(date_str, '%Y%m%d').date()
@@ -57,6 +59,9 @@ class ReportScheduleCollector:
                 })
                 return df
             return None
+        except CircuitOpenError as e:
+            self.logger.warning(f"跳过 {date_str}: {e}")
+            return None
         except Exception as e:
             self.logger.error(f"获取数据失败 {date_str}: {str(e)}")
             return None
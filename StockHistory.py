@@ -1,16 +1,22 @@
 import akshare as ak
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
+from db_pool import pooled_connection
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Tuple
 import time
 import random
 import multiprocessing
 import argparse
 import sys
 from datetime import datetime, timedelta
-from functools import wraps
+from watermark import WatermarkStore
+from bulk_loader import copy_upsert
+from work_queue import missing_days, order_by_cost, run_work_queue
+from job_ledger import JobLedger, covered_until
+from resilience import CircuitOpenError, EASTMONEY, retry_on_exception
+from security_master import get_security_master
+from spot_snapshot import fetch_spot_snapshot, gap_tasks, snapshot_to_bars, snapshot_trade_date
 
 # 设置日志
 logging.basicConfig(
@@ -23,54 +29,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def chunks(lst: List, n: int) -> List[List]:
-    """将列表分割成n个大致相等的块"""
-    if not lst:
-        return []
-    
-    size = len(lst)
-    chunk_size = (size + n - 1) // n  # 向上取整确保覆盖所有元素
-    
-    return [lst[i:i + chunk_size] for i in range(0, size, chunk_size)]
-
-def retry_on_exception(retries=3, delay=5, backoff=2, exceptions=(Exception,)):
-    """
-    重试装饰器
-    
-    参数:
-        retries: 最大重试次数
-        delay: 初始延迟时间（秒）
-        backoff: 延迟时间的增长因子
-        exceptions: 需要重试的异常类型
-    """
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            retry_delay = delay
-            last_exception = None
-            
-            for retry in range(retries + 1):  # +1 是为了包含第一次尝试
-                try:
-                    return func(*args, **kwargs)
-                except exceptions as e:
-                    last_exception = e
-                    if retry == retries:  # 如果是最后一次尝试
-                        raise last_exception
-                    
-                    # 计算下一次重试的延迟时间
-                    wait_time = retry_delay + random.uniform(0, 1)
-                    logger.warning(f"尝试 {retry + 1}/{retries} 失败: {str(e)}. "
-                                 f"{wait_time:.2f} 秒后重试...")
-                    
-                    time.sleep(wait_time)
-                    retry_delay *= backoff  # 增加延迟时间
-                    
-            raise last_exception
-        return wrapper
-    return decorator
 
-@retry_on_exception(retries=3, delay=5, backoff=2, 
-                   exceptions=(Exception, TimeoutError, ConnectionError))
+@retry_on_exception(retries=3, delay=5, backoff=2, upstream=EASTMONEY)
 def fetch_stock_data(symbol: str, period: str, start_date: str, 
                     end_date: str, adjust: str) -> pd.DataFrame:
     """
@@ -84,60 +44,55 @@ def fetch_stock_data(symbol: str, period: str, start_date: str,
         adjust=adjust
     )
     
-def process_stock_batch(db_params: Dict, stock_batch: List[str], batch_id: int, 
-                       start_date: str, end_date: str, mode: str, adjust: str):
-    """处理一批股票的数据采集"""
-    if not stock_batch:
-        logger.warning(f"Batch {batch_id}: Empty stock batch, skipping")
-        return
-        
+# 每个工作进程持有一个 collector 和任务台账，由 init_worker 创建
+_worker_collector = None
+_worker_ledger = None
+
+def ledger_key(symbol: str, adjust: str) -> str:
+    """台账中的单元键：股票代码 + 复权方式"""
+    return f"{symbol}:{adjust or 'none'}"
+
+def init_worker(db_params: Dict):
+    """工作进程初始化：只创建一次 collector"""
+    global _worker_collector, _worker_ledger
+    _worker_collector = StockHistoryCollector(db_params)
+    _worker_ledger = JobLedger(db_params, _worker_collector.table_name)
+
+def process_stock(task: Tuple[str, str, str, str, str]) -> Tuple[str, str, int]:
+    """处理单只股票，由动态工作队列分发；返回 (symbol, 状态, 行数)"""
+    symbol, stock_start, end_date, adjust, job_start = task
     try:
-        collector = StockHistoryCollector(db_params)
-        total_stocks = len(stock_batch)
+        # 随机延时1-3秒，避免请求过于频繁
+        time.sleep(random.uniform(1, 3))
         
-        logger.info(f"Batch {batch_id}: Starting processing {total_stocks} stocks")
+        # 获取数据
+        df = fetch_stock_data(
+            symbol=symbol,
+            period="daily",
+            start_date=stock_start,
+            end_date=end_date,
+            adjust=adjust
+        )
         
-        success_count = 0
-        error_count = 0
+        if df is None or df.empty:
+            logger.warning(f"No history data available for {symbol}")
+            _worker_ledger.record(ledger_key(symbol, adjust), job_start, end_date)
+            return symbol, 'empty', 0
         
-        for idx, symbol in enumerate(stock_batch, 1):
-            try:
-                # 随机延时1-3秒，避免请求过于频繁
-                time.sleep(random.uniform(1, 3))
-                
-                # 如果是增量模式，获取最新数据日期
-                if mode == 'incremental':
-                    latest_date = collector.get_latest_trade_date(symbol, adjust)
-                    if latest_date:
-                        start_date = (latest_date + timedelta(days=1)).strftime('%Y%m%d')
-                
-                # 获取数据
-                df = fetch_stock_data(
-                    symbol=symbol,
-                    period="daily",
-                    start_date=start_date,
-                    end_date=end_date,
-                    adjust=adjust
-                )
-                
-                if df is not None and not df.empty:
-                    df = collector.process_data(df, symbol, adjust)
-                    collector.save_to_db(df)
-                    
-                    success_count += 1
-                    logger.info(f"Batch {batch_id} Progress: {idx}/{total_stocks} - Successfully processed {symbol}")
-                else:
-                    logger.warning(f"Batch {batch_id}: No history data available for {symbol}")
-                
-            except Exception as e:
-                error_count += 1
-                logger.error(f"Batch {batch_id}: Error processing {symbol}: {str(e)}")
-                continue
-                
-        logger.info(f"Batch {batch_id} completed. Success: {success_count}, Errors: {error_count}")
+        df = _worker_collector.process_data(df, symbol, adjust)
+        _worker_collector.save_to_db(df)
+        # 台账按本次任务的请求区间记账，续跑时同一任务能对上
+        _worker_ledger.record(ledger_key(symbol, adjust), job_start, end_date, df)
+        logger.info(f"Successfully processed {symbol} ({stock_start} ~ {end_date})")
+        return symbol, 'ok', len(df)
         
+    except CircuitOpenError as e:
+        # 上游熔断中，不占用重试时间，交回队列稍后再排
+        logger.warning(f"{symbol} 延后处理: {e}")
+        return symbol, 'deferred', 0
     except Exception as e:
-        logger.error(f"Batch {batch_id}: Fatal error in batch processing: {str(e)}")
+        logger.error(f"Error processing {symbol}: {str(e)}")
+        return symbol, 'error', 0
 
 class StockHistoryCollector:
     def __init__(self, db_params: dict):
@@ -145,7 +100,7 @@ class StockHistoryCollector:
         self.table_name = 'stock_history'
     
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def init_table(self):
         """初始化数据表"""
@@ -178,31 +133,20 @@ class StockHistoryCollector:
     def get_all_stocks(self) -> List[str]:
         """获取所有股票代码"""
         try:
-            df = ak.stock_info_a_code_name()
-            stock_list = [
-                code
-                for code in df['code'].tolist()
-                if str(code).startswith(('0', '3', '6'))
-            ]
+            stock_list = get_security_master(self.db_params).universe(fmt='symbol')
             logger.info(f"Successfully retrieved {len(stock_list)} stock codes")
             return stock_list
         except Exception as e:
             logger.error(f"Error getting stock list: {str(e)}")
             return []
 
-    def get_latest_trade_date(self, symbol: str, adjust: str) -> Optional[datetime]:
-        """获取最新交易日期"""
+    def load_watermarks(self, adjust: str) -> WatermarkStore:
+        """一次分组查询加载全部 (symbol, adjust_type) 的最新交易日期"""
+        store = WatermarkStore(self.table_name, key_columns=('symbol', 'adjust_type'))
         with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(f"""
-                    SELECT trade_date 
-                    FROM {self.table_name}
-                    WHERE symbol = %s AND adjust_type = %s
-                    ORDER BY trade_date DESC
-                    LIMIT 1
-                """, (symbol, adjust))
-                result = cur.fetchone()
-                return result[0] if result else None
+            store.load(conn, where='adjust_type = %s', params=(adjust,))
+        logger.info(f"已加载 {len(store)} 个水位")
+        return store
 
     def process_data(self, df: pd.DataFrame, symbol: str, adjust: str) -> pd.DataFrame:
         """处理数据"""
@@ -242,32 +186,19 @@ class StockHistoryCollector:
             return
             
         with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                columns = df.columns.tolist()
-                values = [tuple(x) for x in df.values]
-                
-                insert_stmt = f"""
-                    INSERT INTO {self.table_name} ({','.join(columns)})
-                    VALUES %s
-                    ON CONFLICT (symbol, trade_date, adjust_type)
-                    DO UPDATE SET
-                    {','.join(f"{col}=EXCLUDED.{col}" for col in columns 
-                             if col not in ['symbol', 'trade_date', 'adjust_type'])}
-                """
-                
-                try:
-                    execute_values(cur, insert_stmt, values)
-                    conn.commit()
-                    logger.info(f"成功保存 {len(df)} 条记录")
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"保存数据失败: {str(e)}")
-                    raise
+            try:
+                copy_upsert(conn, df, self.table_name, pk_columns=['symbol', 'trade_date', 'adjust_type'])
+                conn.commit()
+                logger.info(f"成功保存 {len(df)} 条记录")
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"保存数据失败: {str(e)}")
+                raise
 
     def parallel_data_collection(self, start_date: str, end_date: str, 
                                mode: str = 'incremental', adjust: str = '',
-                               num_processes: int = 10):
-        """并行数据采集"""
+                               num_processes: int = 10, resume: bool = False):
+        """并行数据采集；resume=True 时跳过任务台账中同一起始日、已完成到 end_date 的股票"""
         # 初始化数据表
         self.init_table()
         
@@ -285,31 +216,64 @@ class StockHistoryCollector:
         num_processes = min(num_processes, total_stocks)
         
         try:
-            # 将股票列表分成多个批次
-            stock_batches = chunks(stocks, num_processes)
+            # 增量模式：一次查询加载全部水位，在父进程里算好每只股票的起始日期
+            watermarks = self.load_watermarks(adjust) if mode == 'incremental' else None
+            
+            ledger = JobLedger(self.db_params, self.table_name)
+            ledger.init_table()
+            # 结束日默认是当天，按 (股票, 起始日) 续跑：已记账到本次结束日或更晚即跳过
+            covered = covered_until(ledger.load_completed()) if resume else {}
             
-            # 创建任务列表
             tasks = []
-            for i, batch in enumerate(stock_batches):
-                if batch:
-                    tasks.append((self.db_params, batch, i, start_date, end_date, mode, adjust))
+            for symbol in stocks:
+                if covered.get((ledger_key(symbol, adjust), start_date), '') >= end_date:
+                    continue
+                stock_start = start_date
+                if watermarks is not None:
+                    stock_start = watermarks.start_date_for((symbol, adjust), start_date)
+                if stock_start <= end_date:
+                    tasks.append((symbol, stock_start, end_date, adjust, start_date))
             
-            if not tasks:
-                logger.error("没有创建有效的任务")
-                return
-                
-            logger.info(f"创建了 {len(tasks)} 个任务批次")
+            logger.info(f"{total_stocks - len(tasks)} 只股票已是最新或已完成，{len(tasks)} 只待更新")
             
-            # 创建进程池
-            with multiprocessing.Pool(processes=num_processes) as pool:
-                pool.starmap(process_stock_batch, tasks)
+            # 按缺失天数降序：历史长的股票先开始，空闲进程随时从队列领取下一只
+            tasks = order_by_cost(tasks, cost=lambda t: missing_days(t[1], t[2]))
+            run_work_queue(process_stock, tasks, processes=num_processes,
+                           initializer=init_worker, initargs=(self.db_params,),
+                           label='stock_history')
                 
-            logger.info("所有批次处理完成")
+            logger.info("所有任务处理完成")
             
         except Exception as e:
             logger.error(f"并行数据采集出错: {str(e)}")
             raise
 
+    def daily_close_collection(self, start_date: str, num_processes: int = 10):
+        """
+        收盘快照模式：一次全市场快照写入当日不复权行情（adjust_type=''），
+        只对交易日历上还缺数据的股票逐只调用历史接口补缺口
+        """
+        self.init_table()
+        trade_date = snapshot_trade_date()
+        if trade_date is None:
+            return
+
+        spot = fetch_spot_snapshot()
+        bars = snapshot_to_bars(spot, trade_date)
+        # 先按写入快照前的水位找缺口，否则当天这根 K 线会把更早的缺口掩盖掉
+        watermarks = self.load_watermarks('')
+        gaps = gap_tasks(lambda symbol: watermarks.get((symbol, '')), bars['symbol'],
+                         trade_date, start_date)
+        self.save_to_db(bars)
+        logger.info(f"{trade_date} 收盘快照已写入 {len(bars)} 只股票，{len(gaps)} 只需要补缺口")
+
+        if gaps:
+            tasks = [(symbol, gap_start, gap_end, '', gap_start) for symbol, gap_start, gap_end in gaps]
+            tasks = order_by_cost(tasks, cost=lambda t: missing_days(t[1], t[2]))
+            run_work_queue(process_stock, tasks, processes=min(num_processes, len(tasks)),
+                           initializer=init_worker, initargs=(self.db_params,),
+                           label='stock_history_gaps')
+
 def main():
     parser = argparse.ArgumentParser(description='股票历史数据采集工具')
     parser.add_argument(
@@ -330,6 +294,16 @@ def main():
         default=10,
         help='并行进程数'
     )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='断点续跑：跳过任务台账中同一起始日、已完成到本次结束日或更晚的股票'
+    )
+    parser.add_argument(
+        '--daily-close',
+        action='store_true',
+        help='收盘快照模式：一次全市场快照写入当日不复权行情，只逐只补缺交易日的股票'
+    )
     parser.add_argument(
         '--start_date',
         type=str,
@@ -360,13 +334,19 @@ def main():
     
     try:
         collector = StockHistoryCollector(db_params)
+        if args.daily_close:
+            if args.adjust:
+                parser.error("收盘快照模式只写不复权行情，hfq 由 adjustment.materialize_hfq 生成")
+            collector.daily_close_collection(args.start_date, num_processes=args.processes)
+            return
         logger.info(f"开始{args.mode}模式的并行数据采集（使用 {args.processes} 个进程）...")
         collector.parallel_data_collection(
             start_date=args.start_date,
             end_date=args.end_date,
             mode=args.mode,
             adjust=args.adjust,
-            num_processes=args.processes
+            num_processes=args.processes,
+            resume=args.resume
         )
     except KeyboardInterrupt:
         logger.info("程序被用户中断")
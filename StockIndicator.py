@@ -2,6 +2,7 @@ import akshare as ak
 import pandas as pd
 from datetime import datetime
 import psycopg2
+from db_pool import pooled_connection
 from psycopg2.extras import execute_values
 import logging
 from typing import List, Optional, Dict
@@ -87,7 +88,7 @@ class StockIndicatorCollector:
         self.table_name = 'stock_indicator'
     
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def get_stock_list(self) -> List[str]:
         try:
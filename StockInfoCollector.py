@@ -1,6 +1,7 @@
 import akshare as ak
 import pandas as pd
 import psycopg2
+from db_pool import pooled_connection
 import time
 import logging
 from tqdm import tqdm
@@ -25,13 +26,13 @@ class StockInfoCollector:
         
     def get_db_connection(self):
         """获取数据库连接"""
-        return psycopg2.connect(
+        return pooled_connection(dict(
             host=self.db_host,
             port=self.db_port,
             user=self.db_user,
             password=self.db_password,
             dbname=self.db_name
-        )
+        ))
     
     def get_all_stock_codes(self):
         """从数据库获取所有股票代码"""
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+AIMD 自适应并发控制，用于 akshare 等没有明确配额的网页接口（乐咕、东方财富……）。
+
+- 加性增：成功请求的延迟稳定（不超过基线的 latency_tolerance 倍）且已完成一整轮（limit 个成功）时，并发上限 +1
+- 乘性减：遇到 429 / 超时 / 连接重置等限流信号时并发上限减半，并进入冷却期、按指数退避短暂暂停放行
+- 每个 endpoint 一个控制器，同时统计实际达到的请求速率，用 report() 输出
+
+    ctrl = get_controller('legu_indicator', max_limit=8)
+    df = ctrl.call(ak.stock_a_indicator_lg, symbol='000001')
+    ...
+    log_rate_report()
+
+线程池大小设为 max_limit 即可，真正同时在途的请求数由控制器决定。
+"""
+import json
+import logging
+import socket
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+_THROTTLE_STATUS = {429, 403, 503}
+_THROTTLE_TEXT = ('429', 'Too Many Requests', '访问频繁', 'Connection reset', 'timed out')
+
+
+def is_throttle_error(exc: BaseException) -> bool:
+    """是否为上游限流 / 过载信号（与代码错误、数据错误区分）"""
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code in _THROTTLE_STATUS
+    if isinstance(exc, (requests.Timeout, requests.ConnectionError, socket.timeout,
+                        ConnectionResetError, ConnectionAbortedError, TimeoutError)):
+        return True
+    # 乐咕/东财被限流时常返回空页或 HTML，akshare 解析时抛 JSONDecodeError
+    if isinstance(exc, json.JSONDecodeError):
+        return True
+    return any(text in str(exc) for text in _THROTTLE_TEXT)
+
+
+class AIMDController:
+    def __init__(self, name: str, initial: int = 2, min_limit: int = 1, max_limit: int = 8,
+                 decrease_factor: float = 0.5, latency_tolerance: float = 1.5,
+                 cooldown: float = 30.0, max_pause: float = 60.0, window: int = 50):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = max(min_limit, min(initial, max_limit))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.max_pause = max_pause
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._successes_since_change = 0
+        self._no_increase_until = 0.0
+        self._pause_until = 0.0
+        self._pause = 0.0
+        self._latencies = deque(maxlen=window)
+        self._baseline: Optional[float] = None
+
+        # 速率统计
+        self._started = time.time()
+        self._completed = deque()     # 最近完成时间戳，用于滑动窗口速率
+        self.counts = {'ok': 0, 'throttled': 0, 'error': 0}
+
+    # ---------- 放行 ----------
+    def acquire(self):
+        with self._cond:
+            while True:
+                now = time.time()
+                if now < self._pause_until:
+                    self._cond.wait(self._pause_until - now)
+                    continue
+                if self._in_flight < self.limit:
+                    self._in_flight += 1
+                    return
+                self._cond.wait(1.0)
+
+    def release(self, latency: float, outcome: str):
+        with self._cond:
+            self._in_flight -= 1
+            now = time.time()
+            self.counts[outcome] += 1
+            self._completed.append(now)
+            while self._completed and now - self._completed[0] > 60:
+                self._completed.popleft()
+
+            if outcome == 'ok':
+                self._on_success(latency, now)
+            elif outcome == 'throttled':
+                self._on_throttle(now)
+            self._cond.notify_all()
+
+    def _on_success(self, latency: float, now: float):
+        self._latencies.append(latency)
+        self._pause = 0.0
+        # 基线取近期延迟的下四分位，慢慢跟随上游的正常水平
+        if len(self._latencies) >= 5:
+            self._baseline = statistics.quantiles(self._latencies, n=4)[0]
+        self._successes_since_change += 1
+        stable = self._baseline is None or latency <= self._baseline * self.latency_tolerance
+        if (stable and now >= self._no_increase_until and self.limit < self.max_limit
+                and self._successes_since_change >= self.limit):
+            self.limit += 1
+            self._successes_since_change = 0
+            logger.info(f"[{self.name}] 延迟稳定，并发上限升至 {self.limit}")
+
+    def _on_throttle(self, now: float):
+        new_limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+        self._successes_since_change = 0
+        self._no_increase_until = now + self.cooldown
+        self._pause = min(self.max_pause, max(1.0, self._pause * 2))
+        self._pause_until = now + self._pause
+        if new_limit != self.limit:
+            logger.warning(f"[{self.name}] 检测到限流，并发上限 {self.limit} -> {new_limit}，暂停 {self._pause:.0f}s")
+        self.limit = new_limit
+
+    # ---------- 调用 ----------
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在控制器下执行一次请求；异常原样抛出"""
+        self.acquire()
+        started = time.time()
+        outcome = 'ok'
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            outcome = 'throttled' if is_throttle_error(e) else 'error'
+            raise
+        finally:
+            self.release(time.time() - started, outcome)
+
+    # ---------- 统计 ----------
+    def report(self) -> Dict[str, Any]:
+        with self._cond:
+            elapsed = max(time.time() - self._started, 1e-6)
+            total = sum(self.counts.values())
+            return {
+                'endpoint': self.name,
+                'limit': self.limit,
+                'requests': total,
+                **self.counts,
+                'avg_rps': total / elapsed,
+                'recent_rps': len(self._completed) / min(60.0, elapsed),
+                'p50_latency': statistics.median(self._latencies) if self._latencies else None,
+            }
+
+
+_lock = threading.Lock()
+_controllers: Dict[str, AIMDController] = {}
+
+
+def get_controller(name: str, **kwargs) -> AIMDController:
+    """按 endpoint 取进程内共享的控制器（首次创建时 kwargs 生效）"""
+    with _lock:
+        ctrl = _controllers.get(name)
+        if ctrl is None:
+            ctrl = AIMDController(name, **kwargs)
+            _controllers[name] = ctrl
+        return ctrl
+
+
+def log_rate_report():
+    """输出各 endpoint 实际达到的请求速率"""
+    for ctrl in list(_controllers.values()):
+        r = ctrl.report()
+        latency = f"{r['p50_latency']:.2f}s" if r['p50_latency'] is not None else '-'
+        logger.info(f"[{r['endpoint']}] 并发上限 {r['limit']}，请求 {r['requests']}（成功 {r['ok']}，"
+                    f"限流 {r['throttled']}，错误 {r['error']}），平均 {r['avg_rps']:.2f} req/s，"
+                    f"近60s {r['recent_rps']:.2f} req/s，延迟中位数 {latency}")
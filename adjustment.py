@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+复权计算层：stock_history 只需存不复权行情（adjust_type=''）和每日复权因子（adj_factor 表），
+前/后复权价格在本地计算，不再为 qfq / hfq 各下载一份全历史。
+
+    后复权 hfq = 不复权价 × adj_factor
+    前复权 qfq = 不复权价 × adj_factor / 最新 adj_factor
+
+- hfq 的历史值不会因为新的分红送转而改变，可以物化进 stock_history（materialize_hfq），
+  每次只需补新日期，现有按 adjust_type='hfq' 查询的下游无需改动
+- qfq 每次除权都会整段变化，只在读取时计算（load_adjusted_bars(..., how='qfq')）
+- 成交量、涨跌幅、振幅、换手率与复权无关，原样保留
+
+    with pooled_connection(db_params) as conn:
+        bars = load_adjusted_bars(conn, ['000001', '600000'], '2020-01-01', '2024-12-31', how='qfq')
+"""
+import logging
+from typing import Iterable, Optional, Sequence
+
+import pandas as pd
+
+from bulk_loader import copy_upsert
+
+logger = logging.getLogger(__name__)
+
+ADJ_FACTOR_TABLE = 'adj_factor'
+BARS_TABLE = 'stock_history'
+
+# 需要乘以复权因子的价格列（change 为价差，同样按比例缩放）
+PRICE_COLUMNS = ('open', 'close', 'high', 'low', 'change')
+BAR_COLUMNS = ['trade_date', 'symbol', 'open', 'close', 'high', 'low',
+               'volume', 'amount', 'amplitude', 'pct_change', 'change', 'turnover']
+
+
+def init_adj_factor_table(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ADJ_FACTOR_TABLE} (
+                symbol     VARCHAR(10),
+                trade_date DATE,
+                adj_factor FLOAT,
+                PRIMARY KEY (symbol, trade_date)
+            )
+        """)
+
+
+def normalize_adj_factor(df: pd.DataFrame) -> pd.DataFrame:
+    """tushare adj_factor 返回值 -> (symbol, trade_date, adj_factor)，只保留 0/3/6 开头的 A 股"""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=['symbol', 'trade_date', 'adj_factor'])
+    out = pd.DataFrame({
+        'symbol': df['ts_code'].str[:6],
+        'trade_date': pd.to_datetime(df['trade_date']).dt.date,
+        'adj_factor': pd.to_numeric(df['adj_factor'], errors='coerce'),
+    })
+    return out[out['symbol'].str.startswith(('0', '3', '6'))].dropna(subset=['adj_factor'])
+
+
+def save_adj_factors(conn, df: pd.DataFrame) -> int:
+    return copy_upsert(conn, df, ADJ_FACTOR_TABLE, pk_columns=['symbol', 'trade_date'])
+
+
+def load_adj_factors(conn, symbols: Optional[Sequence[str]], start_date, end_date) -> pd.DataFrame:
+    sql = f"SELECT symbol, trade_date, adj_factor FROM {ADJ_FACTOR_TABLE} WHERE trade_date BETWEEN %s AND %s"
+    params = [start_date, end_date]
+    if symbols is not None:
+        sql += " AND symbol = ANY(%s)"
+        params.append(list(symbols))
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        return pd.DataFrame(cur.fetchall(), columns=['symbol', 'trade_date', 'adj_factor'])
+
+
+def load_latest_factors(conn, symbols: Optional[Sequence[str]] = None) -> pd.Series:
+    """每只股票最新的复权因子（qfq 的基准），index 为 symbol"""
+    sql = f"""
+        SELECT DISTINCT ON (symbol) symbol, adj_factor
+        FROM {ADJ_FACTOR_TABLE}
+        {'WHERE symbol = ANY(%s)' if symbols is not None else ''}
+        ORDER BY symbol, trade_date DESC
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql, [list(symbols)] if symbols is not None else [])
+        rows = cur.fetchall()
+    return pd.Series({s: f for s, f in rows}, name='latest_factor', dtype=float)
+
+
+def adjust_prices(bars: pd.DataFrame, factors: pd.DataFrame, how: str,
+                  latest_factors: Optional[pd.Series] = None) -> pd.DataFrame:
+    """
+    向量化复权：bars 为不复权行情（含 symbol, trade_date），factors 为 (symbol, trade_date, adj_factor)
+    - 某日缺因子时沿用该股票前一个因子（停牌日等）
+    - how='qfq' 时以 latest_factors（缺省取 factors 中每只股票最后一个因子）为基准
+    """
+    if how not in ('', 'qfq', 'hfq'):
+        raise ValueError(f"未知的复权方式: {how}")
+    if bars.empty or how == '':
+        return bars.assign(adjust_type=how)
+
+    df = bars.merge(factors[['symbol', 'trade_date', 'adj_factor']],
+                    on=['symbol', 'trade_date'], how='left')
+    df = df.sort_values(['symbol', 'trade_date'])
+    df['adj_factor'] = df.groupby('symbol')['adj_factor'].ffill()
+
+    scale = df['adj_factor']
+    if how == 'qfq':
+        if latest_factors is None:
+            latest_factors = factors.sort_values('trade_date').groupby('symbol')['adj_factor'].last()
+        scale = scale / df['symbol'].map(latest_factors)
+
+    price_cols = [c for c in PRICE_COLUMNS if c in df.columns]
+    df[price_cols] = df[price_cols].mul(scale, axis=0)
+    missing = scale.isna().sum()
+    if missing:
+        logger.warning(f"{missing} 行缺少复权因子，价格置空")
+    return df.drop(columns=['adj_factor']).assign(adjust_type=how).reset_index(drop=True)
+
+
+def load_adjusted_bars(conn, symbols: Optional[Sequence[str]], start_date, end_date,
+                       how: str = 'qfq') -> pd.DataFrame:
+    """从不复权行情 + 复权因子读出复权后的 K 线"""
+    sql = f"""
+        SELECT {', '.join(BAR_COLUMNS)} FROM {BARS_TABLE}
+        WHERE adjust_type = '' AND trade_date BETWEEN %s AND %s
+    """
+    params = [start_date, end_date]
+    if symbols is not None:
+        sql += " AND symbol = ANY(%s)"
+        params.append(list(symbols))
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        bars = pd.DataFrame(cur.fetchall(), columns=BAR_COLUMNS)
+    if how == '' or bars.empty:
+        return bars.assign(adjust_type=how)
+
+    # 取窗口起点之前最后一个因子，保证窗口开头停牌时也能向前填充
+    factors = load_adj_factors(conn, symbols, pd.Timestamp(start_date) - pd.Timedelta(days=400), end_date)
+    latest = load_latest_factors(conn, symbols) if how == 'qfq' else None
+    return adjust_prices(bars, factors, how, latest_factors=latest)
+
+
+def materialize_hfq(conn, symbols: Optional[Iterable[str]], start_date) -> int:
+    """
+    用不复权行情 × 复权因子在库内生成 hfq 行（仅 start_date 之后），返回写入行数
+    hfq 历史不随新除权变化，增量时只需传本次新增的日期起点
+    某日缺因子时取该日之前最近的一个（与 adjust_prices 的向前填充一致），此前从无因子的行不生成
+    """
+    set_cols = ['open', 'close', 'high', 'low', 'volume', 'amount',
+                'amplitude', 'pct_change', 'change', 'turnover']
+    sql = f"""
+        INSERT INTO {BARS_TABLE} ({', '.join(BAR_COLUMNS)}, adjust_type)
+        SELECT h.trade_date, h.symbol,
+               h.open * f.adj_factor, h.close * f.adj_factor,
+               h.high * f.adj_factor, h.low * f.adj_factor,
+               h.volume, h.amount, h.amplitude, h.pct_change,
+               h.change * f.adj_factor, h.turnover, 'hfq'
+        FROM {BARS_TABLE} h
+        JOIN LATERAL (
+            SELECT a.adj_factor FROM {ADJ_FACTOR_TABLE} a
+            WHERE a.symbol = h.symbol AND a.trade_date <= h.trade_date
+            ORDER BY a.trade_date DESC
+            LIMIT 1
+        ) f ON TRUE
+        WHERE h.adjust_type = '' AND h.trade_date >= %s
+    """
+    params = [start_date]
+    if symbols is not None:
+        sql += " AND h.symbol = ANY(%s)"
+        params.append(list(symbols))
+    sql += f"""
+        ON CONFLICT (symbol, trade_date, adjust_type) DO UPDATE SET
+        {', '.join(f'{c} = EXCLUDED.{c}' for c in set_cols)}
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.rowcount
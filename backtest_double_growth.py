@@ -31,6 +31,7 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import os
 import sys
+from trade_calendar import get_calendar
 
 # 导入选股器（复用现有逻辑）
 from double_single_growth_selector import (
@@ -79,19 +80,8 @@ class DoubleGrowthBacktest:
 
     # --- 数据获取 ---
     def _get_trade_dates(self) -> pd.DatetimeIndex:
-        """获取回测区间内所有交易日（以上证指数/沪深300有数据的日期为准）"""
-        query = """
-        SELECT DISTINCT trade_date 
-        FROM index_daily 
-        WHERE ts_code = '000300.SH'
-          AND trade_date >= %s AND trade_date <= %s
-        ORDER BY trade_date
-        """
-        df = pd.read_sql_query(
-            query, self.selector.conn,
-            params=[self.start_date, self.end_date]
-        )
-        return pd.to_datetime(df['trade_date']).sort_values()
+        """获取回测区间内所有交易日（trade_cal 交易日历，进程内缓存）"""
+        return get_calendar(self.selector.conn).range(self.start_date, self.end_date)
 
     def _get_rebalance_dates(self, trade_dates: pd.DatetimeIndex) -> list:
         """每季度最后一个交易日作为调仓日"""
@@ -191,7 +181,7 @@ class DoubleGrowthBacktest:
             if i < len(rebalance_dates) - 1:
                 next_dt = rebalance_dates[i + 1]
             else:
-                next_dt = trade_dates.iloc[-1]
+                next_dt = trade_dates[-1]
             next_str = next_dt.strftime('%Y-%m-%d')
 
             # ---------- 3. 获取持仓期价格数据 ----------
@@ -1,6 +1,5 @@
-from sqlalchemy import create_engine, Column, String, Float, DateTime, Integer, text
+from sqlalchemy import create_engine, Column, String, Float, DateTime, Integer
 from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime
 import time
 import random
@@ -9,6 +8,10 @@ import pandas as pd
 from retrying import retry
 import logging
 import akshare as ak
+from refresh_planner import RefreshPlanner
+from security_master import get_security_master
+from bulk_loader import copy_upsert_changed
+from db_pool import pooled_connection
 import sys
 import argparse
 
@@ -61,19 +64,19 @@ class BalanceSheet(Base):
 
 class BalanceSheetCollector:
     def __init__(self, db_config: Dict):
+        self.db_config = db_config
         self.db_url = f"postgresql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
         self.engine = create_engine(self.db_url)
         
         self.Session = sessionmaker(bind=self.engine)
+        self.planner = RefreshPlanner(db_config, 'balance_sheet')
         
     @retry(stop_max_attempt_number=3, wait_random_min=2000, wait_random_max=5000)
     def fetch_balance_sheet_data(self, symbol: str) -> pd.DataFrame:
         """从东方财富获取资产负债表数据"""
         try:
             # 转换股票代码格式（如：600519.SH -> SH600519）
-            market = 'SH' if symbol.startswith('6') else 'SZ'
-            code = symbol.replace('.SH', '').replace('.SZ', '')
-            em_symbol = f"{market}{code}"
+            em_symbol = get_security_master(self.db_config).to_em_code(symbol).iloc[0]
             
             df = ak.stock_balance_sheet_by_report_em(symbol=em_symbol)
             logger.info(f"Successfully fetched balance sheet data for {symbol}")
@@ -126,172 +129,46 @@ class BalanceSheetCollector:
         return records
 
     def upsert_records(self, records: List[Dict]):
-        """使用upsert操作更新或插入记录"""
+        """使用upsert操作更新或插入记录；按内容哈希跳过与库中相同的报告期，update_time 只在数值变化时刷新"""
         if not records:
             return
-        
-        stmt = insert(BalanceSheet.__table__).values(records)
-        stmt = stmt.on_conflict_do_update(
-            index_elements=['symbol', 'report_date'],
-            set_={
-                col.name: col
-                for col in stmt.excluded
-                if col.name not in ['symbol', 'report_date']
-            }
-        )
-        
-        with self.Session() as session:
+
+        df = pd.DataFrame(records)
+        df['create_time'] = datetime.now()
+        content_columns = [c for c in df.columns
+                           if c not in ('symbol', 'report_date', 'create_time', 'update_time')]
+
+        with pooled_connection(self.db_config) as conn:
             try:
-                session.execute(stmt)
-                session.commit()
-                logger.info(f"Successfully upserted {len(records)} records")
+                stats = copy_upsert_changed(conn, df, BalanceSheet.__tablename__,
+                                            pk_columns=['symbol', 'report_date'],
+                                            update_columns=content_columns)
+                conn.commit()
+                logger.info(f"Upserted {len(records)} records: {stats.inserted} inserted, "
+                            f"{stats.updated} updated, {stats.unchanged} unchanged")
             except Exception as e:
-                session.rollback()
+                conn.rollback()
                 logger.error(f"Error upserting records: {str(e)}")
                 raise e
 
     def get_all_stocks(self) -> List[str]:
         """获取所有股票代码"""
         try:
-            df = ak.stock_info_a_code_name()
-            stock_list = [
-                f"{code}.{'SH' if str(code).startswith('6') else 'SZ'}"
-                for code in df['code'].tolist()
-                if str(code).startswith(('000', '001', '002', '003', '300', '600', '601', '603', '605'))
-            ]
+            stock_list = get_security_master(self.db_config).universe(boards=('main', 'chinext'))
             logger.info(f"Successfully retrieved {len(stock_list)} stock codes")
             return stock_list
         except Exception as e:
             logger.error(f"Error getting stock list: {str(e)}")
             return []
         
-    def get_7day_stocks(self) -> List[str]:
-        """从report_schedule表获取最近一周的股票代码"""
-        try:
-            with self.Session() as session:
-                # 构建查询语句
-                query = text("""
-                    SELECT DISTINCT stock_code || '.' || exchange as symbol
-                    FROM report_schedule 
-                    WHERE exchange IN ('SZ', 'SH')
-                    AND created_at >= CURRENT_DATE - INTERVAL '7 days'
-                    AND stock_code ~ '^[0-9]+$'  -- 确保股票代码只包含数字
-                    AND stock_code ~ '^(000|001|002|003|300|600|601|603|605)'  -- 确保是主板、创业板、科创板的股票
-                """)
-                
-                result = session.execute(query)
-                stock_list = [row[0] for row in result]
-                
-                logger.info(f"从report_schedule获取到 {len(stock_list)} 个最近一周的股票代码")
-                return stock_list
-                
-        except Exception as e:
-            logger.error(f"从report_schedule获取股票列表时出错: {str(e)}")
-            return [] 
-
-
     def get_stocks_to_update(self) -> List[str]:
-        """获取需要更新的股票代码"""
+        """按披露日历（report_schedule + 业绩预告/快报公告日）得出今天需要重新抓取的股票，按优先级排序"""
         try:
-            session = self.Session()
-            
-            # 获取当前日期
-            now = datetime.now()
-            current_year = now.year
-            current_month = now.month
-            
-            # 确定最新的财报期
-            # 一季报（4月底前）：去年年报 + 今年一季报
-            # 中报（8月底前）：今年一季报 + 今年中报
-            # 三季报（10月底前）：今年中报 + 今年三季报
-            # 年报（来年4月底前）：今年三季报 + 今年年报
-            if current_month <= 4:  # 1-4月
-                report_dates = [
-                    f"{current_year-1}-12-31",  # 去年年报
-                    f"{current_year}-03-31"     # 今年一季报
-                ]
-            elif current_month <= 8:  # 5-8月
-                report_dates = [
-                    f"{current_year}-03-31",    # 今年一季报
-                    f"{current_year}-06-30"     # 今年中报
-                ]
-            elif current_month <= 10:  # 9-10月
-                report_dates = [
-                    f"{current_year}-06-30",    # 今年中报
-                    f"{current_year}-09-30"     # 今年三季报
-                ]
-            else:  # 11-12月
-                report_dates = [
-                    f"{current_year}-09-30",    # 今年三季报
-                    f"{current_year}-12-31"     # 今年年报
-                ]
-                
-            # 获取所有应该存在的股票代码
-            all_stocks = set(self.get_all_stocks())
-            
-            # 获取数据库中最新两期财报都已更新的股票
-            query = text("""
-                WITH latest_updates AS (
-                    SELECT symbol, report_date, update_time,
-                        COUNT(*) OVER (PARTITION BY symbol) as report_count
-                    FROM balance_sheet
-                        WHERE report_date IN :report_dates
-                    )
-                    SELECT DISTINCT symbol
-                    FROM latest_updates
-                    WHERE report_count = 2
-                    AND update_time >= CURRENT_DATE - INTERVAL '7 days'
-                """)
-            
-            result = session.execute(query, {'report_dates': tuple(report_dates)})
-            updated_stocks = set(row[0] for row in result)
-            
-            # 需要更新的股票 = 所有股票 - 已更新的股票
-            stocks_to_update = list(all_stocks - updated_stocks)
-            
-            session.close()
-            
-            logger.info(f"当前检查的报告期: {report_dates}")
-            logger.info(f"需要更新的股票数量: {len(stocks_to_update)}")
-            logger.info(f"已更新的股票数量: {len(updated_stocks)}")
-            
-            return stocks_to_update
-                
+            return self.planner.stocks_to_update()
         except Exception as e:
-            logger.error(f"获取待更新股票时出错: {str(e)}")
+            logger.error(f"Error getting stocks to update: {str(e)}")
             return []
 
-    # def get_stocks_to_update(self) -> List[str]:
-    #     """获取需要更新的股票代码"""
-    #     try:
-    #         session = self.Session()
-            
-    #         # 获取当前季度的第一天
-    #         now = datetime.now()
-    #         current_quarter = (now.month - 1) // 3 + 1
-    #         quarter_start = datetime(now.year, (current_quarter - 1) * 3 + 1, 1)
-            
-    #         query = """
-    #             SELECT DISTINCT symbol 
-    #             FROM balance_sheet
-    #             WHERE update_time < :quarter_start 
-    #             OR symbol NOT IN (
-    #                 SELECT DISTINCT symbol 
-    #                 FROM balance_sheet
-    #             )
-    #         """
-            
-    #         result = session.execute(query, {'quarter_start': quarter_start})
-    #         stocks_to_update = [row[0] for row in result]
-            
-    #         session.close()
-    #         logger.info(f"Found {len(stocks_to_update)} stocks to update")
-    #         return stocks_to_update
-            
-    #     except Exception as e:
-    #         logger.error(f"Error getting stocks to update: {str(e)}")
-    #         return []
-    
     def initial_data_collection(self):
         """初始化数据收集"""
         stocks = self.get_all_stocks()
@@ -318,7 +195,7 @@ class BalanceSheetCollector:
 
     def incremental_update(self):
         """增量更新数据"""
-        stocks = self.get_7day_stocks()
+        stocks = self.get_stocks_to_update()
         total_stocks = len(stocks)
         
         logger.info(f"Starting incremental update for {total_stocks} stocks")
@@ -335,6 +212,8 @@ class BalanceSheetCollector:
                     logger.info(f"Progress: {idx}/{total_stocks} - Successfully updated {symbol}")
                 else:
                     logger.warning(f"No balance sheet data available for {symbol}")
+                # 记下本次检查时间，尚未披露的报告期按衰减间隔复查
+                self.planner.record_attempt(symbol)
                 
             except Exception as e:
                 logger.error(f"Error updating {symbol}: {str(e)}")
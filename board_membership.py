@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+板块成分股的拉链表（SCD2）存储：成分关系只在变化时写入，按有效区间 [valid_from, valid_to) 保存，
+行情单独放进按 (trade_date, 代码) 去重的紧凑表。
+
+    industry_board_membership(board_code, symbol, board_name, stock_name, valid_from, valid_to)
+    - valid_to 为空表示当前仍是成分股；valid_to 为首个不再属于该板块的日期（不含）
+    - 同一 (board_code, symbol) 可以有多段区间（调出后又调入）
+
+每次快照：
+1. 快照里有、当前没有打开区间的 -> 新开区间 valid_from = as_of
+2. 当前打开、但本次快照（仅限本次成功拉到的板块）里没有的 -> 关闭 valid_to = as_of
+其余行不动，日常运行只写几十行变化而不是几万行全量。
+
+查询（都走 (board_code, valid_from) / (symbol, valid_from) 索引，一条 SQL）：
+    members = members_as_of(conn, ['BK0475'], '2024-06-28')       # 某日的成分股
+    boards = boards_as_of(conn, ['000001', '600000'], '2024-06-28')  # 某日股票所属板块
+
+快照必须按日期顺序应用；历史快照表可用 migrate_snapshots 一次性转换。
+"""
+import io
+import logging
+from datetime import date
+from typing import Optional, Sequence, Tuple
+
+import pandas as pd
+
+from bulk_loader import copy_upsert
+
+logger = logging.getLogger(__name__)
+
+MEMBERSHIP_TABLE = 'industry_board_membership'
+QUOTES_TABLE = 'industry_member_quotes'
+
+MEMBERSHIP_COLUMNS = ['board_code', 'symbol', 'board_name', 'stock_name']
+QUOTE_COLUMNS = ['最新价', '涨跌幅', '涨跌额', '成交量', '成交额', '振幅', '最高', '最低',
+                 '今开', '昨收', '换手率', '市盈率_动态', '市净率']
+
+
+def init_membership_table(conn, table_name: str = MEMBERSHIP_TABLE):
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                board_code VARCHAR(100),
+                symbol     VARCHAR(20),
+                board_name VARCHAR(100),
+                stock_name VARCHAR(100),
+                valid_from DATE,
+                valid_to   DATE,
+                PRIMARY KEY (board_code, symbol, valid_from)
+            )
+        """)
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS {table_name}_board_asof_idx
+            ON {table_name} (board_code, valid_from, valid_to)
+        """)
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS {table_name}_symbol_asof_idx
+            ON {table_name} (symbol, valid_from, valid_to)
+        """)
+
+
+def init_quotes_table(conn, table_name: str = QUOTES_TABLE):
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                trade_date DATE,
+                代码 VARCHAR(20),
+                名称 VARCHAR(100),
+                最新价 DECIMAL(15,4),
+                涨跌幅 DECIMAL(10,4),
+                涨跌额 DECIMAL(15,4),
+                成交量 DECIMAL(20,2),
+                成交额 DECIMAL(20,2),
+                振幅 DECIMAL(10,4),
+                最高 DECIMAL(15,4),
+                最低 DECIMAL(15,4),
+                今开 DECIMAL(15,4),
+                昨收 DECIMAL(15,4),
+                换手率 DECIMAL(10,4),
+                市盈率_动态 DECIMAL(15,4),
+                市净率 DECIMAL(10,4),
+                update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (trade_date, 代码)
+            )
+        """)
+
+
+def _stage_snapshot(cur, snapshot: pd.DataFrame):
+    """快照写入会话级临时表 _stage_board_snapshot"""
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS _stage_board_snapshot (
+            board_code VARCHAR(100), symbol VARCHAR(20), board_name VARCHAR(100), stock_name VARCHAR(100)
+        )
+    """)
+    cur.execute("TRUNCATE _stage_board_snapshot")
+    buf = io.StringIO()
+    snapshot[MEMBERSHIP_COLUMNS].drop_duplicates(subset=['board_code', 'symbol']) \
+        .to_csv(buf, index=False, header=False, na_rep='\\N')
+    buf.seek(0)
+    cur.copy_expert(f"COPY _stage_board_snapshot ({','.join(MEMBERSHIP_COLUMNS)}) "
+                    f"FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
+
+
+def apply_snapshot(conn, snapshot: pd.DataFrame, as_of=None, table_name: str = MEMBERSHIP_TABLE,
+                   scope_column: str = 'board_code') -> Tuple[int, int]:
+    """
+    把一次成分股快照合并进拉链表，返回 (新开区间数, 关闭区间数)；不负责 commit
+    - snapshot 需含 board_code, symbol, board_name, stock_name
+    - 只对 snapshot 中出现的 scope_column 取值做关闭判断：按板块拉成分股时取 'board_code'
+      （拉取失败的板块不会被误判为成分股全部调出）；按股票拉所属板块时取 'symbol'
+    """
+    if scope_column not in ('board_code', 'symbol'):
+        raise ValueError(f"scope_column 只能是 board_code 或 symbol: {scope_column}")
+    if snapshot is None or snapshot.empty:
+        return 0, 0
+    as_of = pd.Timestamp(as_of if as_of is not None else date.today()).date()
+    scope = snapshot[scope_column].dropna().unique().tolist()
+
+    with conn.cursor() as cur:
+        _stage_snapshot(cur, snapshot)
+        cur.execute(f"""
+            UPDATE {table_name} m SET valid_to = %s
+            WHERE m.valid_to IS NULL AND m.{scope_column} = ANY(%s) AND m.valid_from <= %s
+              AND NOT EXISTS (
+                  SELECT 1 FROM _stage_board_snapshot s
+                  WHERE s.board_code = m.board_code AND s.symbol = m.symbol)
+        """, (as_of, scope, as_of))
+        closed = cur.rowcount
+        # 同一天调入又调出的空区间没有意义
+        cur.execute(f"DELETE FROM {table_name} WHERE valid_to = valid_from AND {scope_column} = ANY(%s)",
+                    (scope,))
+
+        cur.execute(f"""
+            INSERT INTO {table_name} (board_code, symbol, board_name, stock_name, valid_from, valid_to)
+            SELECT s.board_code, s.symbol, s.board_name, s.stock_name, %s, NULL
+            FROM _stage_board_snapshot s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {table_name} m
+                WHERE m.board_code = s.board_code AND m.symbol = s.symbol AND m.valid_to IS NULL)
+            ON CONFLICT (board_code, symbol, valid_from) DO UPDATE SET
+                valid_to = NULL, board_name = EXCLUDED.board_name, stock_name = EXCLUDED.stock_name
+        """, (as_of,))
+        opened = cur.rowcount
+
+    logger.info(f"{table_name}: {as_of} 快照 {len(scope)} 个 {scope_column} / {len(snapshot)} 行，"
+                f"新增成分 {opened}，调出 {closed}")
+    return opened, closed
+
+
+def save_quotes(conn, df: pd.DataFrame, as_of=None, table_name: str = QUOTES_TABLE) -> int:
+    """成分股行情按 (trade_date, 代码) upsert，同一天多次快照只保留最后一次；不负责 commit"""
+    if df is None or df.empty:
+        return 0
+    trade_date = pd.Timestamp(as_of if as_of is not None else date.today()).date()
+    cols = ['代码', '名称'] + [c for c in QUOTE_COLUMNS if c in df.columns]
+    quotes = df[cols].drop_duplicates(subset=['代码'], keep='last').assign(trade_date=trade_date)
+    return copy_upsert(conn, quotes, table_name, pk_columns=['trade_date', '代码'],
+                       touch_update_time=True)
+
+
+def _as_of_frame(cur) -> pd.DataFrame:
+    names = [d[0] for d in cur.description]
+    return pd.DataFrame(cur.fetchall(), columns=names)
+
+
+def members_as_of(conn, board_codes: Optional[Sequence[str]], as_of,
+                  table_name: str = MEMBERSHIP_TABLE) -> pd.DataFrame:
+    """as_of 当天各板块的成分股（board_codes 为空时返回全部板块）"""
+    sql = f"""
+        SELECT board_code, board_name, symbol, stock_name, valid_from, valid_to
+        FROM {table_name}
+        WHERE valid_from <= %s AND (valid_to IS NULL OR valid_to > %s)
+    """
+    day = pd.Timestamp(as_of).date()
+    params = [day, day]
+    if board_codes is not None:
+        sql += " AND board_code = ANY(%s)"
+        params.append(list(board_codes))
+    with conn.cursor() as cur:
+        cur.execute(sql + " ORDER BY board_code, symbol", params)
+        return _as_of_frame(cur)
+
+
+def boards_as_of(conn, symbols: Sequence[str], as_of,
+                 table_name: str = MEMBERSHIP_TABLE) -> pd.DataFrame:
+    """as_of 当天每只股票所属的板块"""
+    day = pd.Timestamp(as_of).date()
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT symbol, board_code, board_name
+            FROM {table_name}
+            WHERE symbol = ANY(%s) AND valid_from <= %s AND (valid_to IS NULL OR valid_to > %s)
+            ORDER BY symbol, board_code
+        """, (list(symbols), day, day))
+        return _as_of_frame(cur)
+
+
+def migrate_snapshots(conn, snapshot_table: str = 'industry_board_members',
+                      table_name: str = MEMBERSHIP_TABLE) -> int:
+    """
+    由旧的全量快照表（update_time, 板块代码, 代码, ...）一次性生成拉链表，返回写入区间数；不负责 commit
+    每个板块以“被观测到的快照日”为时间轴，成分股连续出现的一段快照日合并为一个区间，
+    valid_to 取该段之后板块的下一个快照日；最后一段延续到最新快照的保持打开
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            WITH obs AS (
+                SELECT DISTINCT 板块代码 AS board_code, update_time::date AS d FROM {snapshot_table}
+            ), obs_rank AS (
+                SELECT board_code, d, ROW_NUMBER() OVER (PARTITION BY board_code ORDER BY d) AS rn
+                FROM obs
+            ), seen AS (
+                SELECT DISTINCT 板块代码 AS board_code, 代码 AS symbol, update_time::date AS d
+                FROM {snapshot_table}
+            ), islands AS (
+                SELECT s.board_code, s.symbol, s.d, r.rn,
+                       r.rn - ROW_NUMBER() OVER (PARTITION BY s.board_code, s.symbol ORDER BY s.d) AS grp
+                FROM seen s JOIN obs_rank r USING (board_code, d)
+            ), spans AS (
+                SELECT board_code, symbol, MIN(d) AS valid_from, MAX(rn) AS last_rn
+                FROM islands GROUP BY board_code, symbol, grp
+            ), names AS (
+                SELECT DISTINCT ON (板块代码, 代码) 板块代码 AS board_code, 代码 AS symbol,
+                       板块名称 AS board_name, 名称 AS stock_name
+                FROM {snapshot_table}
+                ORDER BY 板块代码, 代码, update_time DESC
+            )
+            INSERT INTO {table_name} (board_code, symbol, board_name, stock_name, valid_from, valid_to)
+            SELECT sp.board_code, sp.symbol, n.board_name, n.stock_name, sp.valid_from, nx.d
+            FROM spans sp
+            JOIN names n USING (board_code, symbol)
+            LEFT JOIN obs_rank nx ON nx.board_code = sp.board_code AND nx.rn = sp.last_rn + 1
+            ON CONFLICT (board_code, symbol, valid_from) DO UPDATE SET valid_to = EXCLUDED.valid_to
+        """)
+        written = cur.rowcount
+    logger.info(f"{snapshot_table} -> {table_name}: 生成 {written} 个成分区间")
+    return written
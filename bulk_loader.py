@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+基于 COPY 的批量入库工具，供各采集器的 save_to_db 共用。
+
+流程：
+1. DataFrame 按主键去重后序列化为 CSV，经 COPY ... FROM STDIN 流式写入会话级临时暂存表
+   （临时表不写 WAL，等价于 UNLOGGED；同一连接上复用，每批前 TRUNCATE）
+2. 一条 INSERT ... SELECT ... ON CONFLICT DO UPDATE 把暂存表合并进目标表
+
+相比 [tuple(x) for x in df.values] + execute_values，省掉逐行构造 Python 元组和 SQL 文本的开销。
+
+用法：
+    with pooled_connection(db_params) as conn:
+        copy_upsert(conn, df, 'daily_basic', pk_columns=['ts_code', 'trade_date'])
+        conn.commit()
+
+内容哈希跳过未变化的行（skip_unchanged=True）：
+    目标表自动加一列 row_hash，合并时对更新列算 md5(ROW(...)::text)（在暂存表里按目标表类型算，
+    1.5 / 1.50 这类写法差异不影响哈希），只有哈希变化的行才 UPDATE、才刷新 update_time；
+    全量重抓时未变化的行不产生新行版本（无 WAL、无表膨胀），update_time 可以继续用于增量判断。
+    同一张表的其他写入路径不带 skip_unchanged 时，冲突更新会把 row_hash 置空，下次哈希写入按“已变化”处理。
+    stats = copy_upsert_changed(conn, df, 'profit_sheet', pk_columns=['symbol', 'report_date'])
+    stats.inserted, stats.updated, stats.unchanged
+"""
+import io
+import logging
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from schema_registry import ensure_columns, get_columns, refresh_columns
+
+logger = logging.getLogger(__name__)
+
+_NULL = '\\N'
+_INTEGER_TYPES = {'smallint', 'integer', 'bigint'}
+
+HASH_COLUMN = 'row_hash'
+# 不参与内容哈希的列：时间戳每次都变，算进去就等于不跳过
+_HASH_EXCLUDE = {HASH_COLUMN, 'update_time', 'create_time', 'created_at', 'updated_at'}
+
+# (dsn, 后端 pid, 表名) -> 建暂存表时目标表的列集合；目标表加列后据此重建暂存表
+_STAGE_COLUMNS: Dict[tuple, frozenset] = {}
+
+
+def _stage_table(table_name: str) -> str:
+    return f"_stage_{table_name}"
+
+
+def _to_csv_buffer(df: pd.DataFrame, column_types: Dict[str, str]) -> io.StringIO:
+    df = df.replace([np.inf, -np.inf], np.nan)
+    for col in df.columns:
+        # 整型列：tushare 的 vol 等常为浮点，COPY 不做隐式取整
+        if column_types.get(col) in _INTEGER_TYPES and not pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors='coerce').round().astype('Int64')
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False, na_rep=_NULL)
+    buf.seek(0)
+    return buf
+
+
+class UpsertStats(NamedTuple):
+    inserted: int
+    updated: int
+    unchanged: int
+
+    @property
+    def written(self) -> int:
+        return self.inserted + self.updated
+
+
+def copy_upsert(conn, df: pd.DataFrame, table_name: str, pk_columns: Sequence[str],
+                update_columns: Optional[List[str]] = None,
+                touch_update_time: bool = False, skip_unchanged: bool = False) -> int:
+    """
+    COPY 到暂存表后合并进 table_name，返回写入行数；不负责 commit，由调用方控制事务
+    - pk_columns: ON CONFLICT 主键
+    - update_columns: 冲突时更新的列，缺省为除主键外的全部列
+    - touch_update_time: 冲突更新时同时刷新 update_time = CURRENT_TIMESTAMP
+    - skip_unchanged: 按内容哈希跳过与库中完全相同的行，返回值只计新增和实际更新的行
+    """
+    return _merge(conn, df, table_name, pk_columns, update_columns,
+                  touch_update_time, skip_unchanged).written
+
+
+def copy_upsert_changed(conn, df: pd.DataFrame, table_name: str, pk_columns: Sequence[str],
+                        update_columns: Optional[List[str]] = None,
+                        touch_update_time: bool = True) -> UpsertStats:
+    """copy_upsert(skip_unchanged=True)，返回本批新增 / 更新 / 未变化行数"""
+    return _merge(conn, df, table_name, pk_columns, update_columns, touch_update_time, True)
+
+
+def _merge(conn, df: pd.DataFrame, table_name: str, pk_columns: Sequence[str],
+           update_columns: Optional[List[str]], touch_update_time: bool,
+           skip_unchanged: bool) -> UpsertStats:
+    if df is None or df.empty:
+        return UpsertStats(0, 0, 0)
+
+    start = time.time()
+    pk_columns = list(pk_columns)
+    df = df.drop_duplicates(subset=pk_columns, keep='last')
+    if skip_unchanged and HASH_COLUMN in df.columns:
+        df = df.drop(columns=[HASH_COLUMN])
+    columns = df.columns.tolist()
+    if update_columns is None:
+        update_columns = [c for c in columns if c not in pk_columns]
+
+    stage = _stage_table(table_name)
+    col_list = ','.join(columns)
+    if skip_unchanged:
+        # 先于暂存表创建：暂存表 LIKE 目标表，需要带上 row_hash 列
+        ensure_columns(conn, table_name, {HASH_COLUMN: 'CHAR(32)'})
+    column_types = get_columns(conn, table_name)
+    if not set(columns) <= set(column_types):
+        # 目标表被外部加过列：刷新列缓存
+        column_types = refresh_columns(conn, table_name)
+    stage_key = (conn.dsn, conn.get_backend_pid(), table_name)
+    stage_columns = frozenset(column_types)
+
+    with conn.cursor() as cur:
+        if _STAGE_COLUMNS.get(stage_key) != stage_columns:
+            cur.execute(f"DROP TABLE IF EXISTS {stage}")
+            _STAGE_COLUMNS[stage_key] = stage_columns
+        cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {table_name} INCLUDING DEFAULTS)")
+        cur.execute(f"TRUNCATE {stage}")
+        cur.copy_expert(
+            f"COPY {stage} ({col_list}) FROM STDIN WITH (FORMAT csv, NULL '{_NULL}')",
+            _to_csv_buffer(df, column_types)
+        )
+
+        set_parts = [f"{c}=EXCLUDED.{c}" for c in update_columns]
+        if touch_update_time and 'update_time' in column_types and 'update_time' not in update_columns:
+            set_parts.append("update_time=CURRENT_TIMESTAMP")
+        insert_cols, select_cols, where = col_list, col_list, ''
+        if skip_unchanged:
+            hash_columns = [c for c in update_columns if c not in _HASH_EXCLUDE]
+            row_hash = f"md5(ROW({','.join(hash_columns) or 'NULL'})::text)"
+            insert_cols += f",{HASH_COLUMN}"
+            select_cols += f",{row_hash}"
+            set_parts.append(f"{HASH_COLUMN}=EXCLUDED.{HASH_COLUMN}")
+            where = f" WHERE {table_name}.{HASH_COLUMN} IS DISTINCT FROM EXCLUDED.{HASH_COLUMN}"
+        elif set_parts and HASH_COLUMN in column_types and HASH_COLUMN not in columns:
+            # 表由其他路径维护了 row_hash：不算哈希的覆盖写入要清掉它，否则旧哈希对应旧内容，
+            # 之后内容与旧值相同的写入会被误判为未变化而跳过
+            set_parts.append(f"{HASH_COLUMN}=NULL")
+        if set_parts:
+            conflict = f"DO UPDATE SET {','.join(set_parts)}{where}"
+        else:
+            conflict = "DO NOTHING"
+        # xmax = 0 的是新插入的行，其余为冲突更新；被 WHERE 跳过的行不出现在 RETURNING 里
+        cur.execute(f"""
+            WITH merged AS (
+                INSERT INTO {table_name} ({insert_cols})
+                SELECT {select_cols} FROM {stage}
+                ON CONFLICT ({','.join(pk_columns)}) {conflict}
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM merged
+        """)
+        inserted, updated = cur.fetchone()
+
+    stats = UpsertStats(inserted, updated, len(df) - inserted - updated)
+    elapsed = max(time.time() - start, 1e-6)
+    logger.info(f"{table_name}: COPY 合并 {len(df)} 行（新增 {stats.inserted}，更新 {stats.updated}，"
+                f"未变化 {stats.unchanged}），{elapsed:.2f}s，{len(df) / elapsed:,.0f} rows/s")
+    return stats
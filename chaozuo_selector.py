@@ -15,14 +15,14 @@
 import pandas as pd
 import numpy as np
 import psycopg2
-import pywencai
+from db_pool import acquire_connection, release_connection
+from concept_store import get_concept_store
 from psycopg2.extras import RealDictCursor
 from datetime import datetime, timedelta
 from dataclasses import dataclass
 from typing import List, Optional, Dict, Tuple, Set, Union
 import yaml
 import logging
-import re
 import argparse
 import json
 
@@ -42,7 +42,7 @@ logger = logging.getLogger(__name__)
 @dataclass
 class SelectionCriteria:
     """选股条件配置"""
-    # 概念板块筛选（问财查询，支持单个或多个概念）
+    # 概念板块筛选（本地概念库，支持单个或多个概念）
     # 单概念: concept_sectors="煤炭"
     # 多概念: concept_sectors=["煤炭", "煤化工", "煤电"]
     concept_sectors: Optional[Union[str, List[str]]] = None  # None表示不限制
@@ -199,18 +199,20 @@ class ChaoZuoSelector:
         
     def connect(self):
         """连接数据库"""
-        self.conn = psycopg2.connect(**self.db_config)
+        self.conn = acquire_connection(self.db_config)
         logger.info("数据库连接成功")
         
     def disconnect(self):
         """断开连接"""
         if self.conn:
-            self.conn.close()
+            release_connection(self.db_config, self.conn)
+            self.conn = None
             logger.info("数据库连接已关闭")
     
     def get_concept_sector_stocks(self, concept_names: Union[str, List[str]]) -> Set[str]:
         """
-        使用问财获取概念板块的股票列表（支持单个或多个概念）
+        从本地概念成分库获取概念板块的股票列表（支持单个或多个概念）
+        概念名精确匹配优先，没有精确匹配时取名称包含该关键词的全部概念
         
         Args:
             concept_names: 概念板块名称，如 "煤炭" 或 ["煤炭", "煤化工", "煤电"]
@@ -224,51 +226,17 @@ class ChaoZuoSelector:
         else:
             concept_list = concept_names
         
+        index = get_concept_store(self.db_config).index()
         all_stocks = set()
         
         for concept_name in concept_list:
-            logger.info(f"使用问财获取【{concept_name}】概念板块股票...")
-            
-            try:
-                # 使用问财查询概念板块
-                res = pywencai.get(query=concept_name, sort_key='', sort_order='asc')
-                
-                if res is None or res.empty:
-                    logger.warning(f"问财返回空数据，概念【{concept_name}】可能没有结果")
-                    continue
-                
-                # 提取股票代码
-                stock_codes = set()
-                
-                # 问财返回的列可能包含 'code', '股票代码', 'ts_code' 等
-                code_col = None
-                for col in ['code', '股票代码', 'ts_code', 'symbol']:
-                    if col in res.columns:
-                        code_col = col
-                        break
-                
-                if code_col is None:
-                    logger.warning(f"无法找到股票代码列，可用列: {list(res.columns)}")
-                    continue
-                
-                for code in res[code_col]:
-                    if pd.isna(code):
-                        continue
-                    # 统一转换为6位数字格式
-                    code_str = str(code).strip()
-                    # 处理带后缀的格式（如 000001.SZ）
-                    if '.' in code_str:
-                        code_str = code_str.split('.')[0]
-                    # 只保留6位数字
-                    if re.match(r'^\d{6}$', code_str):
-                        stock_codes.add(code_str)
-                
-                logger.info(f"问财返回【{concept_name}】概念板块共 {len(stock_codes)} 只股票")
-                all_stocks.update(stock_codes)
-                
-            except Exception as e:
-                logger.error(f"问财查询【{concept_name}】失败: {e}")
+            matched = index.match_concepts(concept_name)
+            if not matched:
+                logger.warning(f"概念库中没有【{concept_name}】相关概念")
                 continue
+            stock_codes = index.symbols_for(matched)
+            logger.info(f"概念【{concept_name}】匹配 {matched}，共 {len(stock_codes)} 只股票")
+            all_stocks.update(stock_codes)
         
         logger.info(f"所有概念板块合并后共 {len(all_stocks)} 只独特股票")
         return all_stocks
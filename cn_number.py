@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+中文财务数值解析：把同花顺 / 新浪财务指标接口返回的字符串整列转换为浮点数，入库前统一调用。
+
+    parse_cn_number(pd.Series(['12.3亿', '45.6%', '--', '-1,234.5万', '0.52元', None]))
+    # -> [1.23e9, 45.6, NaN, -12345000.0, 0.52, NaN]
+
+    df = parse_numeric_columns(df, exclude=['symbol', 'report_date'])
+
+规则：
+- 单位后缀换算为基本单位：万亿 1e12、亿 1e8、万 1e4、千 1e3
+- 百分数保留百分点数值（'45.6%' -> 45.6），与库中 *_ratio / *(%) 类字段的口径一致
+- 结尾的 元 / 倍 / 次 / 天 / 股 等量纲字样直接去掉；千分位逗号去掉
+- '--'、'-'、''、'None'、'False' 等占位符以及无法解析的值为 NaN
+整列用正则一次提取数值和单位，不逐行调用 Python 函数。
+"""
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+UNIT_MULTIPLIERS = {'万亿': 1e12, '亿': 1e8, '万': 1e4, '千': 1e3, '%': 1.0}
+PLACEHOLDERS = frozenset({'', '-', '--', '---', '—', '——', 'None', 'nan', 'NaN', 'NULL', 'null', 'False'})
+
+_NUMBER_PATTERN = (r'^([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)\s*'
+                   r'(万亿|亿|万|千|%)?\s*(?:元|倍|次|天|股|个)?$')
+
+
+def parse_cn_number(values) -> pd.Series:
+    """一列中文数值字符串 -> float64 Series（保留原索引）"""
+    s = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.astype('float64')
+    text = (s.astype(str).str.strip()
+            .str.replace(',', '', regex=False)
+            .str.replace('，', '', regex=False))
+    parts = text.str.extract(_NUMBER_PATTERN)
+    number = pd.to_numeric(parts[0], errors='coerce')
+    multiplier = parts[1].map(UNIT_MULTIPLIERS).fillna(1.0)
+    result = (number * multiplier).astype('float64')
+    return result.replace([np.inf, -np.inf], np.nan)
+
+
+def unparsed_count(raw: pd.Series, parsed: pd.Series) -> int:
+    """有实际内容（非空、非占位符）却解析为 NaN 的个数，迁移时用于核对"""
+    text = raw.astype(str).str.strip()
+    return int((raw.notna() & ~text.isin(PLACEHOLDERS) & parsed.isna()).sum())
+
+
+def parse_numeric_columns(df: pd.DataFrame, columns: Optional[Iterable[str]] = None,
+                          exclude: Iterable[str] = ()) -> pd.DataFrame:
+    """对 columns（缺省为除 exclude 外的全部列）逐列调用 parse_cn_number，返回新 DataFrame"""
+    exclude = set(exclude)
+    columns = [c for c in (df.columns if columns is None else columns) if c not in exclude]
+    out = df.copy()
+    for col in columns:
+        out[col] = parse_cn_number(out[col])
+    return out
@@ -27,6 +27,9 @@ import psycopg2
 import os
 import logging
 from dotenv import load_dotenv
+from data_lake import lake_available, load_panel
+from security_master import get_security_master
+from trade_calendar import get_calendar
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -57,33 +60,29 @@ def get_coal_symbols(conn) -> pd.DataFrame:
 
 
 def get_trade_dates(conn, start_date: str, end_date: str) -> pd.DatetimeIndex:
-    """获取交易日序列"""
-    query = """
-    SELECT DISTINCT trade_date
-    FROM index_daily
-    WHERE ts_code = '000300.SH'
-      AND trade_date >= %s AND trade_date <= %s
-    ORDER BY trade_date
-    """
-    df = pd.read_sql_query(query, conn, params=[start_date, end_date])
-    return pd.to_datetime(df['trade_date']).sort_values()
+    """获取交易日序列（trade_cal 交易日历只加载一次，之后内存切片）"""
+    return get_calendar(conn).range(start_date, end_date)
 
 
 def get_stock_prices(conn, symbols: list, start_date: str, end_date: str) -> pd.DataFrame:
-    """获取成分股后复权收盘价（停牌日ffill）"""
+    """获取成分股后复权收盘价（停牌日ffill）；本地 parquet 镜像覆盖到 end_date 时读镜像"""
     if not symbols:
         return pd.DataFrame()
-    placeholders = ','.join(['%s'] * len(symbols))
-    query = f"""
-    SELECT trade_date, symbol, close
-    FROM stock_history
-    WHERE symbol IN ({placeholders})
-      AND trade_date >= %s AND trade_date <= %s
-      AND adjust_type = 'hfq'
-    """
-    df = pd.read_sql_query(query, conn, params=[*symbols, start_date, end_date])
-    df['trade_date'] = pd.to_datetime(df['trade_date'])
-    df = df.pivot(index='trade_date', columns='symbol', values='close').sort_index()
+    if lake_available('stock_history', end=end_date, split='hfq'):
+        df = load_panel('stock_history', 'close', start_date, end_date, symbols=symbols, split='hfq')
+        df.index = pd.to_datetime(df.index)
+    else:
+        placeholders = ','.join(['%s'] * len(symbols))
+        query = f"""
+        SELECT trade_date, symbol, close
+        FROM stock_history
+        WHERE symbol IN ({placeholders})
+          AND trade_date >= %s AND trade_date <= %s
+          AND adjust_type = 'hfq'
+        """
+        df = pd.read_sql_query(query, conn, params=[*symbols, start_date, end_date])
+        df['trade_date'] = pd.to_datetime(df['trade_date'])
+        df = df.pivot(index='trade_date', columns='symbol', values='close').sort_index()
     # 停牌日ffill
     trade_dates = get_trade_dates(conn, start_date, end_date)
     df = df.reindex(trade_dates)
@@ -92,20 +91,27 @@ def get_stock_prices(conn, symbols: list, start_date: str, end_date: str) -> pd.
 
 
 def get_circ_mv(conn, symbols: list, start_date: str, end_date: str) -> pd.DataFrame:
-    """获取每日流通市值（亿元）用于市值加权"""
+    """获取每日流通市值（亿元）用于市值加权；本地 parquet 镜像覆盖到 end_date 时读镜像"""
     if not symbols:
         return pd.DataFrame()
-    placeholders = ','.join(['%s'] * len(symbols))
-    # daily_basic 的 circ_mv 单位是万元，转为亿元
-    query = f"""
-    SELECT trade_date, LEFT(ts_code, 6) as symbol, circ_mv / 10000.0 as circ_mv
-    FROM daily_basic
-    WHERE LEFT(ts_code, 6) IN ({placeholders})
-      AND trade_date >= %s AND trade_date <= %s
-    """
-    df = pd.read_sql_query(query, conn, params=[*symbols, start_date, end_date])
-    df['trade_date'] = pd.to_datetime(df['trade_date'])
-    df = df.pivot(index='trade_date', columns='symbol', values='circ_mv').sort_index()
+    if lake_available('daily_basic', end=end_date):
+        # daily_basic 按 ts_code 存储，circ_mv 单位是万元，转为亿元
+        ts_codes = get_security_master().to_ts_code(symbols).tolist()
+        df = load_panel('daily_basic', 'circ_mv', start_date, end_date, symbols=ts_codes) / 10000.0
+        df.columns = [c[:6] for c in df.columns]
+        df.index = pd.to_datetime(df.index)
+    else:
+        placeholders = ','.join(['%s'] * len(symbols))
+        # daily_basic 的 circ_mv 单位是万元，转为亿元
+        query = f"""
+        SELECT trade_date, LEFT(ts_code, 6) as symbol, circ_mv / 10000.0 as circ_mv
+        FROM daily_basic
+        WHERE LEFT(ts_code, 6) IN ({placeholders})
+          AND trade_date >= %s AND trade_date <= %s
+        """
+        df = pd.read_sql_query(query, conn, params=[*symbols, start_date, end_date])
+        df['trade_date'] = pd.to_datetime(df['trade_date'])
+        df = df.pivot(index='trade_date', columns='symbol', values='circ_mv').sort_index()
     # 停牌日用前一天市值填充
     trade_dates = get_trade_dates(conn, start_date, end_date)
     df = df.reindex(trade_dates)
@@ -248,7 +254,8 @@ def main():
 
     # 3. 获取交易日和调仓日
     trade_dates = get_trade_dates(conn, BASE_DATE, end_date)
-    rebalance_dates = trade_dates[pd.DatetimeIndex(trade_dates).is_quarter_end]
+    # 每季度最后一个交易日（自然季末常落在周末，不能用 is_quarter_end）
+    rebalance_dates = get_calendar(conn).quarter_ends(BASE_DATE, end_date)
     logger.info(f"交易日数量: {len(trade_dates)}, 调仓日数量: {len(rebalance_dates)}")
 
     # 4. 获取价格数据
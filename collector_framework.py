@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+通用流水线采集框架：fetch -> transform -> load 三段通过有界队列衔接，I/O 与入库重叠进行。
+
+    keys ──> [fetcher × N] ──raw_q──> [transformer] ──write_q──> [writer]
+              逐个 key 拉数据         合并多只股票后一次       一次 COPY 合并写入
+                                      向量化清洗               并推进水位
+
+每个数据集只需声明一个 DatasetConfig：
+    config = DatasetConfig(
+        name='daily_basic',
+        table_name='daily_basic',
+        pk_columns=['ts_code', 'trade_date'],
+        fetch=collector.fetch_data,          # (key, start_date, end_date) -> DataFrame
+        transform=collector.process_data,    # DataFrame -> DataFrame，作用于合并后的整批
+    )
+    PipelineCollector(config, db_params).run(keys, start_date, end_date, mode='incremental')
+
+所有线程在同一进程内运行，限频由 python_fetch 的共享令牌桶负责。
+上游熔断（resilience.CircuitOpenError）时 key 不计失败，整轮结束后等待冷却再补拉，最多 DEFER_ROUNDS 轮。
+"""
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+from bulk_loader import copy_upsert
+from db_pool import pooled_connection
+from resilience import CircuitOpenError
+from watermark import WatermarkStore
+from work_queue import missing_days, order_by_cost
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# 熔断延后的 key 最多重排几轮
+DEFER_ROUNDS = 2
+
+
+@dataclass
+class DatasetConfig:
+    """单个数据集的声明式配置"""
+    name: str
+    table_name: str
+    pk_columns: List[str]
+    fetch: Callable[[str, str, str], pd.DataFrame]
+    transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None
+    create_table_sql: Optional[str] = None
+    # 水位：按哪些列分组取最大日期；key 对应 keys 里的元素
+    watermark_key_columns: Sequence[str] = ('ts_code',)
+    date_column: str = 'trade_date'
+    # 流水线参数
+    fetch_workers: int = 4
+    queue_size: int = 64
+    write_batch_rows: int = 50000
+    write_batch_seconds: float = 10.0
+    # 按内容哈希跳过未变化的行（bulk_loader skip_unchanged），与该表其他写入路径保持一致
+    skip_unchanged: bool = False
+    extra: Dict = field(default_factory=dict)
+
+
+@dataclass
+class PipelineStats:
+    fetched: int = 0
+    empty: int = 0
+    # 拉取失败的 key 数 + 转换/写入失败批次的行数；非 0 即本轮有数据没有落库
+    failed: int = 0
+    deferred: int = 0
+    rows_written: int = 0
+    batches: int = 0
+    failed_keys: List[str] = field(default_factory=list)
+
+
+class PipelineCollector:
+    def __init__(self, config: DatasetConfig, db_params: dict):
+        self.config = config
+        self.db_params = db_params
+        self.stats = PipelineStats()
+        self._stats_lock = threading.Lock()
+        self._deferred: List[str] = []
+        self._defer_wait = 0.0
+
+    def init_table(self):
+        if not self.config.create_table_sql:
+            return
+        with pooled_connection(self.db_params) as conn:
+            with conn.cursor() as cur:
+                cur.execute(self.config.create_table_sql)
+
+    def load_watermarks(self) -> WatermarkStore:
+        store = WatermarkStore(self.config.table_name,
+                               key_columns=self.config.watermark_key_columns,
+                               date_column=self.config.date_column)
+        with pooled_connection(self.db_params) as conn:
+            store.load(conn)
+        return store
+
+    # ---------------- 三个阶段 ----------------
+    def _fetcher(self, work_q: queue.Queue, raw_q: queue.Queue, start_date: str, end_date: str,
+                 watermarks: Optional[WatermarkStore]):
+        while True:
+            key = work_q.get()
+            if key is _STOP:
+                return
+            key_start = watermarks.start_date_for(key, start_date) if watermarks is not None else start_date
+            if key_start > end_date:
+                continue
+            try:
+                df = self.config.fetch(key, key_start, end_date)
+            except CircuitOpenError as e:
+                with self._stats_lock:
+                    self._deferred.append(key)
+                    self._defer_wait = max(self._defer_wait, e.retry_after)
+                continue
+            except Exception as e:
+                with self._stats_lock:
+                    self.stats.failed += 1
+                    self.stats.failed_keys.append(key)
+                logger.error(f"[{self.config.name}] {key} 拉取失败: {e}")
+                continue
+            with self._stats_lock:
+                if df is None or df.empty:
+                    self.stats.empty += 1
+                    continue
+                self.stats.fetched += 1
+            raw_q.put(df)
+
+    def _transformer(self, raw_q: queue.Queue, write_q: queue.Queue):
+        pending: List[pd.DataFrame] = []
+        pending_rows = 0
+        last_flush = time.time()
+
+        def flush():
+            nonlocal pending, pending_rows, last_flush
+            batch_rows = pending_rows
+            try:
+                if pending:
+                    batch = pd.concat(pending, ignore_index=True)
+                    if self.config.transform is not None:
+                        batch = self.config.transform(batch)
+                    if batch is not None and not batch.empty:
+                        write_q.put(batch)
+            except Exception as e:
+                # 转换失败只丢这一批，线程继续消费 raw_q，否则拉取线程会阻塞在 put 上
+                with self._stats_lock:
+                    self.stats.failed += batch_rows
+                logger.error(f"[{self.config.name}] 批量转换失败（{batch_rows} 行）: {e}")
+            finally:
+                pending, pending_rows, last_flush = [], 0, time.time()
+
+        try:
+            while True:
+                try:
+                    item = raw_q.get(timeout=1.0)
+                except queue.Empty:
+                    item = None
+                if item is _STOP:
+                    flush()
+                    return
+                if item is not None:
+                    pending.append(item)
+                    pending_rows += len(item)
+                if pending_rows >= self.config.write_batch_rows or \
+                        (pending and time.time() - last_flush >= self.config.write_batch_seconds):
+                    flush()
+        finally:
+            write_q.put(_STOP)
+
+    def _writer(self, write_q: queue.Queue, watermarks: Optional[WatermarkStore]):
+        while True:
+            batch = write_q.get()
+            if batch is _STOP:
+                return
+            try:
+                with pooled_connection(self.db_params) as conn:
+                    copy_upsert(conn, batch, self.config.table_name, pk_columns=self.config.pk_columns,
+                                skip_unchanged=self.config.skip_unchanged)
+                if watermarks is not None:
+                    watermarks.update_from_frame(batch)
+                with self._stats_lock:
+                    self.stats.rows_written += len(batch)
+                    self.stats.batches += 1
+            except Exception as e:
+                with self._stats_lock:
+                    self.stats.failed += len(batch)
+                logger.error(f"[{self.config.name}] 批量写入失败（{len(batch)} 行）: {e}")
+
+    def _run_fetchers(self, keys: List[str], raw_q: queue.Queue, start_date: str, end_date: str,
+                      watermarks: Optional[WatermarkStore]):
+        """一轮拉取：fetch_workers 个线程领完 keys 后返回"""
+        cfg = self.config
+        work_q: queue.Queue = queue.Queue()
+        for key in keys:
+            work_q.put(key)
+        for _ in range(cfg.fetch_workers):
+            work_q.put(_STOP)
+        fetchers = [threading.Thread(target=self._fetcher, name=f'{cfg.name}-fetch-{i}',
+                                     args=(work_q, raw_q, start_date, end_date, watermarks), daemon=True)
+                    for i in range(cfg.fetch_workers)]
+        for t in fetchers:
+            t.start()
+        for t in fetchers:
+            t.join()
+
+    # ---------------- 入口 ----------------
+    def run(self, keys: Iterable[str], start_date: str, end_date: str,
+            mode: str = 'incremental', watermarks: Optional[WatermarkStore] = None) -> PipelineStats:
+        keys = list(keys)
+        cfg = self.config
+        if mode == 'incremental' and watermarks is None:
+            watermarks = self.load_watermarks()
+        elif mode != 'incremental':
+            watermarks = None
+        if watermarks is not None:
+            # 缺失天数多的 key 先入队，避免长任务落在队尾拖慢整体
+            keys = order_by_cost(keys, cost=lambda k: missing_days(
+                watermarks.start_date_for(k, start_date), end_date))
+
+        raw_q: queue.Queue = queue.Queue(maxsize=cfg.queue_size)
+        write_q: queue.Queue = queue.Queue(maxsize=2)
+
+        started = time.time()
+        logger.info(f"[{cfg.name}] 流水线启动：{len(keys)} 个 key，{cfg.fetch_workers} 个拉取线程，模式={mode}")
+        transformer = threading.Thread(target=self._transformer, name=f'{cfg.name}-transform',
+                                       args=(raw_q, write_q), daemon=True)
+        writer = threading.Thread(target=self._writer, name=f'{cfg.name}-write',
+                                  args=(write_q, watermarks), daemon=True)
+        transformer.start()
+        writer.start()
+
+        pending = keys
+        for round_no in range(DEFER_ROUNDS + 1):
+            if round_no:
+                logger.warning(f"[{cfg.name}] {len(pending)} 个 key 因上游熔断延后，"
+                               f"{self._defer_wait:.0f}s 后第 {round_no} 次补拉")
+                time.sleep(self._defer_wait)
+            self._deferred, self._defer_wait = [], 0.0
+            self._run_fetchers(pending, raw_q, start_date, end_date, watermarks)
+            pending = self._deferred
+            if not pending:
+                break
+        self.stats.deferred = len(pending)
+
+        raw_q.put(_STOP)
+        transformer.join()
+        writer.join()
+
+        elapsed = max(time.time() - started, 1e-6)
+        s = self.stats
+        logger.info(f"[{cfg.name}] 完成：有数据 {s.fetched}，无数据 {s.empty}，失败 {s.failed}，"
+                    f"延后未完成 {s.deferred}，写入 {s.rows_written} 行 / {s.batches} 批，耗时 {elapsed:.1f}s")
+        return s
@@ -1,17 +1,73 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-概念股筛选脚本 - 使用 pywencai 获取概念板块数据
+概念股筛选脚本 - 成分股取自本地概念库（concept_store），行情与业绩取自本地表：
+  - 涨跌幅: stock_history 最近一个交易日（不复权）
+  - 总市值: daily_basic 最近一个交易日
+  - 扣非净利润同比: profit_sheet 最新报告期 vs 去年同期（累计值）
 """
 
-import pywencai
 import pandas as pd
 from datetime import datetime
 
+from concept_store import get_concept_store
+from db_pool import pooled_connection
+from double_single_growth_selector import load_db_config
+
 # 要查询的概念列表
 CONCEPTS = ["户用储能", "钾肥", "煤化工"]
 
-def get_concept_data(concept_name):
+
+def _query(conn, sql, params) -> pd.DataFrame:
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        return pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+
+
+def load_concept_metrics(conn, symbols) -> pd.DataFrame:
+    """一次性取出成分股的涨跌幅、总市值、扣非净利润同比"""
+    symbols = list(symbols)
+    pct = _query(conn, """
+        SELECT DISTINCT ON (symbol) symbol AS 股票代码, pct_change AS 涨跌幅
+        FROM stock_history
+        WHERE adjust_type = '' AND symbol = ANY(%s) AND trade_date >= CURRENT_DATE - 15
+        ORDER BY symbol, trade_date DESC
+    """, (symbols,))
+    cap = _query(conn, """
+        SELECT DISTINCT ON (ts_code) LEFT(ts_code, 6) AS 股票代码, total_mv * 10000 AS 总市值
+        FROM daily_basic
+        WHERE LEFT(ts_code, 6) = ANY(%s) AND trade_date >= CURRENT_DATE - 15
+        ORDER BY ts_code, trade_date DESC
+    """, (symbols,))
+    growth = _query(conn, """
+        WITH q AS (
+            SELECT LEFT(symbol, 6) AS code, LEFT(report_date::text, 10)::date AS period,
+                   deduct_parent_netprofit AS p,
+                   ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY report_date DESC) AS rn
+            FROM profit_sheet
+            WHERE LEFT(symbol, 6) = ANY(%s) AND deduct_parent_netprofit IS NOT NULL
+        )
+        -- 去年同一报告期按日期对齐，不依赖中间各期都在库里
+        SELECT a.code AS 股票代码, (a.p - b.p) / ABS(b.p) AS 扣非净利润同比
+        FROM q a JOIN q b ON a.code = b.code AND b.period = (a.period - INTERVAL '1 year')::date
+        WHERE a.rn = 1 AND b.p <> 0
+    """, (symbols,))
+
+    df = pd.DataFrame({'股票代码': symbols})
+    for part in (pct, cap, growth):
+        df = df.merge(part, on='股票代码', how='left')
+    for col in ('涨跌幅', '总市值', '扣非净利润同比'):
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+def _print_rows(rows: pd.DataFrame, value_col: str, fmt=None):
+    for _, row in rows.iterrows():
+        val = row[value_col]
+        print(f"   {row['股票代码']} {row['股票简称']} {fmt(val) if fmt else val}")
+
+
+def get_concept_data(concept_name, index, conn):
     """
     获取单个概念板块的数据
     """
@@ -21,101 +77,38 @@ def get_concept_data(concept_name):
     
     try:
         # 获取该概念的所有股票
-        query = f"{concept_name}概念股"
-        df = pywencai.get(query=query, loop=True)
-        
-        if df is None or df.empty:
+        symbols = sorted(index.symbols_for(concept_name))
+        if not symbols:
             print(f"  未获取到数据")
             return
         
-        # 显示股票数量
-        stock_count = len(df)
-        print(f"\n📊 股票数量: {stock_count} 只")
+        df = load_concept_metrics(conn, symbols)
+        df['股票简称'] = df['股票代码'].map(index.stock_names)
         
-        # 打印列名以便调试
-        # print(f"\n可用字段: {list(df.columns)}")
+        # 显示股票数量
+        print(f"\n📊 股票数量: {len(df)} 只（匹配概念: {', '.join(index.match_concepts(concept_name))}）")
         
         # 涨幅领涨前3只
         print("\n📈 涨幅领涨 TOP 3:")
-        if '涨跌幅' in df.columns:
-            top_gainers = df.nlargest(3, '涨跌幅')[['股票代码', '股票简称', '涨跌幅']]
-        elif '涨幅' in df.columns:
-            top_gainers = df.nlargest(3, '涨幅')[['股票代码', '股票简称', '涨幅']]
-        else:
-            # 尝试查找涨幅相关列
-            gain_col = [c for c in df.columns if '涨' in c or '幅' in c]
-            if gain_col:
-                top_gainers = df.nlargest(3, gain_col[0])[['股票代码', '股票简称', gain_col[0]]]
-            else:
-                top_gainers = df.head(3)[['股票代码', '股票简称']]
-        
-        for idx, row in top_gainers.iterrows():
-            print(f"   {row['股票代码']} {row['股票简称']}", end="")
-            for col in row.index:
-                if col not in ['股票代码', '股票简称']:
-                    print(f" {row[col]}", end="")
-            print()
+        _print_rows(df.dropna(subset=['涨跌幅']).nlargest(3, '涨跌幅'), '涨跌幅')
         
         # 市值龙头前3只
         print("\n💰 市值龙头 TOP 3:")
-        if '总市值' in df.columns:
-            top_cap = df.nlargest(3, '总市值')[['股票代码', '股票简称', '总市值']]
-        elif '流通市值' in df.columns:
-            top_cap = df.nlargest(3, '流通市值')[['股票代码', '股票简称', '流通市值']]
-        else:
-            cap_col = [c for c in df.columns if '市值' in c]
-            if cap_col:
-                top_cap = df.nlargest(3, cap_col[0])[['股票代码', '股票简称', cap_col[0]]]
-            else:
-                top_cap = df.head(3)[['股票代码', '股票简称']]
-        
-        for idx, row in top_cap.iterrows():
-            print(f"   {row['股票代码']} {row['股票简称']}", end="")
-            for col in row.index:
-                if col not in ['股票代码', '股票简称']:
-                    val = row[col]
-                    if isinstance(val, (int, float)) and val > 100000000:
-                        print(f" {val/100000000:.2f}亿", end="")
-                    else:
-                        print(f" {val}", end="")
-            print()
+        _print_rows(df.dropna(subset=['总市值']).nlargest(3, '总市值'), '总市值',
+                    fmt=lambda v: f"{v/100000000:.2f}亿")
         
         # 失意者（跌幅最大）前3只
         print("\n📉 失意者(跌幅最大) TOP 3:")
-        if '涨跌幅' in df.columns:
-            bottom_gainers = df.nsmallest(3, '涨跌幅')[['股票代码', '股票简称', '涨跌幅']]
-        elif '涨幅' in df.columns:
-            bottom_gainers = df.nsmallest(3, '涨幅')[['股票代码', '股票简称', '涨幅']]
-        else:
-            gain_col = [c for c in df.columns if '涨' in c or '幅' in c]
-            if gain_col:
-                bottom_gainers = df.nsmallest(3, gain_col[0])[['股票代码', '股票简称', gain_col[0]]]
-            else:
-                bottom_gainers = df.tail(3)[['股票代码', '股票简称']]
-        
-        for idx, row in bottom_gainers.iterrows():
-            print(f"   {row['股票代码']} {row['股票简称']}", end="")
-            for col in row.index:
-                if col not in ['股票代码', '股票简称']:
-                    print(f" {row[col]}", end="")
-            print()
+        _print_rows(df.dropna(subset=['涨跌幅']).nsmallest(3, '涨跌幅'), '涨跌幅')
         
         # 业绩增速最佳前3只
         print("\n🚀 业绩增速最佳 TOP 3:")
-        growth_cols = [c for c in df.columns if any(k in c for k in ['净利润增长', '业绩增长', '营收增长', '增长率', '同比'])]
-        if growth_cols:
-            # 选择第一个包含增长数据的列
-            growth_col = growth_cols[0]
-            # 过滤掉空值和异常值
-            df_growth = df[df[growth_col].notna()].copy()
-            if not df_growth.empty:
-                top_growth = df_growth.nlargest(3, growth_col)[['股票代码', '股票简称', growth_col]]
-                for idx, row in top_growth.iterrows():
-                    print(f"   {row['股票代码']} {row['股票简称']} {growth_col}:{row[growth_col]}")
-            else:
-                print("   无有效业绩数据")
+        df_growth = df.dropna(subset=['扣非净利润同比'])
+        if not df_growth.empty:
+            _print_rows(df_growth.nlargest(3, '扣非净利润同比'), '扣非净利润同比',
+                        fmt=lambda v: f"扣非净利润同比:{v:.2%}")
         else:
-            print("   未找到业绩增速字段")
+            print("   无有效业绩数据")
         
     except Exception as e:
         print(f"  错误: {e}")
@@ -126,8 +119,12 @@ def main():
     print(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*60)
     
-    for concept in CONCEPTS:
-        get_concept_data(concept)
+    db_config = load_db_config()
+    index = get_concept_store(db_config).index()
+    print(f"概念库更新于: {index.refreshed_at or '未知'}")
+    with pooled_connection(db_config) as conn:
+        for concept in CONCEPTS:
+            get_concept_data(concept, index, conn)
     
     print("\n" + "="*60)
     print("报告生成完毕")
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+本地概念成分库：问财“所属概念”每日全量拉取一次，按股票写入拉链表 concept_membership
+（board_code = board_name = 概念名，复用 board_membership 的 SCD2 合并），
+选股时只读本地库并在进程内建倒排索引，不再在选股流程里逐批/逐概念调用 pywencai。
+
+    store = get_concept_store(db_config)
+    idx = store.index()                              # ConceptIndex，过期时后台刷新，不阻塞
+    idx.symbols_for(['煤化工', '煤炭'])               # 概念 -> 股票集合
+    idx.concepts_frame(['300750', '603045'])          # 股票 -> 'concepts'（';' 分隔，与问财一致）
+
+定时任务（每日收盘后）：
+    python concept_store.py --refresh
+
+数据新鲜度以 job_ledger 中 concept_membership 的最近完成时间为准：
+- 超过 CONCEPT_TTL 视为过期，index() 照常返回现有数据，同时在后台线程刷新，完成后替换索引
+- 本地库为空时 index() 同步刷新一次
+"""
+import argparse
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Union
+
+import pandas as pd
+import pywencai
+
+from board_membership import apply_snapshot, init_membership_table, members_as_of
+from db_pool import pooled_connection
+from job_ledger import JobLedger
+from security_master import ALL_BOARDS, get_security_master
+
+logger = logging.getLogger(__name__)
+
+CONCEPT_TABLE = 'concept_membership'
+LEDGER_DATASET = 'concept_membership'
+
+# 概念数据有效期（秒）：超过后后台刷新
+CONCEPT_TTL = 24 * 3600
+# 问财单次查询的股票数
+WENCAI_BATCH = 50
+
+_SEPARATOR = ';'
+
+
+# ---------------------------------------------------------------------------
+# 拉取与写库
+# ---------------------------------------------------------------------------
+def fetch_concepts_wencai(symbols: List[str], batch_size: int = WENCAI_BATCH,
+                          pause: float = 0.5, failed: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    pywencai.get(query='所属概念', find=[...]) 分批拉取，返回 symbol, stock_name, concepts（';' 分隔）
+    问财可能额外返回未请求的股票，只保留传入的 symbol
+    - failed: 传入列表时，查询失败批次的股票代码追加到其中
+    """
+    results = []
+    symbols = list(dict.fromkeys(str(s) for s in symbols))
+    total = len(symbols)
+    for i in range(0, total, batch_size):
+        batch = symbols[i:i + batch_size]
+        try:
+            started = time.time()
+            df = pywencai.get(query='所属概念', find=batch, loop=True)
+            if isinstance(df, pd.DataFrame) and not df.empty and '所属概念' in df.columns:
+                if 'code' not in df.columns and '股票代码' in df.columns:
+                    df['code'] = df['股票代码'].astype(str).str.extract(r'(\d{6})', expand=False)
+                name_col = '股票简称' if '股票简称' in df.columns else None
+                results.append(pd.DataFrame({
+                    'symbol': df['code'].astype(str),
+                    'stock_name': df[name_col] if name_col else None,
+                    'concepts': df['所属概念'],
+                }))
+            logger.info(f"  pywencai 概念查询 [{i + 1}-{min(i + batch_size, total)}/{total}] "
+                        f"返回 {len(df) if isinstance(df, pd.DataFrame) else 0} 条, 耗时 {time.time() - started:.1f}s")
+        except Exception as e:
+            logger.warning(f"pywencai 概念查询失败 batch {i + 1}-{min(i + batch_size, total)}: {e}")
+            if failed is not None:
+                failed.extend(batch)
+        time.sleep(pause)
+
+    if not results:
+        return pd.DataFrame(columns=['symbol', 'stock_name', 'concepts'])
+    df_all = pd.concat(results, ignore_index=True).drop_duplicates(subset=['symbol'], keep='first')
+    return df_all[df_all['symbol'].isin(set(symbols))]
+
+
+def explode_concepts(df: pd.DataFrame) -> pd.DataFrame:
+    """symbol, stock_name, concepts('a;b;c') -> 每个 (概念, 股票) 一行，列与 board_membership 快照一致"""
+    if df.empty:
+        return pd.DataFrame(columns=['board_code', 'symbol', 'board_name', 'stock_name'])
+    exploded = df.assign(concept=df['concepts'].astype(str).str.split(_SEPARATOR)).explode('concept')
+    exploded['concept'] = exploded['concept'].str.strip()
+    exploded = exploded[exploded['concept'].notna() & (exploded['concept'] != '')
+                        & (exploded['concept'] != 'nan')]
+    return pd.DataFrame({
+        'board_code': exploded['concept'],
+        'symbol': exploded['symbol'],
+        'board_name': exploded['concept'],
+        'stock_name': exploded['stock_name'],
+    }).drop_duplicates(subset=['board_code', 'symbol'])
+
+
+def _listed_symbols(db_params: Dict) -> List[str]:
+    return get_security_master(db_params).universe(boards=ALL_BOARDS, fmt='symbol')
+
+
+def refresh_concepts(db_params: Dict, symbols: Optional[List[str]] = None,
+                     batch_size: int = WENCAI_BATCH, commit_every: int = 500) -> Tuple[int, int]:
+    """
+    全量（或指定股票）刷新概念成分，返回 (新增成分数, 调出成分数)
+    每 commit_every 只股票提交一次：中途中断时已拉到的部分仍然生效
+    只有全市场刷新且全部批次都成功（且拉到了数据）才记台账；有批次失败时不记，下次运行不受 CONCEPT_TTL 限制直接重试；
+    只刷新指定股票时不记台账，不能让部分刷新把整个概念库标记为新鲜
+    """
+    full_refresh = symbols is None
+    symbols = symbols if symbols is not None else _listed_symbols(db_params)
+    ledger = JobLedger(db_params, LEDGER_DATASET)
+    ledger.init_table()
+    with pooled_connection(db_params) as conn:
+        init_membership_table(conn, CONCEPT_TABLE)
+        conn.commit()
+
+    as_of = date.today()
+    opened = closed = 0
+    started = time.time()
+    failed: List[str] = []
+    fetched = 0
+    for i in range(0, len(symbols), commit_every):
+        chunk = symbols[i:i + commit_every]
+        snapshot = explode_concepts(fetch_concepts_wencai(chunk, batch_size=batch_size, failed=failed))
+        if snapshot.empty:
+            continue
+        fetched += len(snapshot)
+        with pooled_connection(db_params) as conn:
+            o, c = apply_snapshot(conn, snapshot, as_of, CONCEPT_TABLE, scope_column='symbol')
+            conn.commit()
+        opened += o
+        closed += c
+
+    if failed or not fetched:
+        logger.warning(f"概念成分刷新未完成：{len(failed)} 只股票查询失败，拉到 {fetched} 条成分，"
+                       f"不记台账，下次运行重试")
+    elif full_refresh:
+        day = as_of.strftime('%Y%m%d')
+        ledger.record('*', day, day)
+    logger.info(f"概念成分刷新完成：{len(symbols)} 只股票，新增 {opened}，调出 {closed}，"
+                f"耗时 {time.time() - started:.0f}s")
+    return opened, closed
+
+
+# ---------------------------------------------------------------------------
+# 进程内倒排索引
+# ---------------------------------------------------------------------------
+class ConceptIndex:
+    def __init__(self, members: pd.DataFrame, refreshed_at: Optional[datetime] = None):
+        self.refreshed_at = refreshed_at
+        self.loaded_at = datetime.now()
+        by_concept: Dict[str, Set[str]] = {}
+        by_symbol: Dict[str, List[str]] = {}
+        for concept, symbol in zip(members['board_code'], members['symbol']):
+            by_concept.setdefault(concept, set()).add(symbol)
+            by_symbol.setdefault(symbol, []).append(concept)
+        self.stock_names: Dict[str, str] = dict(zip(members['symbol'], members['stock_name']))
+        self.concept_to_symbols: Dict[str, FrozenSet[str]] = {k: frozenset(v) for k, v in by_concept.items()}
+        self.symbol_to_concepts: Dict[str, Tuple[str, ...]] = {k: tuple(sorted(v)) for k, v in by_symbol.items()}
+
+    def __len__(self) -> int:
+        return len(self.symbol_to_concepts)
+
+    def match_concepts(self, keyword: str) -> List[str]:
+        """概念名精确匹配优先；没有时返回名称包含 keyword 的全部概念"""
+        if keyword in self.concept_to_symbols:
+            return [keyword]
+        return [c for c in self.concept_to_symbols if keyword in c]
+
+    def symbols_for(self, concepts: Union[str, Iterable[str]]) -> Set[str]:
+        """任一概念的成分股并集（6 位代码）"""
+        if isinstance(concepts, str):
+            concepts = [concepts]
+        result: Set[str] = set()
+        for keyword in concepts:
+            for concept in self.match_concepts(keyword):
+                result |= self.concept_to_symbols[concept]
+        return result
+
+    def concepts_for(self, symbol: str) -> Tuple[str, ...]:
+        return self.symbol_to_concepts.get(str(symbol), ())
+
+    def concepts_frame(self, symbols: Iterable[str]) -> pd.DataFrame:
+        """symbol, concepts（';' 分隔），没有概念数据的股票不返回"""
+        rows = [(s, _SEPARATOR.join(self.symbol_to_concepts[s]))
+                for s in dict.fromkeys(str(s) for s in symbols) if s in self.symbol_to_concepts]
+        return pd.DataFrame(rows, columns=['symbol', 'concepts'])
+
+
+# ---------------------------------------------------------------------------
+# 带 TTL 与后台刷新的存储
+# ---------------------------------------------------------------------------
+class ConceptStore:
+    def __init__(self, db_params: Dict, ttl: float = CONCEPT_TTL):
+        self.db_params = db_params
+        self.ttl = ttl
+        self._index: Optional[ConceptIndex] = None
+        self._lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+
+    def _load(self) -> ConceptIndex:
+        with pooled_connection(self.db_params) as conn:
+            init_membership_table(conn, CONCEPT_TABLE)
+            conn.commit()
+            members = members_as_of(conn, None, date.today(), CONCEPT_TABLE)
+        refreshed_at = JobLedger(self.db_params, LEDGER_DATASET).last_finished()
+        index = ConceptIndex(members, refreshed_at)
+        logger.info(f"概念索引已加载：{len(index.concept_to_symbols)} 个概念，{len(index)} 只股票，"
+                    f"数据更新于 {refreshed_at or '未知'}")
+        return index
+
+    def is_stale(self, index: ConceptIndex) -> bool:
+        return index.refreshed_at is None or \
+            datetime.now() - index.refreshed_at > timedelta(seconds=self.ttl)
+
+    def refresh(self):
+        """同步刷新并替换索引"""
+        refresh_concepts(self.db_params)
+        index = self._load()
+        with self._lock:
+            self._index = index
+
+    def refresh_async(self) -> threading.Thread:
+        """后台刷新（同一时间只跑一个）"""
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return self._refresh_thread
+
+            def run():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"概念成分后台刷新失败: {e}")
+
+            self._refresh_thread = threading.Thread(target=run, name='concept-refresh', daemon=True)
+            self._refresh_thread.start()
+            return self._refresh_thread
+
+    def index(self) -> ConceptIndex:
+        """当前索引；过期时触发后台刷新但立即返回现有数据，库为空时同步刷新"""
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._load()
+                index = self._index
+            if len(index) == 0:
+                logger.info("本地概念库为空，同步刷新一次")
+                self.refresh()
+                return self._index
+        if self.is_stale(index):
+            logger.info(f"概念数据已过期（更新于 {index.refreshed_at or '未知'}），后台刷新中，本次使用现有数据")
+            self.refresh_async()
+        return index
+
+
+_stores_lock = threading.Lock()
+_stores: Dict[tuple, ConceptStore] = {}
+
+
+def get_concept_store(db_params: Dict, **kwargs) -> ConceptStore:
+    """按数据库取进程内共享的 ConceptStore"""
+    key = tuple(sorted((k, str(v)) for k, v in db_params.items()))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = ConceptStore(db_params, **kwargs)
+            _stores[key] = store
+        return store
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='本地概念成分库')
+    parser.add_argument('--refresh', action='store_true', help='从问财全量刷新概念成分')
+    parser.add_argument('--symbols', type=str, default=None, help='只刷新指定股票，逗号分隔')
+    parser.add_argument('--concept', type=str, default=None, help='查询某个概念的成分股')
+    args = parser.parse_args()
+
+    from double_single_growth_selector import load_db_config
+    db_config = load_db_config()
+
+    if args.refresh:
+        symbols = args.symbols.split(',') if args.symbols else None
+        refresh_concepts(db_config, symbols)
+    if args.concept:
+        idx = get_concept_store(db_config).index()
+        members = sorted(idx.symbols_for(args.concept))
+        logger.info(f"【{args.concept}】匹配概念 {idx.match_concepts(args.concept)}，共 {len(members)} 只: {members}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,17 +5,22 @@
 """
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
+from db_pool import pooled_connection
 import logging
 import time
-import random
 import multiprocessing
 import argparse
 import sys
 from datetime import datetime, timedelta
-from functools import wraps
-from typing import List, Dict, Optional
-from python_fetch import python_fetch
+from typing import List, Dict, Optional, Tuple
+from python_fetch import python_fetch, fetch_many, get_open_trade_dates
+from watermark import WatermarkStore
+from bulk_loader import copy_upsert
+from adjustment import (BAR_COLUMNS, init_adj_factor_table, normalize_adj_factor, save_adj_factors,
+                        materialize_hfq)
+from work_queue import missing_days, order_by_cost, run_work_queue
+from resilience import CircuitOpenError, retry_on_exception
+from security_master import get_security_master
 
 # ---------- 日志配置 ----------
 logging.basicConfig(
@@ -25,39 +30,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ---------- 工具函数 ----------
-def chunks(lst: List, n: int) -> List[List]:
-    if not lst:
-        return []
-    size = len(lst)
-    chunk_size = (size + n - 1) // n
-    return [lst[i:i + chunk_size] for i in range(0, size, chunk_size)]
-
-def retry_on_exception(retries=3, delay=5, backoff=2, exceptions=(Exception,)):
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            retry_delay = delay
-            last_exception = None
-            for retry in range(retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except exceptions as e:
-                    last_exception = e
-                    if retry == retries:
-                        raise last_exception
-                    wait_time = retry_delay + random.uniform(0, 1)
-                    logger.warning(f"尝试 {retry + 1}/{retries} 失败: {str(e)}. "
-                                 f"{wait_time:.2f} 秒后重试...")
-                    time.sleep(wait_time)
-                    retry_delay *= backoff
-            raise last_exception
-        return wrapper
-    return decorator
 
 # ---------- 唯一需要大改的地方 ----------
-@retry_on_exception(retries=3, delay=5, backoff=2,
-                   exceptions=(Exception, TimeoutError, ConnectionError))
+@retry_on_exception(retries=3, delay=5, backoff=2)
 def fetch_stock_data(symbol: str, period: str, start_date: str,
                     end_date: str, adjust: str) -> pd.DataFrame:
     """
@@ -101,6 +76,48 @@ def fetch_stock_data(symbol: str, period: str, start_date: str,
 
     return df
 
+def normalize_daily_cross_section(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    把 daily(trade_date=...) 的全市场横截面转换成 fetch_stock_data 的列名，symbol 列为 6 位代码
+    """
+    if df is None or df.empty:
+        return pd.DataFrame()
+
+    df = df.rename(columns={
+        'trade_date': '日期',
+        'open': '开盘',
+        'high': '最高',
+        'low': '最低',
+        'close': '收盘',
+        'vol': '成交量',
+        'amount': '成交额',
+        'pct_chg': '涨跌幅',
+        'change': '涨跌额',
+    })
+    df['symbol'] = df['ts_code'].str[:6]
+    # 与 get_all_stocks 保持一致：只要 0/3/6 开头的 A 股
+    df = df[df['symbol'].str.startswith(('0', '3', '6'))].copy()
+    df['振幅'] = 0.0
+    df['换手率'] = 0.0
+    df['日期'] = pd.to_datetime(df['日期']).dt.strftime('%Y-%m-%d')
+    return df
+
+@retry_on_exception(retries=3, delay=5, backoff=2)
+def fetch_daily_by_trade_date(trade_date: str) -> pd.DataFrame:
+    """按交易日拉取全市场 daily 横截面（一次调用约 5000 行）"""
+    return normalize_daily_cross_section(python_fetch('daily', trade_date=trade_date))
+
+@retry_on_exception(retries=3, delay=5, backoff=2)
+def fetch_adj_factor(symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+    """单只股票的复权因子，返回 (symbol, trade_date, adj_factor)"""
+    return normalize_adj_factor(python_fetch('adj_factor', ts_code=_ensure_ts_code(symbol),
+                                             start_date=start_date, end_date=end_date))
+
+@retry_on_exception(retries=3, delay=5, backoff=2)
+def fetch_adj_factor_by_trade_date(trade_date: str) -> pd.DataFrame:
+    """按交易日拉取全市场复权因子横截面"""
+    return normalize_adj_factor(python_fetch('adj_factor', trade_date=trade_date))
+
 def _ensure_ts_code(code: str) -> str:
     """6 位数字 -> 000001.SZ / 600000.SH"""
     code = str(code).strip().zfill(6)
@@ -110,46 +127,45 @@ def _ensure_ts_code(code: str) -> str:
         return f"{code}.SH"
     raise ValueError(f"无法识别市场：{code}")
 
-# ---------- 以下代码完全不变 ----------
-def process_stock_batch(db_params: Dict, stock_batch: List[str], batch_id: int,
-                       start_date: str, end_date: str, mode: str, adjust: str):
-    if not stock_batch:
-        logger.warning(f"Batch {batch_id}: Empty stock batch, skipping")
-        return
+# 库里只存不复权行情（adjust_type=''），hfq 由复权因子在库内物化，qfq 读取时计算（见 adjustment.py）
+# 旧版本把不复权价标成了 'hfq'，升级后先运行一次 --migrate-legacy-hfq，否则首次增量会整段重下
+RAW = ''
+
+# ---------- 工作进程 ----------
+_worker_collector = None
+
+def init_worker(db_params: Dict):
+    """每个工作进程只创建一次 collector（连接池随进程复用）"""
+    global _worker_collector
+    _worker_collector = StockHistoryCollector(db_params)
+
+def process_stock(task: Tuple[str, str, str, str]) -> Tuple[str, str, int]:
+    """单只股票任务，由动态队列分发；返回 (symbol, 状态, 行数)"""
+    symbol, stock_start, end_date, adjust = task
     try:
-        collector = StockHistoryCollector(db_params)
-        total_stocks = len(stock_batch)
-        logger.info(f"Batch {batch_id}: Starting processing {total_stocks} stocks")
-        success_count = 0
-        error_count = 0
-        for idx, symbol in enumerate(stock_batch, 1):
-            try:
-                time.sleep(random.uniform(1, 3))
-                if mode == 'incremental':
-                    latest_date = collector.get_latest_trade_date(symbol, adjust)
-                    if latest_date:
-                        start_date = (latest_date + timedelta(days=1)).strftime('%Y%m%d')
-                df = fetch_stock_data(
-                    symbol=symbol,
-                    period="daily",
-                    start_date=start_date,
-                    end_date=end_date,
-                    adjust=adjust
-                )
-                if df is not None and not df.empty:
-                    df = collector.process_data(df, symbol, adjust)
-                    collector.save_to_db(df)
-                    success_count += 1
-                    logger.info(f"Batch {batch_id} Progress: {idx}/{total_stocks} - Successfully processed {symbol}")
-                else:
-                    logger.warning(f"Batch {batch_id}: No history data available for {symbol}")
-            except Exception as e:
-                error_count += 1
-                logger.error(f"Batch {batch_id}: Error processing {symbol}: {str(e)}")
-                continue
-        logger.info(f"Batch {batch_id} completed. Success: {success_count}, Errors: {error_count}")
+        # 只下载不复权行情 + 复权因子，复权价在本地计算
+        df = fetch_stock_data(
+            symbol=symbol,
+            period="daily",
+            start_date=stock_start,
+            end_date=end_date,
+            adjust=RAW
+        )
+        if df is None or df.empty:
+            logger.warning(f"No history data available for {symbol}")
+            return symbol, 'empty', 0
+        df = _worker_collector.process_data(df, symbol, RAW)
+        factors = fetch_adj_factor(symbol, stock_start, end_date)
+        _worker_collector.save_with_factors(df, factors, adjust, stock_start, symbols=[symbol])
+        logger.info(f"Successfully processed {symbol} ({stock_start} ~ {end_date}, {len(df)} 条)")
+        return symbol, 'ok', len(df)
+    except CircuitOpenError as e:
+        # 上游熔断中，不占用重试时间，交回队列稍后再排
+        logger.warning(f"{symbol} 延后处理: {e}")
+        return symbol, 'deferred', 0
     except Exception as e:
-        logger.error(f"Batch {batch_id}: Fatal error in batch processing: {str(e)}")
+        logger.error(f"Error processing {symbol}: {str(e)}")
+        return symbol, 'error', 0
 
 class StockHistoryCollector:
     def __init__(self, db_params: dict):
@@ -157,7 +173,7 @@ class StockHistoryCollector:
         self.table_name = 'stock_history'
 
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def init_table(self):
         create_table_sql = f"""
@@ -181,40 +197,42 @@ class StockHistoryCollector:
         with self.get_db_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(create_table_sql)
-                conn.commit()
-                logger.info("数据表初始化完成")
+            init_adj_factor_table(conn)
+            conn.commit()
+            logger.info("数据表初始化完成")
 
-    # 获取股票列表改用 tushare 的 stock_basic
+    # 股票列表取自证券主数据（0/3/6 开头的 A 股）
     def get_all_stocks(self) -> List[str]:
         try:
-            df = python_fetch('stock_basic', exchange='', list_status='L',
-                                fields='ts_code,symbol,name')
-            # 只要 0/3/6 开头的 A 股
-            stock_list = [
-                row['symbol']
-                for _, row in df.iterrows()
-                if str(row['symbol']).startswith(('0', '3', '6'))
-            ]
+            stock_list = get_security_master(self.db_params).universe(fmt='symbol')
             logger.info(f"Successfully retrieved {len(stock_list)} stock codes")
             return stock_list
         except Exception as e:
             logger.error(f"Error getting stock list: {str(e)}")
             return []
 
-    def get_latest_trade_date(self, symbol: str, adjust: str) -> Optional[datetime]:
+    def load_watermarks(self, adjust: str) -> WatermarkStore:
+        """一次分组查询加载全部 (symbol, adjust_type) 的最新交易日"""
+        store = WatermarkStore(self.table_name, key_columns=('symbol', 'adjust_type'))
+        with self.get_db_connection() as conn:
+            store.load(conn, where='adjust_type = %s', params=(adjust,))
+        logger.info(f"已加载 {len(store)} 个水位")
+        return store
+
+    def get_table_watermark(self, adjust: str) -> Optional[datetime]:
+        """整表最新交易日（按交易日横截面模式使用）"""
         with self.get_db_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(f"""
-                    SELECT trade_date
+                    SELECT MAX(trade_date)
                     FROM {self.table_name}
-                    WHERE symbol = %s AND adjust_type = %s
-                    ORDER BY trade_date DESC
-                    LIMIT 1
-                """, (symbol, adjust))
+                    WHERE adjust_type = %s
+                """, (adjust,))
                 result = cur.fetchone()
-                return result[0] if result else None
+                return result[0] if result and result[0] else None
 
-    def process_data(self, df: pd.DataFrame, symbol: str, adjust: str) -> pd.DataFrame:
+    def process_data(self, df: pd.DataFrame, symbol: Optional[str], adjust: str) -> pd.DataFrame:
+        """symbol 为 None 时保留 df 自带的 symbol 列（横截面数据）"""
         if df.empty:
             return pd.DataFrame()
         column_mapping = {
@@ -231,7 +249,8 @@ class StockHistoryCollector:
             '换手率': 'turnover'
         }
         df = df.rename(columns=column_mapping)
-        df['symbol'] = symbol
+        if symbol is not None:
+            df['symbol'] = symbol
         df['adjust_type'] = adjust
         df['trade_date'] = pd.to_datetime(df['trade_date']).dt.date
         columns = ['trade_date', 'symbol', 'open', 'close', 'high', 'low',
@@ -242,26 +261,150 @@ class StockHistoryCollector:
     def save_to_db(self, df: pd.DataFrame):
         if df.empty:
             return
+        with self.get_db_connection() as conn:
+            try:
+                copy_upsert(conn, df, self.table_name, pk_columns=['symbol', 'trade_date', 'adjust_type'])
+                conn.commit()
+                logger.info(f"成功保存 {len(df)} 条记录")
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"保存数据失败: {str(e)}")
+                raise
+
+    def save_with_factors(self, bars: pd.DataFrame, factors: pd.DataFrame, adjust: str,
+                          start_date: str, symbols: Optional[List[str]] = None):
+        """
+        同一事务写入不复权行情与复权因子；adjust='hfq' 时顺带在库内物化 start_date 之后的 hfq 行
+        （hfq 历史不随新除权变化，只补新日期即可；qfq 用 adjustment.load_adjusted_bars 读取时计算）
+        """
+        with self.get_db_connection() as conn:
+            if not bars.empty:
+                copy_upsert(conn, bars, self.table_name, pk_columns=['symbol', 'trade_date', 'adjust_type'])
+            if not factors.empty:
+                save_adj_factors(conn, factors)
+            if adjust == 'hfq':
+                materialize_hfq(conn, symbols, start_date)
+            conn.commit()
+
+    def collect_by_trade_date(self, start_date: str, end_date: str,
+                              mode: str = 'incremental', adjust: str = '',
+                              concurrency: int = 4):
+        """
+        按交易日横截面采集：根据库内水位计算缺失交易日，每个交易日一次 daily(trade_date=...)
+        增量补一天只需 2 次接口调用（trade_cal + daily），无需逐只股票循环；
+        多个交易日在单进程内并发拉取（python_fetch_many），入库按完成顺序串行进行
+        """
+        self.init_table()
+        if mode == 'incremental':
+            latest_date = self.get_table_watermark(RAW)
+            if latest_date:
+                start_date = max(start_date, (latest_date + timedelta(days=1)).strftime('%Y%m%d'))
+        trade_dates = get_open_trade_dates(start_date, end_date)
+        if not trade_dates:
+            logger.info(f"{start_date} ~ {end_date} 无待补交易日")
+            return
+        logger.info(f"按交易日采集：{len(trade_dates)} 个交易日 ({trade_dates[0]} ~ {trade_dates[-1]})，并发 {concurrency}")
+
+        failed = []
+        done = {'count': 0}
+        total = 2 * len(trade_dates)
+
+        def on_result(request, result):
+            api_name, trade_date = request[0], request[1]['trade_date']
+            done['count'] += 1
+            if isinstance(result, Exception):
+                logger.warning(f"{trade_date} {api_name}: 并发拉取失败，稍后串行重试: {str(result)}")
+                failed.append((api_name, trade_date))
+                return
+            try:
+                if api_name == 'adj_factor':
+                    self.save_with_factors(pd.DataFrame(), normalize_adj_factor(result), RAW, trade_date)
+                    return
+                df = normalize_daily_cross_section(result)
+                if df.empty:
+                    logger.warning(f"{trade_date}: 无数据")
+                    return
+                df = self.process_data(df, None, RAW)
+                self.save_to_db(df)
+                logger.info(f"Progress: {done['count']}/{total} - {trade_date} 保存 {len(df)} 条")
+            except Exception as e:
+                logger.error(f"{trade_date} {api_name}: 入库失败，稍后重试: {str(e)}")
+                failed.append((api_name, trade_date))
+
+        # 每个交易日两次调用：不复权行情 + 复权因子
+        requests = [(api, {'trade_date': d}) for d in trade_dates for api in ('daily', 'adj_factor')]
+        fetch_many(requests, concurrency=concurrency, on_result=on_result)
+
+        # 并发失败的交易日走带重试的串行路径
+        error_count = 0
+        for api_name, trade_date in failed:
+            try:
+                if api_name == 'adj_factor':
+                    self.save_with_factors(pd.DataFrame(), fetch_adj_factor_by_trade_date(trade_date), RAW, trade_date)
+                else:
+                    df = fetch_daily_by_trade_date(trade_date)
+                    if not df.empty:
+                        self.save_to_db(self.process_data(df, None, RAW))
+            except Exception as e:
+                error_count += 1
+                logger.error(f"{trade_date} {api_name}: 处理失败: {str(e)}")
+
+        if adjust == 'hfq':
+            with self.get_db_connection() as conn:
+                rows = materialize_hfq(conn, None, trade_dates[0])
+                conn.commit()
+            logger.info(f"物化 hfq {rows} 行")
+        logger.info(f"按交易日采集完成，共 {len(trade_dates)} 个交易日，失败 {error_count}")
+
+    def migrate_legacy_hfq(self, concurrency: int = 4) -> int:
+        """
+        一次性迁移：升级前的 daily.py 默认 --adjust hfq，但 tushare daily 只有不复权价，
+        库里 adjust_type='hfq' 的行实际是不复权行情。升级后水位按 adjust_type='' 计算，不迁移会整段重下。
+        1. 按交易日补齐这些行覆盖区间的复权因子（幂等，失败时不动行情表）
+        2. 同一事务内把旧 'hfq' 行改标为 ''（已有 '' 行的以其为准），删除旧 'hfq' 行，再按因子物化真正的 hfq
+        仅适用于 stock_history 中的 'hfq' 行全部来自旧 daily.py 的库；StockHistory.py 写入的 akshare 后复权行会被一并改写
+        返回改标的行数
+        """
+        self.init_table()
+        with self.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT MIN(trade_date) FROM {self.table_name} WHERE adjust_type = 'hfq'")
+                first_date = cur.fetchone()[0]
+        if first_date is None:
+            logger.info("没有需要迁移的旧 hfq 行")
+            return 0
+        trade_dates = get_open_trade_dates(first_date.strftime('%Y%m%d'), datetime.now().strftime('%Y%m%d'))
+        logger.info(f"补齐复权因子：{len(trade_dates)} 个交易日 ({trade_dates[0]} ~ {trade_dates[-1]})")
+
+        failed = []
+
+        def on_result(request, result):
+            trade_date = request[1]['trade_date']
+            if isinstance(result, Exception):
+                failed.append(trade_date)
+                return
+            self.save_with_factors(pd.DataFrame(), normalize_adj_factor(result), RAW, trade_date)
+
+        fetch_many([('adj_factor', {'trade_date': d}) for d in trade_dates],
+                   concurrency=concurrency, on_result=on_result)
+        for trade_date in failed:
+            # 串行重试仍失败直接抛出：因子不全时不能改标，否则物化出的 hfq 会缺行
+            self.save_with_factors(pd.DataFrame(), fetch_adj_factor_by_trade_date(trade_date), RAW, trade_date)
+
+        columns = ', '.join(BAR_COLUMNS)
         with self.get_db_connection() as conn:
             with conn.cursor() as cur:
-                columns = df.columns.tolist()
-                values = [tuple(x) for x in df.values]
-                insert_stmt = f"""
-                    INSERT INTO {self.table_name} ({','.join(columns)})
-                    VALUES %s
-                    ON CONFLICT (symbol, trade_date, adjust_type)
-                    DO UPDATE SET
-                    {','.join(f"{col}=EXCLUDED.{col}" for col in columns
-                             if col not in ['symbol', 'trade_date', 'adjust_type'])}
-                """
-                try:
-                    execute_values(cur, insert_stmt, values)
-                    conn.commit()
-                    logger.info(f"成功保存 {len(df)} 条记录")
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"保存数据失败: {str(e)}")
-                    raise
+                cur.execute(f"""
+                    INSERT INTO {self.table_name} ({columns}, adjust_type)
+                    SELECT {columns}, '' FROM {self.table_name} WHERE adjust_type = 'hfq'
+                    ON CONFLICT (symbol, trade_date, adjust_type) DO NOTHING
+                """)
+                relabelled = cur.rowcount
+                cur.execute(f"DELETE FROM {self.table_name} WHERE adjust_type = 'hfq'")
+            rows = materialize_hfq(conn, None, first_date)
+            conn.commit()
+        logger.info(f"旧 hfq 行迁移完成：改标为不复权 {relabelled} 行，重新物化 hfq {rows} 行")
+        return relabelled
 
     def parallel_data_collection(self, start_date: str, end_date: str,
                                mode: str = 'incremental', adjust: str = '',
@@ -273,32 +416,40 @@ class StockHistoryCollector:
             logger.error("没有获取到股票列表，无法进行数据采集")
             return
         logger.info(f"开始并行数据采集，共 {total_stocks} 只股票，使用 {num_processes} 个进程")
-        num_processes = min(num_processes, total_stocks)
-        stock_batches = chunks(stocks, num_processes)
+        watermarks = self.load_watermarks(RAW) if mode == 'incremental' else None
         tasks = []
-        for i, batch in enumerate(stock_batches):
-            if batch:
-                tasks.append((self.db_params, batch, i, start_date, end_date, mode, adjust))
-        if not tasks:
-            logger.error("没有创建有效的任务")
-            return
-        logger.info(f"创建了 {len(tasks)} 个任务批次")
-        with multiprocessing.Pool(processes=num_processes) as pool:
-            pool.starmap(process_stock_batch, tasks)
-        logger.info("所有批次处理完成")
+        for symbol in stocks:
+            stock_start = watermarks.start_date_for((symbol, RAW), start_date) if watermarks else start_date
+            if stock_start <= end_date:
+                tasks.append((symbol, stock_start, end_date, adjust))
+        logger.info(f"{total_stocks - len(tasks)} 只股票已是最新，{len(tasks)} 只待补")
+        # 缺失天数多的先跑，避免慢任务拖在队尾
+        tasks = order_by_cost(tasks, cost=lambda t: missing_days(t[1], t[2]))
+        run_work_queue(process_stock, tasks, processes=num_processes,
+                       initializer=init_worker, initargs=(self.db_params,),
+                       label='stock_history')
+        logger.info("所有任务处理完成")
 
 def main():
     parser = argparse.ArgumentParser(description='股票历史数据采集工具')
     parser.add_argument('--mode', choices=['incremental', 'full'], default='incremental',
                        help='运行模式: incremental-增量更新, full-全量更新')
     parser.add_argument('--adjust', choices=['', 'qfq', 'hfq'], default='hfq',
-                       help='复权方式: 空-不复权, qfq-前复权, hfq-后复权')
+                       help='复权方式: 均只下载不复权行情+复权因子; hfq-额外在库内物化后复权行, '
+                            'qfq-不物化, 读取时用 adjustment.load_adjusted_bars 计算')
     parser.add_argument('--processes', type=int, default=10, help='并行进程数')
     parser.add_argument('--start_date', type=str, default='20100101',
                        help='开始日期 (YYYYMMDD)')
     parser.add_argument('--end_date', type=str,
                        default=datetime.now().strftime('%Y%m%d'),
                        help='结束日期 (YYYYMMDD)')
+    parser.add_argument('--by-date', action='store_true',
+                       help='按交易日拉取全市场横截面（每个缺失交易日一次调用），替代逐只股票循环')
+    parser.add_argument('--concurrency', type=int, default=4,
+                       help='--by-date / --migrate-legacy-hfq 模式下单进程内的并发请求数')
+    parser.add_argument('--migrate-legacy-hfq', action='store_true',
+                       help='升级后首次运行前执行一次：把旧版写入的 hfq 行（实为不复权价）改标为不复权，'
+                            '补齐复权因子并重新物化 hfq')
     try:
         args = parser.parse_args()
     except SystemExit:
@@ -314,6 +465,19 @@ def main():
     }
     try:
         collector = StockHistoryCollector(db_params)
+        if args.migrate_legacy_hfq:
+            collector.migrate_legacy_hfq(concurrency=args.concurrency)
+            return
+        if args.by_date:
+            logger.info(f"开始{args.mode}模式的按交易日采集...")
+            collector.collect_by_trade_date(
+                start_date=args.start_date,
+                end_date=args.end_date,
+                mode=args.mode,
+                adjust=args.adjust,
+                concurrency=args.concurrency
+            )
+            return
         logger.info(f"开始{args.mode}模式的并行数据采集（使用 {args.processes} 个进程）...")
         collector.parallel_data_collection(
             start_date=args.start_date,
@@ -1,18 +1,20 @@
 import os
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
+from db_pool import pooled_connection
 import logging
 from typing import List, Dict, Optional
-import time
-import random
 import multiprocessing
 import argparse
 import sys
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from functools import wraps
-from python_fetch import python_fetch, get_pro_client
+from python_fetch import python_fetch, get_pro_client, get_open_trade_dates
+from watermark import WatermarkStore
+from bulk_loader import copy_upsert_changed
+from collector_framework import DatasetConfig, PipelineCollector
+from resilience import retry_on_exception
+from security_master import ALL_BOARDS, get_security_master
 
 load_dotenv('.env')
 
@@ -27,33 +29,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def retry_on_exception(retries=3, delay=5, backoff=2, exceptions=(Exception,)):
-    """重试装饰器"""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            retry_delay = delay
-            last_exception = None
-            
-            for retry in range(retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except exceptions as e:
-                    last_exception = e
-                    if retry == retries:
-                        raise last_exception
-                    
-                    wait_time = retry_delay + random.uniform(0, 1)
-                    logger.warning(f"尝试 {retry + 1}/{retries} 失败: {str(e)}. "
-                                 f"{wait_time:.2f} 秒后重试...")
-                    
-                    time.sleep(wait_time)
-                    retry_delay *= backoff
-                    
-            raise last_exception
-        return wrapper
-    return decorator
-
 class DailyBasicCollector:
     def __init__(self, db_params: dict):
         self.db_params = db_params
@@ -64,7 +39,7 @@ class DailyBasicCollector:
         self.pro = get_pro_client(tushare_token)
         
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def init_table(self):
         """初始化数据表"""
@@ -98,33 +73,59 @@ class DailyBasicCollector:
                 conn.commit()
                 logger.info("数据表初始化完成")
 
-    @retry_on_exception(retries=3, delay=5, backoff=2)
     def get_stock_list(self) -> List[str]:
-        """获取股票列表"""
+        """获取股票列表（证券主数据中当前上市的全部股票）"""
         try:
-            df = python_fetch('stock_basic', pro=self.pro, 
-                exchange='',
-                list_status='L',
-                fields='ts_code'
-            )
-            return df['ts_code'].tolist()
+            return get_security_master(self.db_params).universe(boards=ALL_BOARDS)
         except Exception as e:
             logger.error(f"获取股票列表失败: {str(e)}")
             return []
 
-    def get_latest_trade_date(self, ts_code: str) -> Optional[datetime]:
-        """获取最新交易日期"""
+    def load_watermarks(self) -> WatermarkStore:
+        """一次分组查询加载全部 ts_code 的最新交易日期"""
+        store = WatermarkStore(self.table_name, key_columns=('ts_code',))
+        with self.get_db_connection() as conn:
+            store.load(conn)
+        logger.info(f"已加载 {len(store)} 个水位")
+        return store
+
+    def get_table_watermark(self) -> Optional[datetime]:
+        """获取整表最新交易日期"""
         with self.get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(f"""
-                    SELECT trade_date 
-                    FROM {self.table_name}
-                    WHERE ts_code = %s
-                    ORDER BY trade_date DESC
-                    LIMIT 1
-                """, (ts_code,))
+                cur.execute(f"SELECT MAX(trade_date) FROM {self.table_name}")
                 result = cur.fetchone()
-                return result[0] if result else None
+                return result[0] if result and result[0] else None
+
+    @retry_on_exception(retries=3, delay=5, backoff=2)
+    def fetch_data_by_trade_date(self, trade_date: str) -> pd.DataFrame:
+        """按交易日获取全市场每日基本面指标"""
+        return python_fetch('daily_basic', pro=self.pro, trade_date=trade_date)
+
+    def collect_by_trade_date(self, start_date: str, end_date: str, mode: str = 'incremental'):
+        """按交易日横截面采集，每个缺失交易日一次接口调用"""
+        if mode == 'incremental':
+            latest_date = self.get_table_watermark()
+            if latest_date:
+                start_date = max(start_date, (latest_date + timedelta(days=1)).strftime('%Y%m%d'))
+        trade_dates = get_open_trade_dates(start_date, end_date, pro=self.pro)
+        if not trade_dates:
+            logger.info(f"{start_date} ~ {end_date} 无待补交易日")
+            return
+        logger.info(f"按交易日采集：{len(trade_dates)} 个交易日 ({trade_dates[0]} ~ {trade_dates[-1]})")
+        success_count = 0
+        for idx, trade_date in enumerate(trade_dates, 1):
+            try:
+                df = self.fetch_data_by_trade_date(trade_date)
+                if df is None or df.empty:
+                    logger.warning(f"{trade_date}: 无数据")
+                    continue
+                self.save_to_db(self.process_data(df))
+                success_count += 1
+                logger.info(f"Progress: {idx}/{len(trade_dates)} - {trade_date} 保存 {len(df)} 条")
+            except Exception as e:
+                logger.error(f"{trade_date}: 处理失败: {str(e)}")
+        logger.info(f"按交易日采集完成，成功 {success_count}/{len(trade_dates)} 个交易日")
 
     @retry_on_exception(retries=3, delay=5, backoff=2)
     def fetch_data(self, ts_code: str, start_date: str, end_date: str) -> pd.DataFrame:
@@ -146,93 +147,33 @@ class DailyBasicCollector:
         
         return df
 
+    def dataset_config(self, fetch_workers: int = 4) -> DatasetConfig:
+        """逐只股票采集的流水线配置"""
+        return DatasetConfig(
+            name='daily_basic',
+            table_name=self.table_name,
+            pk_columns=['ts_code', 'trade_date'],
+            fetch=self.fetch_data,
+            transform=self.process_data,
+            fetch_workers=fetch_workers,
+            skip_unchanged=True,
+        )
+
     def save_to_db(self, df: pd.DataFrame):
         """保存数据到数据库"""
         if df.empty:
             return
             
         with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                columns = df.columns.tolist()
-                values = [tuple(x) for x in df.values]
-                
-                insert_stmt = f"""
-                    INSERT INTO {self.table_name} ({','.join(columns)})
-                    VALUES %s
-                    ON CONFLICT (ts_code, trade_date)
-                    DO UPDATE SET
-                    {','.join(f"{col}=EXCLUDED.{col}" for col in columns 
-                             if col not in ['ts_code', 'trade_date'])}
-                """
-                
-                try:
-                    execute_values(cur, insert_stmt, values)
-                    conn.commit()
-                    logger.info(f"成功保存 {len(df)} 条记录")
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"保存数据失败: {str(e)}")
-                    raise
-
-def process_stock_batch(db_params: Dict, stock_batch: List[str], 
-                       batch_id: int, start_date: str, end_date: str, mode: str):
-    """处理一批股票的数据采集"""
-    if not stock_batch:
-        logger.warning(f"Batch {batch_id}: Empty stock batch, skipping")
-        return
-        
-    try:
-        collector = DailyBasicCollector(db_params)
-        total_stocks = len(stock_batch)
-        
-        logger.info(f"Batch {batch_id}: Starting processing {total_stocks} stocks")
-        
-        success_count = 0
-        error_count = 0
-        
-        for idx, ts_code in enumerate(stock_batch, 1):
             try:
-                # 随机延时1-3秒，避免请求过于频繁
-                time.sleep(random.uniform(1, 3))
-                
-                # 如果是增量模式，获取最新数据日期
-                if mode == 'incremental':
-                    latest_date = collector.get_latest_trade_date(ts_code)
-                    if latest_date:
-                        start_date = (latest_date + timedelta(days=1)).strftime('%Y%m%d')
-                
-                # 获取数据
-                df = collector.fetch_data(ts_code, start_date, end_date)
-                
-                if df is not None and not df.empty:
-                    df = collector.process_data(df)
-                    collector.save_to_db(df)
-                    
-                    success_count += 1
-                    logger.info(f"Batch {batch_id} Progress: {idx}/{total_stocks} "
-                              f"- Successfully processed {ts_code}")
-                else:
-                    logger.warning(f"Batch {batch_id}: No data available for {ts_code}")
-                
+                stats = copy_upsert_changed(conn, df, self.table_name, pk_columns=['ts_code', 'trade_date'])
+                conn.commit()
+                logger.info(f"成功保存 {len(df)} 条记录：新增 {stats.inserted}，更新 {stats.updated}，"
+                            f"未变化 {stats.unchanged}")
             except Exception as e:
-                error_count += 1
-                logger.error(f"Batch {batch_id}: Error processing {ts_code}: {str(e)}")
-                continue
-                
-        logger.info(f"Batch {batch_id} completed. Success: {success_count}, Errors: {error_count}")
-        
-    except Exception as e:
-        logger.error(f"Batch {batch_id}: Fatal error in batch processing: {str(e)}")
-
-def chunks(lst: List, n: int) -> List[List]:
-    """将列表分割成n个大致相等的块"""
-    if not lst:
-        return []
-    
-    size = len(lst)
-    chunk_size = (size + n - 1) // n
-    
-    return [lst[i:i + chunk_size] for i in range(0, size, chunk_size)]
+                conn.rollback()
+                logger.error(f"保存数据失败: {str(e)}")
+                raise
 
 def main():
     parser = argparse.ArgumentParser(description='股票每日基本面指标数据采集工具')
@@ -246,7 +187,7 @@ def main():
         '--processes',
         type=int,
         default=10,
-        help='并行进程数'
+        help='并发拉取线程数'
     )
     parser.add_argument(
         '--start_date',
@@ -260,6 +201,11 @@ def main():
         default=datetime.now().strftime('%Y%m%d'),
         help='结束日期 (YYYYMMDD)'
     )
+    parser.add_argument(
+        '--by-date',
+        action='store_true',
+        help='按交易日拉取全市场横截面（每个缺失交易日一次调用），替代逐只股票循环'
+    )
     
     try:
         args = parser.parse_args()
@@ -280,6 +226,11 @@ def main():
         collector = DailyBasicCollector(db_params)
         collector.init_table()
         
+        if args.by_date:
+            logger.info(f"开始{args.mode}模式的按交易日采集...")
+            collector.collect_by_trade_date(args.start_date, args.end_date, args.mode)
+            return
+        
         # 获取股票列表
         stocks = collector.get_stock_list()
         total_stocks = len(stocks)
@@ -288,32 +239,11 @@ def main():
             logger.error("没有获取到股票列表，无法进行数据采集")
             return
         
-        # 调整进程数
-        num_processes = min(args.processes, total_stocks)
-        
-        logger.info(f"开始{args.mode}模式的并行数据采集（使用 {num_processes} 个进程）...")
-        
-        # 将股票列表分成多个批次
-        stock_batches = chunks(stocks, num_processes)
-        
-        # 创建任务列表
-        tasks = []
-        for i, batch in enumerate(stock_batches):
-            if batch:
-                tasks.append((
-                    db_params, 
-                    batch, 
-                    i, 
-                    args.start_date, 
-                    args.end_date, 
-                    args.mode
-                ))
-        
-        # 创建进程池执行任务
-        with multiprocessing.Pool(processes=num_processes) as pool:
-            pool.starmap(process_stock_batch, tasks)
-            
-        logger.info("所有批次处理完成")
+        # 流水线：多线程拉取 -> 合并批次向量化清洗 -> COPY 批量写入，I/O 与入库重叠
+        num_workers = min(args.processes, total_stocks)
+        logger.info(f"开始{args.mode}模式的流水线采集（{num_workers} 个拉取线程）...")
+        pipeline = PipelineCollector(collector.dataset_config(num_workers), db_params)
+        pipeline.run(stocks, args.start_date, args.end_date, mode=args.mode)
         
     except KeyboardInterrupt:
         logger.info("程序被用户中断")
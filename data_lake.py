@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""
+核心行情表的本地 parquet 镜像：stock_history、daily_basic 按月分区、zstd 压缩导出到 LAKE_DIR，
+研究脚本整表/全市场读取时走本地列式文件，不再通过局域网逐行拉 PostgreSQL。
+
+目录结构（stock_history 额外按 adjust_type 分目录，不复权记为 none）：
+    LAKE_DIR/stock_history/adjust_type=hfq/2024-01.parquet
+    LAKE_DIR/daily_basic/2024-01.parquet
+    LAKE_DIR/<dataset>/_manifest.json       # 分区 -> 行数、各列 min/max、导出时间
+
+增量导出（每日收盘采集完成后）：
+    python data_lake.py                      # 全部数据集，从清单里最后一个月开始重导
+    python data_lake.py --dataset daily_basic --since 2024-01-01
+    python data_lake.py --verify             # 按月比对库与清单行数，重导不一致的分区
+
+读取（按清单的日期/分区裁剪文件，文件内按行组统计过滤，多线程并行）：
+    df = read_lake('stock_history', columns=['trade_date', 'symbol', 'close'],
+                   start='2020-01-01', end='2024-12-31', split='hfq')
+    close = load_panel('stock_history', 'close', '2020-01-01', split='hfq')   # trade_date × symbol
+
+分区内按 (trade_date, key) 排序写入，行组的 trade_date 统计紧凑，按日期过滤可跳过大部分行组。
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from db_pool import pooled_connection
+from schema_registry import get_columns
+
+logger = logging.getLogger(__name__)
+
+LAKE_DIR = os.getenv('DATA_LAKE_DIR', os.path.join(os.path.expanduser('~'), 'data_lake'))
+MANIFEST_NAME = '_manifest.json'
+COMPRESSION = 'zstd'
+ROW_GROUP_SIZE = 100_000
+READ_WORKERS = min(16, (os.cpu_count() or 4) * 2)
+# 不镜像的列
+SKIP_COLUMNS = ('update_time',)
+
+_NUMERIC_TYPES = ('numeric', 'double precision', 'real', 'bigint', 'integer', 'smallint')
+
+
+@dataclass(frozen=True)
+class LakeDataset:
+    name: str
+    date_column: str = 'trade_date'
+    key_column: str = 'symbol'
+    split_column: Optional[str] = None    # 额外的目录级分区列（如 adjust_type）
+
+
+DATASETS: Dict[str, LakeDataset] = {
+    'stock_history': LakeDataset('stock_history', key_column='symbol', split_column='adjust_type'),
+    'daily_basic': LakeDataset('daily_basic', key_column='ts_code'),
+}
+
+_manifest_lock = threading.Lock()
+
+
+# ---------- 路径与清单 ----------
+def _split_dir(value) -> str:
+    return str(value) if value not in (None, '') else 'none'
+
+
+def _partition_key(ds: LakeDataset, month: str, split=None) -> str:
+    if ds.split_column:
+        return f"{ds.split_column}={_split_dir(split)}/{month}"
+    return month
+
+
+def _dataset_dir(ds: LakeDataset, lake_dir: str) -> str:
+    return os.path.join(lake_dir, ds.name)
+
+
+def load_manifest(dataset: str, lake_dir: str = LAKE_DIR) -> Dict[str, dict]:
+    """{分区: {'rows', 'min', 'max', 'bytes', 'exported_at'}}，没有清单时返回空字典"""
+    path = os.path.join(_dataset_dir(DATASETS[dataset], lake_dir), MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['partitions']
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+def _write_manifest(ds: LakeDataset, lake_dir: str, partitions: Dict[str, dict]):
+    path = os.path.join(_dataset_dir(ds, lake_dir), MANIFEST_NAME)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    body = {'dataset': ds.name, 'date_column': ds.date_column, 'key_column': ds.key_column,
+            'split_column': ds.split_column, 'partitions': dict(sorted(partitions.items()))}
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(body, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def lake_max_date(dataset: str, split=None, lake_dir: str = LAKE_DIR) -> Optional[str]:
+    """清单中（指定 split 的）最大日期 YYYY-MM-DD，没有清单时返回 None"""
+    ds = DATASETS[dataset]
+    partitions = load_manifest(dataset, lake_dir)
+    if ds.split_column and split is not None:
+        wanted = f"{ds.split_column}={_split_dir(split)}"
+        partitions = {k: v for k, v in partitions.items() if k.split('/', 1)[0] == wanted}
+    dates = [v['max'].get(ds.date_column) for v in partitions.values()]
+    dates = [d for d in dates if d is not None]
+    return max(dates) if dates else None
+
+
+def lake_available(dataset: str, end=None, split=None, lake_dir: str = LAKE_DIR) -> bool:
+    """
+    镜像可用于读取 [.., end]：有清单，且清单最大日期不早于 end（end 为空时只看清单是否存在）
+    镜像落后时告警并返回 False，调用方回退到 PostgreSQL，避免漏导出后静默读到旧行情
+    """
+    covered = lake_max_date(dataset, split=split, lake_dir=lake_dir)
+    if covered is None:
+        return False
+    if end is not None and covered < pd.Timestamp(end).strftime('%Y-%m-%d'):
+        logger.warning(f"{dataset} 本地镜像只到 {covered}，早于所需的 {pd.Timestamp(end):%Y-%m-%d}，"
+                       f"改读数据库；请运行 python data_lake.py --dataset {dataset} 补导出")
+        return False
+    return True
+
+
+# ---------- 导出 ----------
+def _stats_value(v):
+    if v is None or pd.isna(v):
+        return None
+    if isinstance(v, (pd.Timestamp, date)):
+        return pd.Timestamp(v).strftime('%Y-%m-%d')
+    return v.item() if hasattr(v, 'item') else v
+
+
+def _partition_stats(df: pd.DataFrame) -> tuple:
+    lo, hi = {}, {}
+    for col in df.columns:
+        s = df[col].dropna()
+        if s.empty or not (pd.api.types.is_numeric_dtype(s) or pd.api.types.is_datetime64_any_dtype(s)
+                           or s.dtype == object):
+            continue
+        try:
+            lo[col], hi[col] = _stats_value(s.min()), _stats_value(s.max())
+        except TypeError:
+            continue
+    return lo, hi
+
+
+def _read_month(conn, ds: LakeDataset, month: str) -> pd.DataFrame:
+    """COPY 导出一个月的数据，按表结构还原类型"""
+    column_types = {c: t for c, t in get_columns(conn, ds.name).items() if c not in SKIP_COLUMNS}
+    columns = list(column_types)
+    start = pd.Period(month, 'M').start_time.date()
+    end = pd.Period(month, 'M').end_time.date()
+    buf = io.StringIO()
+    with conn.cursor() as cur:
+        sql = cur.mogrify(
+            f"COPY (SELECT {', '.join(columns)} FROM {ds.name} "
+            f"WHERE {ds.date_column} BETWEEN %s AND %s) TO STDOUT WITH (FORMAT csv, HEADER)",
+            (start, end)).decode()
+        cur.copy_expert(sql, buf)
+    buf.seek(0)
+    str_cols = [c for c, t in column_types.items() if t not in _NUMERIC_TYPES and t != 'date']
+    df = pd.read_csv(buf, dtype={c: str for c in str_cols}, keep_default_na=False,
+                     na_values={c: [''] for c in columns if c not in str_cols})
+    for c, t in column_types.items():
+        if t == 'date':
+            df[c] = pd.to_datetime(df[c])
+        elif t in _NUMERIC_TYPES:
+            df[c] = pd.to_numeric(df[c], errors='coerce')
+    return df
+
+
+def _write_partition(ds: LakeDataset, lake_dir: str, key: str, df: pd.DataFrame) -> dict:
+    path = os.path.join(_dataset_dir(ds, lake_dir), f'{key}.parquet')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df = df.sort_values([ds.date_column, ds.key_column]).reset_index(drop=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp,
+                   compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE, write_statistics=True)
+    os.replace(tmp, path)
+    lo, hi = _partition_stats(df)
+    return {'rows': len(df), 'min': lo, 'max': hi, 'bytes': os.path.getsize(path),
+            'exported_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def export_month(db_params, dataset: str, month: str, lake_dir: str = LAKE_DIR) -> int:
+    """导出（覆盖）一个月的全部分区，返回行数"""
+    ds = DATASETS[dataset]
+    with pooled_connection(db_params) as conn:
+        df = _read_month(conn, ds, month)
+
+    entries = {}
+    if ds.split_column:
+        groups = df.groupby(df[ds.split_column].fillna(''), sort=False) if not df.empty else []
+        for split, part in groups:
+            key = _partition_key(ds, month, split)
+            entries[key] = _write_partition(ds, lake_dir, key, part)
+    elif not df.empty:
+        entries[month] = _write_partition(ds, lake_dir, month, df)
+
+    with _manifest_lock:
+        partitions = load_manifest(dataset, lake_dir)
+        # 库里已经没有的分区（例如整月数据被删除）一并从镜像中去掉
+        for key in [k for k in partitions if k.rsplit('/', 1)[-1] == month and k not in entries]:
+            partitions.pop(key)
+            try:
+                os.remove(os.path.join(_dataset_dir(ds, lake_dir), f'{key}.parquet'))
+            except OSError:
+                pass
+        partitions.update(entries)
+        os.makedirs(_dataset_dir(ds, lake_dir), exist_ok=True)
+        _write_manifest(ds, lake_dir, partitions)
+    logger.info(f"{dataset} {month}: 导出 {len(df)} 行，{len(entries)} 个分区")
+    return len(df)
+
+
+def _db_month_counts(db_params, ds: LakeDataset) -> Dict[str, int]:
+    with pooled_connection(db_params) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT TO_CHAR({ds.date_column}, 'YYYY-MM') AS m, COUNT(*)
+                FROM {ds.name} GROUP BY 1
+            """)
+            return dict(cur.fetchall())
+
+
+def plan_months(db_params, dataset: str, since=None, verify: bool = False,
+                lake_dir: str = LAKE_DIR) -> List[str]:
+    """
+    需要（重新）导出的月份：
+    - since 指定时取 since 所在月份及之后
+    - 否则从清单中最后一个月开始（当月可能只导出了一部分交易日）；清单为空时全量
+    - verify=True 时再加上库中行数与清单不一致的月份
+    """
+    ds = DATASETS[dataset]
+    db_counts = _db_month_counts(db_params, ds)
+    partitions = load_manifest(dataset, lake_dir)
+    lake_counts: Dict[str, int] = {}
+    for key, entry in partitions.items():
+        month = key.rsplit('/', 1)[-1]
+        lake_counts[month] = lake_counts.get(month, 0) + entry['rows']
+
+    if since is not None:
+        first = pd.Timestamp(since).strftime('%Y-%m')
+    elif lake_counts:
+        first = max(lake_counts)
+    else:
+        first = ''
+    months = {m for m in db_counts if m >= first}
+    if verify:
+        months |= {m for m, n in db_counts.items() if lake_counts.get(m) != n}
+        months |= {m for m in lake_counts if m not in db_counts}
+    return sorted(months)
+
+
+def export_dataset(db_params, dataset: str, since=None, verify: bool = False,
+                   lake_dir: str = LAKE_DIR, workers: int = 4) -> int:
+    """增量导出一个数据集，返回导出的行数；各月份并行导出"""
+    months = plan_months(db_params, dataset, since, verify, lake_dir)
+    if not months:
+        logger.info(f"{dataset}: 镜像已是最新")
+        return 0
+    logger.info(f"{dataset}: 需要导出 {len(months)} 个月 ({months[0]} ~ {months[-1]})")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        total = sum(pool.map(lambda m: export_month(db_params, dataset, m, lake_dir), months))
+    logger.info(f"{dataset}: 导出完成，共 {total} 行")
+    return total
+
+
+# ---------- 读取 ----------
+def _prune(ds: LakeDataset, partitions: Dict[str, dict], start, end, split) -> List[str]:
+    start = pd.Timestamp(start).strftime('%Y-%m-%d') if start is not None else None
+    end = pd.Timestamp(end).strftime('%Y-%m-%d') if end is not None else None
+    if ds.split_column and split is not None:
+        wanted = {f"{ds.split_column}={_split_dir(s)}" for s in ([split] if isinstance(split, str) else split)}
+    else:
+        wanted = None
+    keys = []
+    for key, entry in partitions.items():
+        if wanted is not None and key.split('/', 1)[0] not in wanted:
+            continue
+        lo = entry['min'].get(ds.date_column)
+        hi = entry['max'].get(ds.date_column)
+        if start is not None and hi is not None and hi < start:
+            continue
+        if end is not None and lo is not None and lo > end:
+            continue
+        keys.append(key)
+    return sorted(keys)
+
+
+def read_lake(dataset: str, columns: Optional[Sequence[str]] = None, start=None, end=None,
+              symbols: Optional[Sequence[str]] = None, split=None,
+              lake_dir: str = LAKE_DIR, workers: int = READ_WORKERS) -> pd.DataFrame:
+    """
+    从镜像读取 dataset
+    - columns: 只读这些列（列裁剪）；日期列、键列会按需附带用于过滤
+    - start / end: 日期闭区间，先按清单 min/max 裁剪分区，再在文件内按行组统计过滤
+    - symbols: 只要这些代码（dataset 的 key_column）
+    - split: stock_history 的 adjust_type（'hfq' / 'qfq' / '' 或其列表），None 表示全部
+    """
+    ds = DATASETS[dataset]
+    partitions = load_manifest(dataset, lake_dir)
+    if not partitions:
+        raise FileNotFoundError(f"{dataset} 尚未导出到 {lake_dir}，请先运行 python data_lake.py")
+    keys = _prune(ds, partitions, start, end, split)
+
+    filters = []
+    if start is not None:
+        filters.append((ds.date_column, '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append((ds.date_column, '<=', pd.Timestamp(end)))
+    if symbols is not None:
+        filters.append((ds.key_column, 'in', list(symbols)))
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys(list(columns) + [c for c, *_ in filters]))
+
+    def _read(key: str) -> pd.DataFrame:
+        path = os.path.join(_dataset_dir(ds, lake_dir), f'{key}.parquet')
+        return pq.read_table(path, columns=read_columns, filters=filters or None,
+                             use_threads=False).to_pandas()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        frames = [f for f in pool.map(_read, keys) if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=list(columns) if columns is not None else [])
+    df = pd.concat(frames, ignore_index=True)
+    if columns is not None:
+        df = df[list(columns)]
+    logger.info(f"{dataset}: 读取 {len(keys)}/{len(partitions)} 个分区，{len(df)} 行")
+    return df
+
+
+def load_panel(dataset: str, value_column: str, start=None, end=None,
+               symbols: Optional[Sequence[str]] = None, split=None,
+               lake_dir: str = LAKE_DIR) -> pd.DataFrame:
+    """全市场面板：index 为日期，columns 为代码，值为 value_column"""
+    ds = DATASETS[dataset]
+    df = read_lake(dataset, [ds.date_column, ds.key_column, value_column], start, end,
+                   symbols, split, lake_dir)
+    return df.pivot_table(index=ds.date_column, columns=ds.key_column,
+                          values=value_column, aggfunc='last').sort_index()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='核心行情表的 parquet 镜像导出')
+    parser.add_argument('--dataset', choices=sorted(DATASETS), action='append',
+                        help='只导出指定数据集，可重复；缺省为全部')
+    parser.add_argument('--since', type=str, default=None, help='从该日期所在月份开始重导')
+    parser.add_argument('--verify', action='store_true', help='按月比对行数，重导不一致的分区')
+    parser.add_argument('--lake-dir', type=str, default=LAKE_DIR, help='镜像目录')
+    parser.add_argument('--workers', type=int, default=4, help='并行导出的月份数')
+    args = parser.parse_args()
+
+    from double_single_growth_selector import load_db_config
+    db_config = load_db_config()
+    for dataset in args.dataset or sorted(DATASETS):
+        export_dataset(db_config, dataset, args.since, args.verify, args.lake_dir, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+进程级数据库连接池，供采集器 / 选股器共用。
+
+- pooled_connection(db_params): 上下文管理器，从池中借出 psycopg2 连接，
+  正常退出 commit、异常 rollback，最后归还（替代每次 psycopg2.connect）
+- acquire_connection / release_connection: 长期持有连接的场景（选股器 connect/disconnect）
+- 池满时借连接的线程阻塞等待归还（最多 POOL_WAIT_SECONDS 秒），而不是像 psycopg2 原生池那样直接抛 PoolError，
+  线程数多于 POOL_MAX_CONN 的调用方（导出、并发抓取）无需自行限流
+- get_engine(dsn): 按 DSN 缓存的 SQLAlchemy Engine（替代每次 create_engine）
+
+fork 安全：池按 PID 隔离。multiprocessing.Pool 子进程第一次使用时会丢弃从父进程继承的池
+（不关闭父进程的 socket），重新建立自己的连接。
+"""
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+# 每个进程最多保持的连接数（collector 进程内基本是串行使用，2~4 足够）
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = int(os.getenv('DB_POOL_MAX_CONN', '4'))
+# 池满时借连接最多等待的秒数；超时仍抛 PoolError，避免同一线程嵌套借连接时无限死等
+POOL_WAIT_SECONDS = float(os.getenv('DB_POOL_WAIT_SECONDS', '300'))
+
+
+class BlockingConnectionPool(pg_pool.ThreadedConnectionPool):
+    """借满 maxconn 后 getconn 阻塞等待其他线程归还"""
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=POOL_WAIT_SECONDS):
+            raise pg_pool.PoolError(f"等待数据库连接超时（{POOL_WAIT_SECONDS:.0f}s，池上限 {self.maxconn}）")
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+_lock = threading.Lock()
+_pools: Dict[tuple, BlockingConnectionPool] = {}
+_engines: Dict[str, object] = {}
+_owner_pid = os.getpid()
+
+
+def _reset_after_fork():
+    """子进程中丢弃继承来的池和引擎，不关闭父进程的连接"""
+    global _lock, _owner_pid
+    _lock = threading.Lock()
+    _pools.clear()
+    _engines.clear()
+    _owner_pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _check_pid():
+    # spawn/forkserver 或不支持 register_at_fork 的平台上的兜底
+    if os.getpid() != _owner_pid:
+        _reset_after_fork()
+
+
+def _pool_key(db_params) -> tuple:
+    if isinstance(db_params, str):
+        return ('dsn', db_params)
+    return tuple(sorted((k, str(v)) for k, v in db_params.items()))
+
+
+def get_pool(db_params) -> BlockingConnectionPool:
+    """db_params 可以是 psycopg2.connect 的关键字参数 dict，也可以是 DSN 字符串"""
+    _check_pid()
+    key = _pool_key(db_params)
+    pool = _pools.get(key)
+    if pool is None:
+        with _lock:
+            pool = _pools.get(key)
+            if pool is None:
+                if isinstance(db_params, str):
+                    pool = BlockingConnectionPool(POOL_MIN_CONN, POOL_MAX_CONN, db_params)
+                else:
+                    pool = BlockingConnectionPool(POOL_MIN_CONN, POOL_MAX_CONN, **db_params)
+                _pools[key] = pool
+    return pool
+
+
+def acquire_connection(db_params):
+    """借出连接；用完必须 release_connection 归还"""
+    pool = get_pool(db_params)
+    conn = pool.getconn()
+    if conn.closed:
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    return conn
+
+
+def release_connection(db_params, conn):
+    """归还连接；未提交的事务会被回滚，已断开的连接直接丢弃"""
+    if conn is None:
+        return
+    pool = _pools.get(_pool_key(db_params))
+    if pool is None or os.getpid() != _owner_pid:
+        # 池已因 fork 重置，连接不属于当前进程的池
+        if not conn.closed:
+            conn.close()
+        return
+    broken = bool(conn.closed)
+    if not broken:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    pool.putconn(conn, close=broken)
+
+
+@contextmanager
+def pooled_connection(db_params):
+    """with pooled_connection(db_params) as conn: ... 正常退出自动 commit"""
+    conn = acquire_connection(db_params)
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        release_connection(db_params, conn)
+
+
+def get_engine(dsn: Optional[str] = None, **kwargs):
+    """按 DSN 缓存 SQLAlchemy Engine（自带连接池，pool_pre_ping 兜底断线）"""
+    from sqlalchemy import create_engine
+
+    _check_pid()
+    dsn = dsn or os.getenv('DB_DSN1')
+    if not dsn:
+        raise ValueError("环境变量 DB_DSN1 未设置")
+    engine = _engines.get(dsn)
+    if engine is None:
+        with _lock:
+            engine = _engines.get(dsn)
+            if engine is None:
+                engine = create_engine(dsn, pool_pre_ping=True, **kwargs)
+                _engines[dsn] = engine
+    return engine
@@ -1,17 +1,19 @@
 import akshare as ak
 import pandas as pd
 import psycopg2
+from db_pool import pooled_connection
 from psycopg2.extras import execute_values
 import logging
 from typing import List, Dict, Optional
 import time
-import random
 import multiprocessing
 import argparse
 import sys
 from datetime import datetime, timedelta
-from functools import wraps
 import threading
+from resilience import EASTMONEY, retry_on_exception
+from board_membership import (MEMBERSHIP_TABLE, QUOTES_TABLE, apply_snapshot, init_membership_table,
+                              init_quotes_table, migrate_snapshots, save_quotes)
 
 # 设置日志
 logging.basicConfig(
@@ -24,41 +26,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def retry_on_exception(retries=3, delay=5, backoff=2, exceptions=(Exception,)):
-    """重试装饰器"""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            retry_delay = delay
-            last_exception = None
-            
-            for retry in range(retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except exceptions as e:
-                    last_exception = e
-                    if retry == retries:
-                        raise last_exception
-                    
-                    wait_time = retry_delay + random.uniform(0, 1)
-                    logger.warning(f"尝试 {retry + 1}/{retries + 1} 失败: {str(e)}. "
-                                 f"{wait_time:.2f} 秒后重试...")
-                    
-                    time.sleep(wait_time)
-                    retry_delay *= backoff
-                    
-            raise last_exception
-        return wrapper
-    return decorator
 
 class IndustryBoardCollector:
     def __init__(self, db_params: dict):
         self.db_params = db_params
         self.board_table = 'industry_board_info'
+        # 旧的全量快照表，仅作为 --migrate 的数据来源
         self.member_table = 'industry_board_members'
+        # 成分关系拉链表 + 成分股行情表
+        self.membership_table = MEMBERSHIP_TABLE
+        self.quotes_table = QUOTES_TABLE
         
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def init_tables(self):
         """初始化数据表"""
@@ -82,32 +62,6 @@ class IndustryBoardCollector:
         )
         """
         
-        # 行业板块成分股表
-        member_table_sql = f"""
-        CREATE TABLE IF NOT EXISTS {self.member_table} (
-            update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            板块代码 VARCHAR(20),
-            板块名称 VARCHAR(100),
-            序号 INTEGER,
-            代码 VARCHAR(20),
-            名称 VARCHAR(100),
-            最新价 DECIMAL(15,4),
-            涨跌幅 DECIMAL(10,4),
-            涨跌额 DECIMAL(15,4),
-            成交量 DECIMAL(20,2),
-            成交额 DECIMAL(20,2),
-            振幅 DECIMAL(10,4),
-            最高 DECIMAL(15,4),
-            最低 DECIMAL(15,4),
-            今开 DECIMAL(15,4),
-            昨收 DECIMAL(15,4),
-            换手率 DECIMAL(10,4),
-            市盈率_动态 DECIMAL(15,4),
-            市净率 DECIMAL(10,4),
-            PRIMARY KEY (update_time, 板块代码, 代码)
-        )
-        """
-        
         with self.get_db_connection() as conn:
             with conn.cursor() as cur:
                 # 检查行业板块表
@@ -125,25 +79,14 @@ class IndustryBoardCollector:
                 else:
                     logger.info(f"行业板块表 {self.board_table} 已存在")
                 
-                # 检查成分股表
-                cur.execute(f"""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables 
-                        WHERE table_name = '{self.member_table}'
-                    )
-                """)
-                member_exists = cur.fetchone()[0]
-                
-                if not member_exists:
-                    cur.execute(member_table_sql)
-                    logger.info(f"创建成分股表 {self.member_table}")
-                else:
-                    logger.info(f"成分股表 {self.member_table} 已存在")
+                # 成分股：拉链表 + 行情表
+                init_membership_table(conn, self.membership_table)
+                init_quotes_table(conn, self.quotes_table)
                 
                 conn.commit()
                 logger.info("数据表初始化完成")
 
-    @retry_on_exception(retries=3, delay=5, backoff=2)
+    @retry_on_exception(retries=3, delay=5, backoff=2, upstream=EASTMONEY)
     def fetch_industry_board_data(self) -> pd.DataFrame:
         """获取行业板块数据"""
         try:
@@ -155,7 +98,7 @@ class IndustryBoardCollector:
             logger.error(f"获取行业板块数据失败: {str(e)}")
             raise
 
-    @retry_on_exception(retries=3, delay=5, backoff=2)
+    @retry_on_exception(retries=3, delay=5, backoff=2, upstream=EASTMONEY)
     def fetch_industry_members_data(self, symbol: str) -> pd.DataFrame:
         """获取指定行业板块的成分股数据"""
         try:
@@ -227,31 +170,33 @@ class IndustryBoardCollector:
                     raise
 
     def save_member_data(self, df: pd.DataFrame):
-        """保存成分股数据到数据库"""
+        """成分关系只写变化（拉链表），行情按 (交易日, 代码) 写入行情表"""
         if df.empty:
             return
-            
+        
+        as_of = df['update_time'].max().date()
+        snapshot = df.rename(columns={
+            '板块代码': 'board_code',
+            '代码': 'symbol',
+            '板块名称': 'board_name',
+            '名称': 'stock_name',
+        })
         with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                try:
-                    # 获取列名
-                    columns = df.columns.tolist()
-                    values = [tuple(x) for x in df.values]
-                    
-                    # 直接插入数据（每次运行都是新的时间戳）
-                    insert_sql = f"""
-                        INSERT INTO {self.member_table} ({','.join(columns)}) 
-                        VALUES %s
-                    """
-                    execute_values(cur, insert_sql, values)
-                    
-                    conn.commit()
-                    logger.info(f"成功保存成分股数据 {len(df)} 条记录")
-                    
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"保存成分股数据失败: {str(e)}")
-                    raise
+            try:
+                opened, closed = apply_snapshot(conn, snapshot, as_of, self.membership_table)
+                quotes = save_quotes(conn, df, as_of, self.quotes_table)
+                conn.commit()
+                logger.info(f"成分股快照 {len(df)} 条：新增成分 {opened}，调出 {closed}，行情 {quotes} 条")
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"保存成分股数据失败: {str(e)}")
+                raise
+
+    def migrate_member_snapshots(self):
+        """把旧快照表 industry_board_members 转成拉链表（只需运行一次）"""
+        with self.get_db_connection() as conn:
+            migrate_snapshots(conn, self.member_table, self.membership_table)
+            conn.commit()
 
     def collect_all_data(self, include_members: bool = True):
         """采集所有行业板块数据"""
@@ -354,6 +299,11 @@ def main():
         default=1,
         help='并行进程数（用于采集成分股）'
     )
+    parser.add_argument(
+        '--migrate',
+        action='store_true',
+        help='把旧快照表 industry_board_members 转换为成分股拉链表后退出'
+    )
     parser.add_argument(
         '--interval',
         type=int,
@@ -376,6 +326,12 @@ def main():
         'database': 'Financialdata'
     }
     
+    if args.migrate:
+        collector = IndustryBoardCollector(db_params)
+        collector.init_tables()
+        collector.migrate_member_snapshots()
+        return
+
     def run_collection():
         try:
             collector = IndustryBoardCollector(db_params)
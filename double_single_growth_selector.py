@@ -22,8 +22,8 @@
 
 import pandas as pd
 import numpy as np
-import pywencai
 import psycopg2
+from db_pool import acquire_connection, release_connection
 from psycopg2.extras import RealDictCursor
 from datetime import datetime
 from dataclasses import dataclass, field
@@ -33,6 +33,8 @@ import argparse
 import os
 from urllib.parse import urlparse
 from dotenv import load_dotenv
+from concept_store import get_concept_store
+from mainbz_store import latest_main_business
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -88,16 +90,16 @@ class DoubleSingleGrowthSelector:
     def __init__(self, db_config: Dict):
         self.db_config = db_config
         self.conn = None
-        self._tushare_pro = None
 
     # --- 数据库连接 ---
     def connect(self):
-        self.conn = psycopg2.connect(**self.db_config)
+        self.conn = acquire_connection(self.db_config)
         logger.info("数据库连接成功")
 
     def disconnect(self):
         if self.conn:
-            self.conn.close()
+            release_connection(self.db_config, self.conn)
+            self.conn = None
             logger.info("数据库连接已关闭")
 
     def get_latest_trade_date(self) -> Optional[str]:
@@ -524,156 +526,25 @@ class DoubleSingleGrowthSelector:
     # -----------------------------------------------------------------------
     # 选股主入口
     # -----------------------------------------------------------------------
-    def _get_tushare_pro(self):
-        """懒加载 tushare pro api"""
-        if self._tushare_pro is None:
-            tushare_token = os.getenv('TUSHARE') or os.getenv('TUSHARE_TOKEN')
-            if tushare_token:
-                import tushare as ts
-                self._tushare_pro = ts.pro_api(tushare_token)
-                logger.info("Tushare Pro 客户端初始化成功")
-            else:
-                logger.warning("环境变量 TUSHARE/TUSHARE_TOKEN 未设置")
-        return self._tushare_pro
-
     def _fetch_main_business(self, ts_codes: List[str]) -> pd.DataFrame:
         """
-        获取主营业务构成。优先从数据库 fina_mainbz 查，缺失的调 tushare 补全并入库。
+        获取主营业务构成：只读本地 fina_mainbz（由 mainbz_store.py 按报告期批量同步），不访问网络。
         取每只股票最近一期报告中，按产品收入最高的前2项拼接。
         """
-        if not ts_codes:
-            return pd.DataFrame()
-
-        # 1) 先从数据库查已有数据
-        existing_df = self._query_mainbiz_from_db(ts_codes)
-        existing_codes = set(existing_df['ts_code'].unique()) if not existing_df.empty else set()
-        missing_codes = [tc for tc in ts_codes if tc not in existing_codes]
-
-        logger.info(f"主营业务 DB 命中: {len(existing_codes)}/{len(ts_codes)}, 需补全: {len(missing_codes)}")
-
-        # 2) 缺失的调 tushare 获取
-        fetched_df = pd.DataFrame()
-        if missing_codes:
-            pro = self._get_tushare_pro()
-            if pro is not None:
-                fetched_df = self._sync_mainbiz_from_tushare(pro, missing_codes)
-
-        # 3) 合并
-        if not existing_df.empty and not fetched_df.empty:
-            df_all = pd.concat([existing_df, fetched_df], ignore_index=True)
-        elif not existing_df.empty:
-            df_all = existing_df.copy()
-        elif not fetched_df.empty:
-            df_all = fetched_df.copy()
-        else:
-            return pd.DataFrame()
-
-        # 4) 处理：取每只股票最新一期，收入最高的前2项
-        results = []
-        for ts_code, group in df_all.groupby('ts_code'):
-            group['bz_sales_num'] = pd.to_numeric(group['bz_sales'], errors='coerce')
-            latest_period = group['end_date'].max()
-            latest = group[group['end_date'] == latest_period]
-            top2 = latest.nlargest(2, 'bz_sales_num')
-            items = [str(x).strip() for x in top2['bz_item'].tolist() if pd.notna(x)]
-            main_biz = ' + '.join(items) if items else 'N/A'
-            results.append({'ts_code': ts_code, 'main_business': main_biz})
-
-        return pd.DataFrame(results)
-
-    def _query_mainbiz_from_db(self, ts_codes: List[str]) -> pd.DataFrame:
-        """从数据库查询 fina_mainbz 数据"""
         if not ts_codes or self.conn is None:
             return pd.DataFrame()
-        query = """
-        SELECT ts_code, end_date, bz_item, bz_sales, bz_profit, bz_cost, curr_type
-        FROM fina_mainbz
-        WHERE ts_code = ANY(%s)
-        """
         try:
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(query, (ts_codes,))
-                df = pd.DataFrame(cur.fetchall())
-            return df
+            df = latest_main_business(self.conn, ts_codes)
         except Exception as e:
             logger.warning(f"DB 查询 fina_mainbz 失败: {e}")
+            self.conn.rollback()
             return pd.DataFrame()
 
-    def _sync_mainbiz_from_tushare(self, pro, ts_codes: List[str]) -> pd.DataFrame:
-        """从 tushare 同步 fina_mainbz，严格频率控制，入库后返回"""
-        import time
-        end_date = datetime.now().strftime('%Y%m%d')
-        start_date = (datetime.now() - pd.Timedelta(days=730)).strftime('%Y%m%d')
-
-        all_data = []
-        call_times = []  # 记录每次调用时间
-
-        for tc in ts_codes:
-            now = time.time()
-            # 清理1分钟前的记录
-            call_times = [t for t in call_times if now - t < 60]
-            # 如果1分钟内已调用55次，sleep到下一分钟
-            if len(call_times) >= 55:
-                sleep_sec = 60 - (now - call_times[0]) + 1
-                if sleep_sec > 0:
-                    logger.info(f"tushare 频率控制: 暂停 {sleep_sec:.0f} 秒")
-                    time.sleep(sleep_sec)
-                call_times = []
-
-            try:
-                df = pro.fina_mainbz(ts_code=tc, type='P', start_date=start_date, end_date=end_date)
-                call_times.append(time.time())
-                if df is not None and not df.empty:
-                    all_data.append(df)
-            except Exception as e:
-                if '频率超限' in str(e):
-                    logger.warning("tushare 频率超限，暂停60秒重试...")
-                    time.sleep(60)
-                    call_times = []
-                    try:
-                        df = pro.fina_mainbz(ts_code=tc, type='P', start_date=start_date, end_date=end_date)
-                        call_times.append(time.time())
-                        if df is not None and not df.empty:
-                            all_data.append(df)
-                    except Exception as e2:
-                        logger.warning(f"重试失败 {tc}: {e2}")
-                else:
-                    logger.warning(f"fina_mainbz 查询失败 {tc}: {e}")
-
-        if not all_data:
-            return pd.DataFrame()
-
-        df_all = pd.concat(all_data, ignore_index=True)
-        self._save_mainbiz_to_db(df_all)
-        return df_all
-
-    def _save_mainbiz_to_db(self, df: pd.DataFrame):
-        """将 fina_mainbz 数据写入数据库"""
-        if df.empty or self.conn is None:
-            return
-        try:
-            with self.conn.cursor() as cur:
-                for _, row in df.iterrows():
-                    cur.execute("""
-                        INSERT INTO fina_mainbz (ts_code, end_date, bz_item, bz_code, bz_sales, bz_profit, bz_cost, curr_type)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (ts_code, end_date, bz_item) DO UPDATE SET
-                            bz_code = EXCLUDED.bz_code,
-                            bz_sales = EXCLUDED.bz_sales,
-                            bz_profit = EXCLUDED.bz_profit,
-                            bz_cost = EXCLUDED.bz_cost,
-                            curr_type = EXCLUDED.curr_type,
-                            update_time = CURRENT_TIMESTAMP
-                    """, (
-                        row.get('ts_code'), row.get('end_date'), row.get('bz_item'),
-                        row.get('bz_code'), row.get('bz_sales'), row.get('bz_profit'),
-                        row.get('bz_cost'), row.get('curr_type')
-                    ))
-            self.conn.commit()
-            logger.info(f"fina_mainbz 数据已入库: {len(df)} 条")
-        except Exception as e:
-            logger.warning(f"fina_mainbz 入库失败: {e}")
-            self.conn.rollback()
+        missing = len(set(ts_codes) - set(df['ts_code']))
+        logger.info(f"主营业务 DB 命中: {len(df)}/{len(ts_codes)}")
+        if missing:
+            logger.info(f"{missing} 只股票本地无主营业务数据，可运行 python mainbz_store.py 同步")
+        return df
 
     def select(self, criteria: GrowthCriteria, trade_date: str = None,
                enrich_concepts: bool = False) -> pd.DataFrame:
@@ -682,7 +553,7 @@ class DoubleSingleGrowthSelector:
         Args:
             criteria: 选股条件
             trade_date: 交易日期
-            enrich_concepts: 是否通过 pywencai 获取所属概念（较慢，按需开启）
+            enrich_concepts: 是否附加所属概念（读本地概念库）
         """
         if criteria.strategy == 'double':
             df = self.select_double_growth(criteria, trade_date)
@@ -699,7 +570,7 @@ class DoubleSingleGrowthSelector:
 
         #  enrichment: 所属概念
         if enrich_concepts and not df.empty and 'symbol' in df.columns:
-            logger.info("正在获取所属概念 (pywencai)...")
+            logger.info("正在获取所属概念 (本地概念库)...")
             df_concepts = self._fetch_concepts(df['symbol'].tolist())
             if not df_concepts.empty:
                 df = df.merge(df_concepts, on='symbol', how='left')
@@ -710,52 +581,18 @@ class DoubleSingleGrowthSelector:
     # -----------------------------------------------------------------------
     # 概念数据获取
     # -----------------------------------------------------------------------
-    def _fetch_concepts(self, symbols: List[str], batch_size: int = 50) -> pd.DataFrame:
+    def _fetch_concepts(self, symbols: List[str]) -> pd.DataFrame:
         """
-        通过 pywencai 批量获取股票所属概念。
-        pywencai.get(query='所属概念', find=['300750', '603045'], loop=True)
-        返回 DataFrame，含 'code' 和 '所属概念' 列。
+        从本地概念成分库（concept_store）取股票所属概念，返回 'symbol' 和 'concepts'（';' 分隔）。
+        概念库由 `python concept_store.py --refresh` 每日刷新，过期时在后台刷新，不阻塞选股。
         """
         if not symbols:
             return pd.DataFrame()
 
-        import time
-        all_results = []
-
-        # 去重并转为字符串
-        symbols = list(dict.fromkeys(symbols))
-        total = len(symbols)
-
-        for i in range(0, total, batch_size):
-            batch = symbols[i:i + batch_size]
-            try:
-                t1 = time.time()
-                df = pywencai.get(query='所属概念', find=batch, loop=True)
-                t2 = time.time()
-                if isinstance(df, pd.DataFrame) and not df.empty:
-                    # 提取 code 和所属概念
-                    if 'code' in df.columns and '所属概念' in df.columns:
-                        all_results.append(df[['code', '所属概念']].copy())
-                    elif '股票代码' in df.columns and '所属概念' in df.columns:
-                        # 提取6位代码
-                        df['code'] = df['股票代码'].str.extract(r'(\d{6})')
-                        all_results.append(df[['code', '所属概念']].copy())
-                logger.info(f"  pywencai 概念查询 [{i+1}-{min(i+batch_size, total)}/{total}] "
-                            f"返回 {len(df) if isinstance(df, pd.DataFrame) else 0} 条, 耗时 {t2-t1:.1f}s")
-            except Exception as e:
-                logger.warning(f"pywencai 概念查询失败 batch {i+1}-{min(i+batch_size, total)}: {e}")
-            time.sleep(0.5)  # 轻微限速
-
-        if not all_results:
-            return pd.DataFrame()
-
-        df_all = pd.concat(all_results, ignore_index=True)
-        df_all = df_all.rename(columns={'所属概念': 'concepts', 'code': 'symbol'})
-        df_all = df_all.drop_duplicates(subset=['symbol'], keep='first')
-        # pywencai 可能返回额外股票，过滤只保留传入的 symbol
-        symbol_set = set(str(s) for s in symbols)
-        df_all = df_all[df_all['symbol'].isin(symbol_set)]
-        logger.info(f"所属概念获取完成: {len(df_all)}/{total} 只股票")
+        index = get_concept_store(self.db_config).index()
+        df_all = index.concepts_frame(symbols)
+        logger.info(f"所属概念获取完成: {len(df_all)}/{len(set(symbols))} 只股票"
+                    f"（概念库更新于 {index.refreshed_at or '未知'}）")
         return df_all
 
     # -----------------------------------------------------------------------
@@ -1280,7 +1117,7 @@ def main():
     parser.add_argument('--date', type=str, default=None, help='指定交易日期 YYYY-MM-DD')
     parser.add_argument('--output', type=str, default=None, help='输出文件名前缀')
     parser.add_argument('--enrich-concepts', action='store_true',
-                        help='通过 pywencai 获取所属概念（较慢，按需开启）')
+                        help='附加所属概念（读本地概念库，由 concept_store.py --refresh 每日更新）')
     parser.add_argument('--filter-concepts', type=str, default=None,
                         help='概念关键词过滤，逗号分隔（如"锂电池,新能源"）')
     parser.add_argument('--filter-industry', type=str, default=None,
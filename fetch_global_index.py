@@ -8,6 +8,9 @@
   - 新浪美股指数 (akshare.index_us_stock_sina): 美股三大指数，约20年历史
   - 东方财富全球指数 (akshare.index_global_hist_em): 更长历史，但易被限流
 
+各数据源经过 resilience 的熔断器：某个源持续失败时其余指数不再逐个等待重试，
+先处理其他数据源，最后等冷却结束再补拉一轮。
+
 入库表: global_index_daily
   symbol, name, trade_date, open, close, high, low, amplitude, volume, amount
 """
@@ -24,6 +27,7 @@ import logging
 import argparse
 from datetime import datetime
 import akshare as ak
+from resilience import CircuitOpenError, EASTMONEY, SINA, retry_on_exception
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -129,12 +133,27 @@ EM_GLOBAL_INDICES = {
 }
 
 
+@retry_on_exception(retries=1, delay=3, backoff=2, upstream=SINA)
+def _index_global_hist_sina(symbol: str) -> pd.DataFrame:
+    return ak.index_global_hist_sina(symbol=symbol)
+
+
+@retry_on_exception(retries=1, delay=3, backoff=2, upstream=SINA)
+def _index_us_stock_sina(symbol: str) -> pd.DataFrame:
+    return ak.index_us_stock_sina(symbol=symbol)
+
+
+@retry_on_exception(retries=3, delay=5, backoff=2, upstream=EASTMONEY, max_delay=30)
+def _index_global_hist_em(symbol: str) -> pd.DataFrame:
+    return ak.index_global_hist_em(symbol=symbol)
+
+
 def fetch_sina_global(name: str, sleep_sec: float = 0.5):
     """通过新浪接口获取全球指数日K"""
     sina_name, _ = SINA_GLOBAL_INDICES.get(name, (name, name))
     try:
         time.sleep(sleep_sec)
-        df = ak.index_global_hist_sina(symbol=sina_name)
+        df = _index_global_hist_sina(sina_name)
         if df.empty:
             return None
         df = df.rename(columns={
@@ -155,6 +174,8 @@ def fetch_sina_global(name: str, sleep_sec: float = 0.5):
         if 'amount' in df.columns:
             cols.append('amount')
         return df[cols]
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.warning(f"新浪接口获取 {name} 失败: {e}")
         return None
@@ -167,7 +188,7 @@ def fetch_us_stock(name: str, sleep_sec: float = 0.5):
         return None
     try:
         time.sleep(sleep_sec)
-        df = ak.index_us_stock_sina(symbol=sina_code)
+        df = _index_us_stock_sina(sina_code)
         if df.empty:
             return None
         df = df.rename(columns={
@@ -190,45 +211,41 @@ def fetch_us_stock(name: str, sleep_sec: float = 0.5):
             df['amount'] = pd.to_numeric(df['amount'], errors='coerce')
             cols.append('amount')
         return df[cols]
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.warning(f"美股接口获取 {name} 失败: {e}")
         return None
 
 
-def fetch_em_global(name: str, sleep_sec: float = 1.0, max_retry: int = 3):
-    """通过东方财富接口获取全球指数日K（带重试）"""
+def fetch_em_global(name: str, sleep_sec: float = 1.0):
+    """通过东方财富接口获取全球指数日K（重试与熔断由 resilience 负责，熔断中抛 CircuitOpenError）"""
     em_name = EM_GLOBAL_INDICES.get(name)
     if not em_name:
         return None
-    for attempt in range(max_retry):
-        try:
-            time.sleep(sleep_sec)
-            df = ak.index_global_hist_em(symbol=em_name)
-            if df.empty:
-                return None
-            df = df.rename(columns={
-                '日期': 'trade_date',
-                '今开': 'open',
-                '最新价': 'close',
-                '最高': 'high',
-                '最低': 'low',
-                '振幅': 'amplitude',
-            })
-            df['symbol'] = name
-            df['name'] = em_name
-            df['trade_date'] = pd.to_datetime(df['trade_date']).dt.date
-            cols = ['symbol', 'name', 'trade_date', 'open', 'close', 'high', 'low', 'amplitude']
-            return df[cols]
-        except Exception as e:
-            err = str(e)
-            if 'RemoteDisconnected' in err or 'Connection aborted' in err:
-                logger.warning(f"东方财富接口限流 {name}，等待30秒后重试 ({attempt+1}/{max_retry})...")
-                time.sleep(30)
-            else:
-                logger.warning(f"东方财富接口获取 {name} 失败: {e}")
-                return None
-    logger.warning(f"东方财富接口获取 {name} 重试耗尽")
-    return None
+    try:
+        time.sleep(sleep_sec)
+        df = _index_global_hist_em(em_name)
+        if df.empty:
+            return None
+        df = df.rename(columns={
+            '日期': 'trade_date',
+            '今开': 'open',
+            '最新价': 'close',
+            '最高': 'high',
+            '最低': 'low',
+            '振幅': 'amplitude',
+        })
+        df['symbol'] = name
+        df['name'] = em_name
+        df['trade_date'] = pd.to_datetime(df['trade_date']).dt.date
+        cols = ['symbol', 'name', 'trade_date', 'open', 'close', 'high', 'low', 'amplitude']
+        return df[cols]
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.warning(f"东方财富接口获取 {name} 失败: {e}")
+        return None
 
 
 def save_to_db(conn, df: pd.DataFrame):
@@ -310,35 +327,54 @@ def main():
     fail_count = 0
     total_records = 0
 
-    for source, symbol in tasks:
-        logger.info(f"[{source.upper()}] 获取 {symbol} ...")
-        latest_db = get_existing_latest_date(conn, symbol)
-        if latest_db:
-            logger.info(f"  数据库最新: {latest_db}")
-
-        if source == 'sina':
-            df = fetch_sina_global(symbol, sleep_sec=args.sleep)
-        elif source == 'us':
-            df = fetch_us_stock(symbol, sleep_sec=args.sleep)
-        else:
-            df = fetch_em_global(symbol, sleep_sec=args.sleep)
-
-        if df is not None and not df.empty:
-            # 增量过滤
+    # 第二轮只补拉第一轮因熔断跳过的指数
+    pending = tasks
+    for round_no in range(2):
+        if round_no:
+            logger.warning(f"{len(pending)} 个指数因上游熔断延后，{defer_wait:.0f}s 后补拉")
+            time.sleep(defer_wait)
+        deferred, defer_wait = [], 0.0
+
+        for source, symbol in pending:
+            logger.info(f"[{source.upper()}] 获取 {symbol} ...")
+            latest_db = get_existing_latest_date(conn, symbol)
             if latest_db:
-                df = df[df['trade_date'] > latest_db]
-            if df.empty:
-                logger.info(f"  无新数据")
-                success_count += 1
+                logger.info(f"  数据库最新: {latest_db}")
+
+            try:
+                if source == 'sina':
+                    df = fetch_sina_global(symbol, sleep_sec=args.sleep)
+                elif source == 'us':
+                    df = fetch_us_stock(symbol, sleep_sec=args.sleep)
+                else:
+                    df = fetch_em_global(symbol, sleep_sec=args.sleep)
+            except CircuitOpenError as e:
+                logger.warning(f"  ⏸ {e}，延后")
+                deferred.append((source, symbol))
+                defer_wait = max(defer_wait, e.retry_after)
                 continue
 
-            n = save_to_db(conn, df)
-            total_records += n
-            logger.info(f"  ✅ 入库 {n} 条, 范围 {df['trade_date'].min()} ~ {df['trade_date'].max()}")
-            success_count += 1
-        else:
-            logger.warning(f"  ❌ 获取失败")
-            fail_count += 1
+            if df is not None and not df.empty:
+                # 增量过滤
+                if latest_db:
+                    df = df[df['trade_date'] > latest_db]
+                if df.empty:
+                    logger.info(f"  无新数据")
+                    success_count += 1
+                    continue
+
+                n = save_to_db(conn, df)
+                total_records += n
+                logger.info(f"  ✅ 入库 {n} 条, 范围 {df['trade_date'].min()} ~ {df['trade_date'].max()}")
+                success_count += 1
+            else:
+                logger.warning(f"  ❌ 获取失败")
+                fail_count += 1
+
+        pending = deferred
+        if not pending:
+            break
+    fail_count += len(pending)
 
     conn.close()
     logger.info(f"\n完成: 成功 {success_count}, 失败 {fail_count}, 新增 {total_records} 条记录")
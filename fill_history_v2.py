@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from db_pool import get_engine
 from dotenv import load_dotenv
 import os
 from datetime import timedelta
@@ -27,7 +28,7 @@ COST_CONFIG = {
 }
 
 def get_db_engine():
-    return create_engine(DSN)
+    return get_engine(DSN)
 
 def get_execution_price(open_price, direction='buy', slippage=COST_CONFIG['slippage']):
     """获取实际成交价：开盘价 ± 滑点"""
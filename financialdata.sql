@@ -1,34 +1,34 @@
 
-CREATE TABLE financial_indicators (
+CREATE TABLE financial_indicators_ths (
     -- 主键
     symbol VARCHAR(10) NOT NULL,
     report_period VARCHAR(20) NOT NULL,
     
-    -- 财务指标
-    net_profit VARCHAR(50),                    -- 净利润
-    net_profit_yoy VARCHAR(50),               -- 净利润同比增长率
-    deducted_net_profit VARCHAR(50),          -- 扣非净利润
-    deducted_net_profit_yoy VARCHAR(50),      -- 扣非净利润同比增长率
-    total_revenue VARCHAR(50),                -- 营业总收入
-    total_revenue_yoy VARCHAR(50),            -- 营业总收入同比增长率
-    eps VARCHAR(50),                          -- 基本每股收益
-    nav_per_share VARCHAR(50),                -- 每股净资产
-    capital_reserve_per_share VARCHAR(50),    -- 每股资本公积金
-    undistributed_profit_per_share VARCHAR(50), -- 每股未分配利润
-    ocf_per_share VARCHAR(50),                -- 每股经营现金流
-    net_profit_margin VARCHAR(50),            -- 销售净利率
-    gross_profit_margin VARCHAR(50),          -- 销售毛利率
-    roe VARCHAR(50),                          -- 净资产收益率
-    roe_diluted VARCHAR(50),                  -- 净资产收益率-摊薄
-    operating_cycle VARCHAR(50),              -- 营业周期
-    inventory_turnover VARCHAR(50),           -- 存货周转率
-    inventory_days VARCHAR(50),               -- 存货周转天数
-    receivables_days VARCHAR(50),             -- 应收账款周转天数
-    current_ratio VARCHAR(50),                -- 流动比率
-    quick_ratio VARCHAR(50),                  -- 速动比率
-    conservative_quick_ratio VARCHAR(50),     -- 保守速动比率
-    equity_ratio VARCHAR(50),                 -- 产权比率
-    debt_asset_ratio VARCHAR(50),             -- 资产负债率
+    -- 财务指标（数值类型：金额为元，'12.3亿' 入库前换算；百分比为百分点，'45.6%' 存 45.6）
+    net_profit DOUBLE PRECISION,               -- 净利润
+    net_profit_yoy DOUBLE PRECISION,          -- 净利润同比增长率
+    deducted_net_profit DOUBLE PRECISION,     -- 扣非净利润
+    deducted_net_profit_yoy DOUBLE PRECISION, -- 扣非净利润同比增长率
+    total_revenue DOUBLE PRECISION,           -- 营业总收入
+    total_revenue_yoy DOUBLE PRECISION,       -- 营业总收入同比增长率
+    eps DOUBLE PRECISION,                     -- 基本每股收益
+    nav_per_share DOUBLE PRECISION,           -- 每股净资产
+    capital_reserve_per_share DOUBLE PRECISION,    -- 每股资本公积金
+    undistributed_profit_per_share DOUBLE PRECISION, -- 每股未分配利润
+    ocf_per_share DOUBLE PRECISION,           -- 每股经营现金流
+    net_profit_margin DOUBLE PRECISION,       -- 销售净利率
+    gross_profit_margin DOUBLE PRECISION,     -- 销售毛利率
+    roe DOUBLE PRECISION,                     -- 净资产收益率
+    roe_diluted DOUBLE PRECISION,             -- 净资产收益率-摊薄
+    operating_cycle DOUBLE PRECISION,         -- 营业周期
+    inventory_turnover DOUBLE PRECISION,      -- 存货周转率
+    inventory_days DOUBLE PRECISION,          -- 存货周转天数
+    receivables_days DOUBLE PRECISION,        -- 应收账款周转天数
+    current_ratio DOUBLE PRECISION,           -- 流动比率
+    quick_ratio DOUBLE PRECISION,             -- 速动比率
+    conservative_quick_ratio DOUBLE PRECISION,     -- 保守速动比率
+    equity_ratio DOUBLE PRECISION,            -- 产权比率
+    debt_asset_ratio DOUBLE PRECISION,        -- 资产负债率
     
     -- 时间戳
     create_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
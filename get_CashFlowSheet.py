@@ -4,6 +4,7 @@ from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime
 import pandas as pd
 import akshare as ak
+from security_master import ALL_BOARDS, get_security_master
 import logging
 import argparse
 import sys
@@ -91,6 +92,7 @@ class CashFlowSheet(Base):
 
 class CashFlowSheetCollector:
     def __init__(self, db_config: Dict):
+        self.db_config = db_config
         self.db_url = f"postgresql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
         self.engine = create_engine(self.db_url)
         self.Session = sessionmaker(bind=self.engine)
@@ -252,16 +254,7 @@ class CashFlowSheetCollector:
     def get_stock_list(self) -> List[str]:
         """获取A股股票列表"""
         try:
-            # 使用 akshare 获取股票列表
-            stock_df = ak.stock_info_a_code_name()
-            
-            # 添加市场标识
-            def add_market_prefix(code):
-                if code.startswith('6'):
-                    return f"SH{code}"
-                return f"SZ{code}"
-            
-            stock_list = [add_market_prefix(code) for code in stock_df['code']]
+            stock_list = get_security_master(self.db_config).universe(boards=ALL_BOARDS, fmt='em_code')
             logger.info(f"成功获取股票列表，共 {len(stock_list)} 只股票")
             return stock_list
         except Exception as e:
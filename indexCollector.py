@@ -1,6 +1,7 @@
 import akshare as ak
 import pandas as pd
 import psycopg2
+from db_pool import pooled_connection
 from psycopg2.extras import execute_values
 import logging
 from typing import List, Dict, Optional
@@ -25,7 +26,7 @@ class IndexConstituentCollector:
         
     def get_db_connection(self):
         """获取数据库连接"""
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def init_table(self):
         """初始化数据表"""
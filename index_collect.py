@@ -1,18 +1,19 @@
 import os
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
+from db_pool import pooled_connection
 import logging
-from typing import List, Dict, Optional, Tuple
-import time
-import random
+from typing import List, Dict, Tuple
 import multiprocessing
 import argparse
 import sys
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from functools import wraps
 from python_fetch import python_fetch, get_pro_client
+from watermark import WatermarkStore
+from bulk_loader import copy_upsert
+from collector_framework import DatasetConfig, PipelineCollector
+from resilience import retry_on_exception
 
 load_dotenv('.env')
 
@@ -27,33 +28,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def retry_on_exception(retries=3, delay=5, backoff=2, exceptions=(Exception,)):
-    """重试装饰器"""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            retry_delay = delay
-            last_exception = None
-            
-            for retry in range(retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except exceptions as e:
-                    last_exception = e
-                    if retry == retries:
-                        raise last_exception
-                    
-                    wait_time = retry_delay + random.uniform(0, 1)
-                    logger.warning(f"尝试 {retry + 1}/{retries} 失败: {str(e)}. "
-                                 f"{wait_time:.2f} 秒后重试...")
-                    
-                    time.sleep(wait_time)
-                    retry_delay *= backoff
-                    
-            raise last_exception
-        return wrapper
-    return decorator
-
 class IndexDailyBasicCollector:
     def __init__(self, db_params: dict):
         self.db_params = db_params
@@ -64,7 +38,7 @@ class IndexDailyBasicCollector:
         self.pro = get_pro_client(tushare_token)
         
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def init_table(self):
         """初始化数据表"""
@@ -106,19 +80,12 @@ class IndexDailyBasicCollector:
         ]
         return index_list
 
-    def get_latest_trade_date(self, ts_code: str) -> Optional[datetime]:
-        """获取最新交易日期"""
+    def load_watermarks(self) -> WatermarkStore:
+        """一次分组查询加载全部指数的最新交易日期"""
+        store = WatermarkStore(self.table_name, key_columns=('ts_code',))
         with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(f"""
-                    SELECT trade_date 
-                    FROM {self.table_name}
-                    WHERE ts_code = %s
-                    ORDER BY trade_date DESC
-                    LIMIT 1
-                """, (ts_code,))
-                result = cur.fetchone()
-                return result[0] if result else None
+            store.load(conn)
+        return store
 
     @retry_on_exception(retries=3, delay=5, backoff=2)
     def fetch_data(self, ts_code: str, start_date: str, end_date: str) -> pd.DataFrame:
@@ -148,87 +115,21 @@ class IndexDailyBasicCollector:
             return
             
         with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                columns = df.columns.tolist()
-                values = [tuple(x) for x in df.values]
-                
-                insert_stmt = f"""
-                    INSERT INTO {self.table_name} ({','.join(columns)})
-                    VALUES %s
-                    ON CONFLICT (ts_code, trade_date)
-                    DO UPDATE SET
-                    {','.join(f"{col}=EXCLUDED.{col}" for col in columns 
-                             if col not in ['ts_code', 'trade_date'])}
-                """
-                
-                try:
-                    execute_values(cur, insert_stmt, values)
-                    conn.commit()
-                    logger.info(f"成功保存 {len(df)} 条记录")
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"保存数据失败: {str(e)}")
-                    raise
-
-def process_index_batch(db_params: Dict, index_batch: List[str], 
-                       batch_id: int, start_date: str, end_date: str, mode: str):
-    """处理一批指数的数据采集"""
-    if not index_batch:
-        logger.warning(f"Batch {batch_id}: Empty index batch, skipping")
-        return
-        
-    try:
-        collector = IndexDailyBasicCollector(db_params)
-        total_indexes = len(index_batch)
-        
-        logger.info(f"Batch {batch_id}: Starting processing {total_indexes} indexes")
-        
-        success_count = 0
-        error_count = 0
-        
-        for idx, ts_code in enumerate(index_batch, 1):
             try:
-                # 随机延时1-3秒，避免请求过于频繁
-                time.sleep(random.uniform(1, 3))
-                
-                # 如果是增量模式，获取最新数据日期
-                if mode == 'incremental':
-                    latest_date = collector.get_latest_trade_date(ts_code)
-                    if latest_date:
-                        start_date = (latest_date + timedelta(days=1)).strftime('%Y%m%d')
-                
-                # 获取数据
-                df = collector.fetch_data(ts_code, start_date, end_date)
-                
-                if df is not None and not df.empty:
-                    df = collector.process_data(df)
-                    collector.save_to_db(df)
-                    
-                    success_count += 1
-                    logger.info(f"Batch {batch_id} Progress: {idx}/{total_indexes} "
-                              f"- Successfully processed {ts_code}")
-                else:
-                    logger.warning(f"Batch {batch_id}: No data available for {ts_code}")
-                
+                copy_upsert(conn, df, self.table_name, pk_columns=['ts_code', 'trade_date'])
+                conn.commit()
+                logger.info(f"成功保存 {len(df)} 条记录")
             except Exception as e:
-                error_count += 1
-                logger.error(f"Batch {batch_id}: Error processing {ts_code}: {str(e)}")
-                continue
-                
-        logger.info(f"Batch {batch_id} completed. Success: {success_count}, Errors: {error_count}")
-        
-    except Exception as e:
-        logger.error(f"Batch {batch_id}: Fatal error in batch processing: {str(e)}")
+                conn.rollback()
+                logger.error(f"保存数据失败: {str(e)}")
+                raise
 
-def chunks(lst: List, n: int) -> List[List]:
-    """将列表分割成n个大致相等的块"""
-    if not lst:
-        return []
-    
-    size = len(lst)
-    chunk_size = (size + n - 1) // n
-    
-    return [lst[i:i + chunk_size] for i in range(0, size, chunk_size)]
+    def dataset_config(self, fetch_workers: int = 3) -> DatasetConfig:
+        """流水线采集配置：多只指数合并后一次 COPY 写入"""
+        return DatasetConfig(name='index_dailybasic', table_name=self.table_name,
+                             pk_columns=['ts_code', 'trade_date'],
+                             fetch=self.fetch_data, transform=self.process_data,
+                             fetch_workers=fetch_workers)
 
 def main():
     parser = argparse.ArgumentParser(description='指数每日指标数据采集工具')
@@ -242,7 +143,7 @@ def main():
         '--processes',
         type=int,
         default=3,
-        help='并行进程数'
+        help='并发拉取线程数'
     )
     parser.add_argument(
         '--start_date',
@@ -284,30 +185,14 @@ def main():
             logger.error("没有获取到指数列表，无法进行数据采集")
             return
         
-        # 调整进程数（考虑到指数数量较少）
-        num_processes = min(args.processes, total_indexes)
-        
-        logger.info(f"开始{args.mode}模式的并行数据采集（使用 {num_processes} 个进程）...")
-        
-        # 将指数列表分成多个批次
-        index_batches = chunks(indexes, num_processes)
+        # 调整线程数（考虑到指数数量较少）
+        num_workers = min(args.processes, total_indexes)
         
-        # 创建任务列表
-        tasks = []
-        for i, batch in enumerate(index_batches):
-            if batch:
-                tasks.append((
-                    db_params, 
-                    batch, 
-                    i, 
-                    args.start_date, 
-                    args.end_date, 
-                    args.mode
-                ))
+        logger.info(f"开始{args.mode}模式的流水线数据采集（使用 {num_workers} 个拉取线程）...")
         
-        # 创建进程池执行任务
-        with multiprocessing.Pool(processes=num_processes) as pool:
-            pool.starmap(process_index_batch, tasks)
+        # 拉取、清洗、入库三段并行，增量模式下框架一次性加载全部水位
+        PipelineCollector(collector.dataset_config(num_workers), db_params).run(
+            indexes, args.start_date, args.end_date, mode=args.mode)
             
         logger.info("所有批次处理完成")
         
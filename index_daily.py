@@ -9,17 +9,18 @@ python index_daily.py --mode incremental          \
 import os
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
+from db_pool import pooled_connection
 import logging
-import random
-import time
 import multiprocessing
 import argparse
 import sys
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from functools import wraps
-from typing import List, Dict, Optional
+from typing import List, Dict
+from watermark import WatermarkStore
+from bulk_loader import copy_upsert
+from collector_framework import DatasetConfig, PipelineCollector
+from resilience import retry_on_exception
 from python_fetch import python_fetch, get_pro_client
 
 load_dotenv('.env')
@@ -35,31 +36,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ---------------- 工具 ----------------
-def chunks(lst: List, n: int) -> List[List]:
-    if not lst:
-        return []
-    chunk_size = (len(lst) + n - 1) // n
-    return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
-
-def retry_on_exception(retries=3, delay=5, backoff=2, exceptions=(Exception,)):
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            retry_delay = delay
-            for retry in range(retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except exceptions as e:
-                    if retry == retries:
-                        raise
-                    wait_time = retry_delay + random.uniform(0, 1)
-                    logger.warning(f"尝试 {retry + 1}/{retries} 失败: {e}，{wait_time:.2f}s 后重试...")
-                    time.sleep(wait_time)
-                    retry_delay *= backoff
-        return wrapper
-    return decorator
-
 # ---------------- 采集器 ----------------
 class IndexDailyCollector:
     def __init__(self, db_params: dict):
@@ -72,7 +48,7 @@ class IndexDailyCollector:
 
     # ---------- PG 连接 ----------
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def init_table(self):
         sql = f"""
@@ -115,17 +91,12 @@ class IndexDailyCollector:
         ]
 
     # ---------- 增量用 ----------
-    def get_latest_trade_date(self, ts_code: str) -> Optional[datetime]:
-        sql = f"""
-            SELECT MAX(trade_date)
-            FROM {self.table_name}
-            WHERE ts_code = %s
-        """
+    def load_watermarks(self) -> WatermarkStore:
+        """一次分组查询加载全部 ts_code 的最新交易日"""
+        store = WatermarkStore(self.table_name, key_columns=('ts_code',))
         with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql, (ts_code,))
-                row = cur.fetchone()
-                return row[0] if row and row[0] else None
+            store.load(conn)
+        return store
 
     # ---------- 拉数据 ----------
     @retry_on_exception(retries=3, delay=5, backoff=2)
@@ -150,53 +121,23 @@ class IndexDailyCollector:
     def save_to_db(self, df: pd.DataFrame):
         if df.empty:
             return
-        cols = df.columns.tolist()
-        vals = [tuple(x) for x in df.values]
-        sql = f"""
-            INSERT INTO {self.table_name} ({','.join(cols)})
-            VALUES %s
-            ON CONFLICT (ts_code, trade_date)
-            DO UPDATE SET
-            {','.join(f"{c}=EXCLUDED.{c}" for c in cols if c not in ['ts_code','trade_date'])}
-        """
         with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                execute_values(cur, sql, vals)
-                conn.commit()
+            copy_upsert(conn, df, self.table_name, pk_columns=['ts_code', 'trade_date'])
+            conn.commit()
         logger.info(f"Upsert {len(df)} 条记录")
 
-# ---------------- 多进程任务 ----------------
-def process_index_batch(db_params: Dict, index_batch: List[str],
-                       batch_id: int, start_date: str, end_date: str, mode: str):
-    if not index_batch:
-        logger.warning(f"Batch {batch_id} 空列表，跳过")
-        return
-    collector = IndexDailyCollector(db_params)
-    ok, ng = 0, 0
-    for idx, ts_code in enumerate(index_batch, 1):
-        try:
-            time.sleep(random.uniform(0.8, 2.4))          # 限速
-            if mode == 'incremental':
-                latest = collector.get_latest_trade_date(ts_code)
-                if latest:
-                    start_date = (latest + timedelta(days=1)).strftime('%Y%m%d')
-            df = collector.fetch_data(ts_code, start_date, end_date)
-            if df is not None and not df.empty:
-                collector.save_to_db(collector.process_data(df))
-                ok += 1
-                logger.info(f"Batch {batch_id}  [{idx}/{len(index_batch)}]  {ts_code} 完成")
-            else:
-                logger.warning(f"Batch {batch_id}  {ts_code} 无数据")
-        except Exception as e:
-            ng += 1
-            logger.error(f"Batch {batch_id}  {ts_code} 出错: {e}", exc_info=True)
-    logger.info(f"Batch {batch_id} 结束，成功 {ok}，失败 {ng}")
+    # ---------- 流水线配置 ----------
+    def dataset_config(self, fetch_workers: int = 4) -> DatasetConfig:
+        return DatasetConfig(name='index_daily', table_name=self.table_name,
+                             pk_columns=['ts_code', 'trade_date'],
+                             fetch=self.fetch_data, transform=self.process_data,
+                             fetch_workers=fetch_workers)
 
 # ---------------- main ----------------
 def main():
     parser = argparse.ArgumentParser(description='指数每日行情采集（index_daily）')
     parser.add_argument('--mode', choices=['incremental', 'full'], default='incremental')
-    parser.add_argument('--processes', type=int, default=4, help='并行进程数')
+    parser.add_argument('--processes', type=int, default=4, help='并发拉取线程数')
     parser.add_argument('--start_date', type=str, default='20000101')
     parser.add_argument('--end_date', type=str, default=datetime.now().strftime('%Y%m%d'))
     args = parser.parse_args()
@@ -208,14 +149,9 @@ def main():
     collector.init_table()
 
     indexes = collector.get_index_list()
-    num = min(args.processes, len(indexes))
-    batches = chunks(indexes, num)
-    tasks = [(db_params, b, i, args.start_date, args.end_date, args.mode)
-            for i, b in enumerate(batches) if b]
-
-    logger.info(f"共 {len(indexes)} 只指数，{num} 进程，{len(tasks)} 个批次，模式={args.mode}")
-    with multiprocessing.Pool(processes=num) as pool:
-        pool.starmap(process_index_batch, tasks)
+    num = max(1, min(args.processes, len(indexes)))
+    PipelineCollector(collector.dataset_config(num), db_params).run(
+        indexes, args.start_date, args.end_date, mode=args.mode)
     logger.info("全部完成")
 
 if __name__ == '__main__':
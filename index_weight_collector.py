@@ -4,8 +4,10 @@
 针对 000018.SH (180金融) 等指数进行历史权重爬取
 """
 import tushare as ts
+from python_fetch import python_fetch
 import pandas as pd
 import psycopg2
+from db_pool import pooled_connection
 from psycopg2.extras import execute_values
 import logging
 import time
@@ -26,7 +28,7 @@ class IndexWeightCollector:
         self.pro = ts.pro_api(tushare_token)
 
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def init_table(self):
         """初始化权重表"""
@@ -49,9 +51,10 @@ class IndexWeightCollector:
         """调用 Tushare 接口获取数据"""
         try:
             # 根据截图接口说明：建议输入月度开始和结束日期
-            df = self.pro.index_weight(index_code=index_code, 
-                                      start_date=start_date, 
-                                      end_date=end_date)
+            df = python_fetch('index_weight', pro=self.pro,
+                              index_code=index_code,
+                              start_date=start_date,
+                              end_date=end_date)
             return df
         except Exception as e:
             logger.error(f"接口调用失败: {e}")
@@ -103,8 +106,6 @@ def main():
         
         if df is not None and not df.empty:
             collector.save_to_db(df)
-        
-        time.sleep(0.6) # 尊重接口频次限制
 
     logger.info("所有历史权重数据采集完成。")
 
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+采集任务台账：记录每个已完成的 (dataset, key, window) 单元及其行数、校验和，
+进程崩溃或机器重启后用 --resume 跳过已完成单元，只补剩余部分。
+
+    ledger = JobLedger(db_params, 'income')
+    ledger.init_table()
+    done = ledger.load_completed()                 # {(key, window_start, window_end), ...}
+    covered = covered_until(done)                  # {(key, window_start): 最大 window_end}
+    ...
+    ledger.record('000001.SZ', '20240331', '20240331', df)
+    ledger.last_finished()                         # 最近一次记账时间，可用于判断数据是否过期
+
+- window 使用本次任务请求的区间（而不是按水位推算后的实际区间），保证重跑同一任务时能对上；
+  结束日默认取当天的任务用 covered_until 判断：同一起始日、记账结束日不早于本次结束日即视为完成
+- 无数据的单元也会记一笔（rows=0），避免恢复时反复请求空窗口
+- 同一单元重跑时比较新旧校验和，内容变化（数据源修订）会记日志
+- 写台账与写数据不在同一事务：两者之间崩溃只会重做一个单元，入库是幂等 upsert
+"""
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Sequence, Set, Tuple
+
+import pandas as pd
+
+from db_pool import pooled_connection
+
+logger = logging.getLogger(__name__)
+
+LEDGER_TABLE = 'job_ledger'
+
+# 超过这个时长的台账记录不再视为“已完成”（如财报后续披露、数据修订需要重拉）
+RESUME_MAX_AGE_HOURS = 72
+
+Unit = Tuple[str, str, str]
+
+
+def frame_checksum(df: Optional[pd.DataFrame]) -> str:
+    """DataFrame 内容的 md5（与行顺序无关），空表返回空串"""
+    if df is None or df.empty:
+        return ''
+    row_hashes = pd.util.hash_pandas_object(df, index=False).sort_values().values
+    return hashlib.md5(row_hashes.tobytes()).hexdigest()
+
+
+def covered_until(done: Set[Unit]) -> Dict[Tuple[str, str], str]:
+    """按 (key, window_start) 汇总已完成单元的最大 window_end（YYYYMMDD 字符串可直接比较）"""
+    covered: Dict[Tuple[str, str], str] = {}
+    for key, start, end in done:
+        if end > covered.get((key, start), ''):
+            covered[(key, start)] = end
+    return covered
+
+
+class JobLedger:
+    def __init__(self, db_params, dataset: str):
+        self.db_params = db_params
+        self.dataset = dataset
+
+    def init_table(self):
+        with pooled_connection(self.db_params) as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+                        dataset      VARCHAR(64),
+                        unit_key     VARCHAR(64),
+                        window_start VARCHAR(8),
+                        window_end   VARCHAR(8),
+                        rows         INTEGER,
+                        checksum     VARCHAR(32),
+                        finished_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (dataset, unit_key, window_start, window_end)
+                    )
+                """)
+                cur.execute(f"ALTER TABLE {LEDGER_TABLE} ADD COLUMN IF NOT EXISTS checksum VARCHAR(32)")
+
+    def load_completed(self, max_age_hours: Optional[float] = RESUME_MAX_AGE_HOURS) -> Set[Unit]:
+        """一次查询取出本数据集已完成的单元"""
+        sql = f"SELECT unit_key, window_start, window_end FROM {LEDGER_TABLE} WHERE dataset = %s"
+        params = [self.dataset]
+        if max_age_hours is not None:
+            sql += " AND finished_at >= %s"
+            params.append(datetime.now() - timedelta(hours=max_age_hours))
+        with pooled_connection(self.db_params) as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                done = {tuple(row) for row in cur.fetchall()}
+        logger.info(f"[{self.dataset}] 台账中已完成 {len(done)} 个单元")
+        return done
+
+    def load_finished(self, keys: Optional[Sequence[str]] = None) -> Dict[Unit, datetime]:
+        """已记账单元及其完成时间（keys 指定时只取这些 key），用于按上次处理时间安排复查"""
+        sql = f"SELECT unit_key, window_start, window_end, finished_at FROM {LEDGER_TABLE} WHERE dataset = %s"
+        params = [self.dataset]
+        if keys is not None:
+            sql += " AND unit_key = ANY(%s)"
+            params.append(list(keys))
+        with pooled_connection(self.db_params) as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return {(key, start, end): finished for key, start, end, finished in cur.fetchall()}
+
+    def record(self, key: str, window_start: str, window_end: str,
+               df: Optional[pd.DataFrame] = None):
+        """单元处理成功（含无数据）后记账；重跑的单元内容与上次不同时记日志"""
+        rows = 0 if df is None else len(df)
+        checksum = frame_checksum(df)
+        with pooled_connection(self.db_params) as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT rows, checksum FROM {LEDGER_TABLE}
+                    WHERE dataset = %s AND unit_key = %s AND window_start = %s AND window_end = %s
+                """, (self.dataset, key, window_start, window_end))
+                previous = cur.fetchone()
+                cur.execute(f"""
+                    INSERT INTO {LEDGER_TABLE}
+                        (dataset, unit_key, window_start, window_end, rows, checksum, finished_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (dataset, unit_key, window_start, window_end) DO UPDATE SET
+                        rows = EXCLUDED.rows,
+                        checksum = EXCLUDED.checksum,
+                        finished_at = EXCLUDED.finished_at
+                """, (self.dataset, key, window_start, window_end, rows, checksum))
+        if previous is not None and previous[1] is not None and previous[1] != checksum:
+            logger.info(f"[{self.dataset}] {key} {window_start}~{window_end} 重跑后内容变化："
+                        f"{previous[0]} -> {rows} 行")
+
+    def last_finished(self, key: Optional[str] = None) -> Optional[datetime]:
+        """本数据集（或其中某个 key）最近一次完成记账的时间，没有记录时返回 None"""
+        sql = f"SELECT MAX(finished_at) FROM {LEDGER_TABLE} WHERE dataset = %s"
+        params = [self.dataset]
+        if key is not None:
+            sql += " AND unit_key = %s"
+            params.append(key)
+        with pooled_connection(self.db_params) as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return cur.fetchone()[0]
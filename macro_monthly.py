@@ -19,7 +19,9 @@ from typing import List, Dict
 
 import pandas as pd
 import psycopg2
+from db_pool import pooled_connection
 from psycopg2.extras import execute_values
+from schema_registry import ensure_columns
 from dotenv import load_dotenv
 
 from python_fetch import fetch_sf_month, fetch_cn_m, fetch_us_tycr
@@ -49,7 +51,7 @@ class MacroMonthlyCollector:
         self.tycr_table = 'us_tycr_daily'
 
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def init_tables(self):
         sql_sf = f"""
@@ -92,37 +94,22 @@ class MacroMonthlyCollector:
                 row = cur.fetchone()
                 return row[0] if row and row[0] else None
 
-    def _existing_columns(self, table_name: str) -> set:
-        sql = """
-        SELECT column_name
-        FROM information_schema.columns
-        WHERE table_schema = 'public' AND table_name = %s
-        """
-        with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql, (table_name,))
-                return {r[0] for r in cur.fetchall()}
-
     def _ensure_columns(self, table_name: str, df: pd.DataFrame, key_col: str):
-        existing = self._existing_columns(table_name)
-        add_cols = [c for c in df.columns if c not in existing]
-        if not add_cols:
-            return
-
+        """列信息按进程缓存，只有出现新列时才一次性 ALTER"""
+        col_types = {}
+        for col in df.columns:
+            if col == key_col:
+                continue
+            if col in ('month',):
+                col_types[col] = 'VARCHAR(6)'
+            elif col in ('date',):
+                col_types[col] = 'DATE'
+            else:
+                col_types[col] = 'DOUBLE PRECISION'
         with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                for col in add_cols:
-                    if col == key_col:
-                        continue
-                    if col in ('month',):
-                        col_type = 'VARCHAR(6)'
-                    elif col in ('date',):
-                        col_type = 'DATE'
-                    else:
-                        col_type = 'DOUBLE PRECISION'
-                    cur.execute(f'ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS "{col}" {col_type}')
-                conn.commit()
-        logger.info(f'{table_name} 自动补充字段: {add_cols}')
+            added = ensure_columns(conn, table_name, col_types)
+        if added:
+            logger.info(f'{table_name} 自动补充字段: {added}')
 
     def _upsert_df(self, df: pd.DataFrame, table_name: str, key_col: str):
         if df is None or df.empty:
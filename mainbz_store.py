@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+主营业务构成（fina_mainbz）本地库：按报告期横截面批量同步，选股时只读库。
+
+同步（定时任务，每日/每周一次）：
+    python mainbz_store.py                      # 最近 8 个报告期
+    python mainbz_store.py --periods 20240630,20240930
+
+每个报告期 fina_mainbz_vip 分页拉取全部公司（每期只需几次调用，而不是每只股票一次
+fina_mainbz），与库中该期已存数据比对后，新增或变化的行 COPY 暂存表一次合并写入；
+本次拉到的公司在库中多出的分项（更正后已不存在）在同一事务内删除。
+披露期已经结束的报告期同步过一次后记入 job_ledger，之后不再重复拉取。
+
+查询（一条 SQL，走 (ts_code, end_date) 索引）：
+    df = latest_main_business(conn, ['300750.SZ', '600519.SH'])   # ts_code, main_business
+"""
+import argparse
+import logging
+from datetime import date
+from typing import List, Optional, Sequence
+
+import pandas as pd
+
+from bulk_loader import copy_upsert
+from db_pool import pooled_connection
+from job_ledger import JobLedger
+from period_sync import diff_changed_rows, fetch_period_paged, load_period_rows
+
+logger = logging.getLogger(__name__)
+
+MAINBZ_TABLE = 'fina_mainbz'
+PK_COLUMNS = ['ts_code', 'end_date', 'bz_item']
+MAINBZ_COLUMNS = ['ts_code', 'end_date', 'bz_item', 'bz_code', 'bz_sales', 'bz_profit',
+                  'bz_cost', 'curr_type']
+
+# 默认同步的报告期个数（约两年，与原逐只查询的 730 天窗口一致）
+DEFAULT_PERIODS = 8
+# 报告期结束后超过这么多天视为披露完毕（年报最晚次年 4 月底披露）
+CLOSED_PERIOD_DAYS = 130
+# 按产品分类（表主键不含分类，地区/行业口径不混入同一张表）
+BZ_TYPE = 'P'
+
+
+def init_table(conn, table_name: str = MAINBZ_TABLE):
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                ts_code VARCHAR(10),
+                end_date DATE,
+                bz_item VARCHAR(200),
+                bz_code VARCHAR(20),
+                bz_sales DECIMAL(20,4),
+                bz_profit DECIMAL(20,4),
+                bz_cost DECIMAL(20,4),
+                curr_type VARCHAR(10),
+                update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (ts_code, end_date, bz_item)
+            )
+        """)
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS {table_name}_code_period_idx
+            ON {table_name} (ts_code, end_date DESC)
+        """)
+
+
+def recent_periods(n: int = DEFAULT_PERIODS, today: Optional[date] = None) -> List[str]:
+    """截至今天已结束的最近 n 个报告期（季末），从新到旧"""
+    today = pd.Timestamp(today or date.today()).normalize()
+    quarter = today.to_period('Q')
+    if today < quarter.end_time.normalize():
+        quarter -= 1
+    return [(quarter - i).end_time.strftime('%Y%m%d') for i in range(n)]
+
+
+def is_closed_period(period: str, today: Optional[date] = None) -> bool:
+    today = pd.Timestamp(today or date.today())
+    return (today - pd.Timestamp(period)).days > CLOSED_PERIOD_DAYS
+
+
+def _prepare(df: pd.DataFrame) -> pd.DataFrame:
+    df = df[[c for c in MAINBZ_COLUMNS if c in df.columns]].copy()
+    df = df[df['ts_code'].str[:1].isin(['0', '3', '6']) & df['bz_item'].notna()]
+    df['end_date'] = pd.to_datetime(df['end_date']).dt.date
+    df['bz_item'] = df['bz_item'].astype(str).str.strip()
+    for col in ('bz_sales', 'bz_profit', 'bz_cost'):
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df.drop_duplicates(subset=PK_COLUMNS, keep='last')
+
+
+def sync_period(conn, period: str, pro=None, table_name: str = MAINBZ_TABLE) -> int:
+    """同步一个报告期：拉全部公司、只写入新增或变化的行并删除已消失的分项，返回写入行数；不负责 commit"""
+    df = fetch_period_paged('fina_mainbz_vip', period, pro=pro, type=BZ_TYPE)
+    if df.empty:
+        logger.warning(f"{period} 没有可用的主营业务构成数据")
+        return 0
+    df = _prepare(df)
+    stored = load_period_rows(conn, table_name, 'end_date', period, columns=MAINBZ_COLUMNS)
+    changed = diff_changed_rows(df, stored, pk_columns=PK_COLUMNS)
+    stale = _vanished_rows(df, stored)
+    logger.info(f"{period}: 拉取 {len(df)} 行，库中已有 {len(stored)} 行，新增/变化 {len(changed)} 行，"
+                f"已消失 {len(stale)} 行")
+    written = copy_upsert(conn, changed, table_name, pk_columns=PK_COLUMNS, touch_update_time=True)
+    if not stale.empty:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                DELETE FROM {table_name}
+                WHERE end_date = %s
+                  AND (ts_code, bz_item) IN (SELECT * FROM unnest(%s::varchar[], %s::varchar[]))
+            """, (pd.to_datetime(period).date(), stale['ts_code'].tolist(), stale['bz_item'].tolist()))
+    return written
+
+
+def _vanished_rows(df: pd.DataFrame, stored: pd.DataFrame) -> pd.DataFrame:
+    """本期重新拉到的公司里，库中有而本次结果里已没有的 (ts_code, bz_item)（如更正公告删掉的分项）"""
+    if stored.empty:
+        return stored
+    keys = ['ts_code', 'bz_item']
+    stored = stored[stored['ts_code'].isin(df['ts_code'])][keys].astype(str)
+    merged = stored.merge(df[keys].astype(str).drop_duplicates(), on=keys, how='left', indicator=True)
+    return merged.loc[merged['_merge'] == 'left_only', keys]
+
+
+def sync_mainbz(db_params, periods: Optional[Sequence[str]] = None, pro=None,
+                force: bool = False) -> int:
+    """
+    按报告期批量同步 fina_mainbz，返回写入总行数
+    - 已披露完毕且台账里同步过的报告期跳过（force=True 时全部重拉）
+    - 每个报告期单独提交，中途失败不影响已完成的报告期
+    """
+    periods = list(periods) if periods else recent_periods()
+    ledger = JobLedger(db_params, MAINBZ_TABLE)
+    ledger.init_table()
+    done = set() if force else {start for key, start, _ in ledger.load_completed(max_age_hours=None)}
+
+    with pooled_connection(db_params) as conn:
+        init_table(conn)
+        conn.commit()
+
+    total = 0
+    for period in periods:
+        if period in done and is_closed_period(period):
+            logger.info(f"{period} 已披露完毕且已同步，跳过")
+            continue
+        with pooled_connection(db_params) as conn:
+            try:
+                written = sync_period(conn, period, pro=pro)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"{period} 主营业务构成同步失败: {e}")
+                continue
+        ledger.record(period, period, period)
+        total += written
+    logger.info(f"fina_mainbz 同步完成：{len(periods)} 个报告期，写入 {total} 行")
+    return total
+
+
+def latest_main_business(conn, ts_codes: Sequence[str], top_n: int = 2,
+                         table_name: str = MAINBZ_TABLE) -> pd.DataFrame:
+    """
+    每只股票最近一期报告中收入最高的前 top_n 项，以 ' + ' 拼接为 main_business
+    只读本地库，库中没有的股票不出现在结果里
+    """
+    if not ts_codes:
+        return pd.DataFrame(columns=['ts_code', 'main_business'])
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            WITH latest AS (
+                SELECT ts_code, MAX(end_date) AS end_date
+                FROM {table_name}
+                WHERE ts_code = ANY(%s)
+                GROUP BY ts_code
+            ), ranked AS (
+                SELECT m.ts_code, m.bz_item,
+                       ROW_NUMBER() OVER (PARTITION BY m.ts_code
+                                          ORDER BY m.bz_sales DESC NULLS LAST, m.bz_item) AS rn
+                FROM {table_name} m JOIN latest l USING (ts_code, end_date)
+            )
+            SELECT ts_code, STRING_AGG(bz_item, ' + ' ORDER BY rn) AS main_business
+            FROM ranked
+            WHERE rn <= %s
+            GROUP BY ts_code
+        """, (list(ts_codes), top_n))
+        return pd.DataFrame(cur.fetchall(), columns=['ts_code', 'main_business'])
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='主营业务构成按报告期批量同步')
+    parser.add_argument('--periods', type=str, default=None,
+                        help='报告期列表，逗号分隔（YYYYMMDD），缺省为最近 8 个报告期')
+    parser.add_argument('--force', action='store_true', help='忽略台账，重拉已披露完毕的报告期')
+    args = parser.parse_args()
+
+    from double_single_growth_selector import load_db_config
+    periods = args.periods.split(',') if args.periods else None
+    sync_mainbz(load_db_config(), periods, force=args.force)
+
+
+if __name__ == '__main__':
+    main()
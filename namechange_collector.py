@@ -6,6 +6,8 @@ python namechange_collector.py --tushare_token YOUR_TOKEN
 """
 
 import tushare as ts
+from python_fetch import python_fetch
+from security_master import ALL_BOARDS, get_security_master
 import pandas as pd
 import psycopg2
 from psycopg2.extras import execute_values
@@ -143,13 +145,8 @@ def main():
 
     init_table()
 
-    # 获取全部股票列表（作为采集范围）
-    logger.info("正在获取股票列表...")
-    stock_list = pro.stock_basic(
-        fields='ts_code',
-        list_status='L'  # 只取上市状态
-    )
-    all_codes = stock_list['ts_code'].tolist()
+    # 采集范围：证券主数据中当前上市的股票
+    all_codes = get_security_master(DB_PARAMS).universe(boards=ALL_BOARDS)
     logger.info(f"共获取 {len(all_codes)} 只股票")
 
     # 增量：跳过已处理的
@@ -166,7 +163,7 @@ def main():
     for idx, ts_code in enumerate(target_codes, 1):
         try:
             logger.info(f"[{idx}/{len(target_codes)}] 开始处理 {ts_code}")
-            df = pro.namechange(ts_code=ts_code)
+            df = python_fetch('namechange', pro=pro, ts_code=ts_code)
 
             if df is not None and not df.empty:
                 save_to_db(df)
@@ -174,11 +171,7 @@ def main():
             else:
                 logger.debug(f"{ts_code} 无更名记录")
 
-            # ⚠️ 关键：严格限速！至少 30 秒间隔（确保 ≤ 2 次/分钟）
-            if idx < len(target_codes):
-                sleep_time = random.uniform(1, 3)
-                logger.info(f"等待 {sleep_time:.1f} 秒...")
-                time.sleep(sleep_time)
+            # 限频由 python_fetch 的共享令牌桶负责（namechange 配额见 API_RATE_LIMITS）
 
         except Exception as e:
             ng += 1
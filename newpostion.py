@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
 import os
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from db_pool import get_engine
 import datetime
 
 # --- 配置 ---
@@ -16,7 +17,7 @@ INITIAL_CAPITAL = 1000000.0
 FRICTION_RATE = 0.003  # 调仓摩擦成本
 
 def get_db_engine():
-    return create_engine(DSN)
+    return get_engine(DSN)
 
 def run_strategy():
     engine = get_db_engine()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+财务报表按报告期横截面同步：一次拉取某个报告期全部公司的数据（*_vip 接口，分页），
+与库里该期已存数据比对后只 upsert 新增或变化的行。
+
+相比逐只股票 income(ts_code=..., period=...)，每个报告期只需 ceil(N / page_size) 次调用。
+
+    df = fetch_period_paged('income_vip', '20240331', pro=pro)
+    stored = load_period_rows(conn, 'income', 'end_date', '20240331')
+    changed = diff_changed_rows(df, stored, pk_columns=['ts_code', 'end_date'])
+
+同一 (ts_code, end_date) 有多个版本（更正公告）时，逐只与横截面两条路径都经 latest_report_version 取同一版。
+"""
+import logging
+from typing import List, Optional, Sequence
+
+import pandas as pd
+
+from python_fetch import python_fetch
+
+logger = logging.getLogger(__name__)
+
+# vip 接口单次最多返回的行数
+VIP_PAGE_SIZE = 5000
+
+# 比较浮点时保留的小数位（与表中 DECIMAL(20,4) 一致）
+COMPARE_DECIMALS = 4
+
+# 判断报表版本先后的列：先比公告日，同日再看 update_flag（'1' 为更新后的版本）
+VERSION_COLUMNS = ('f_ann_date', 'ann_date', 'update_flag')
+
+
+def fetch_period_paged(api_name: str, period: str, pro=None, page_size: int = VIP_PAGE_SIZE,
+                       **kwargs) -> pd.DataFrame:
+    """按 offset/limit 翻页拉取一个报告期的全部数据，最后一页不足 page_size 即结束"""
+    pages: List[pd.DataFrame] = []
+    offset = 0
+    while True:
+        page = python_fetch(api_name, pro=pro, period=period,
+                            offset=offset, limit=page_size, **kwargs)
+        if page is None or page.empty:
+            break
+        pages.append(page)
+        if len(page) < page_size:
+            break
+        offset += page_size
+    if not pages:
+        return pd.DataFrame()
+    df = pd.concat(pages, ignore_index=True)
+    logger.info(f"{api_name} {period}: {len(pages)} 页，共 {len(df)} 行")
+    return df
+
+
+def latest_report_version(df: pd.DataFrame, pk_columns: Sequence[str]) -> pd.DataFrame:
+    """每个主键只保留最新的一版：按 VERSION_COLUMNS 稳定排序后取最后一行"""
+    order = [c for c in VERSION_COLUMNS if c in df.columns]
+    if order:
+        df = df.sort_values(order, kind='mergesort', na_position='first')
+    return df.drop_duplicates(subset=list(pk_columns), keep='last')
+
+
+def load_period_rows(conn, table_name: str, period_column: str, period: str,
+                     columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """读取库中某个报告期已存的行（psycopg2 连接）"""
+    col_list = ', '.join(columns) if columns else '*'
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {col_list} FROM {table_name} WHERE {period_column} = %s",
+                    (pd.to_datetime(period).date(),))
+        names = [d[0] for d in cur.description]
+        return pd.DataFrame(cur.fetchall(), columns=names)
+
+
+def _normalize(s: pd.Series) -> pd.Series:
+    """统一成可比较的值：能全部转为数值的列按数值取整，其余转字符串"""
+    num = pd.to_numeric(s, errors='coerce')
+    if num.notna().sum() == s.notna().sum():
+        return num.astype(float).round(COMPARE_DECIMALS)
+    return s.astype(str).where(s.notna())
+
+
+def diff_changed_rows(new_df: pd.DataFrame, stored_df: pd.DataFrame,
+                      pk_columns: Sequence[str]) -> pd.DataFrame:
+    """返回 new_df 中库里没有、或任一共有列取值不同的行"""
+    pk_columns = list(pk_columns)
+    if new_df.empty or stored_df.empty:
+        return new_df
+    compare = [c for c in new_df.columns if c in stored_df.columns and c not in pk_columns]
+
+    left = new_df[pk_columns + compare].reset_index(drop=True)
+    right = stored_df[pk_columns + compare].drop_duplicates(subset=pk_columns)
+    for c in compare:
+        left[c] = _normalize(left[c])
+        right[c] = _normalize(right[c])
+    for c in pk_columns:
+        left[c] = left[c].astype(str)
+        right[c] = right[c].astype(str)
+
+    merged = left.merge(right, on=pk_columns, how='left', suffixes=('', '__old'), indicator=True)
+    changed = (merged['_merge'] == 'left_only').to_numpy()
+    for c in compare:
+        a, b = merged[c], merged[f'{c}__old']
+        changed |= ~((a == b) | (a.isna() & b.isna())).to_numpy()
+    return new_df.reset_index(drop=True)[changed]
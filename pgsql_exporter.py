@@ -1,5 +1,6 @@
 import time
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from db_pool import get_engine
 from dotenv import load_dotenv 
 from prometheus_client import start_http_server, Gauge
 import os
@@ -14,7 +15,7 @@ market_volume = Gauge('china_market_vol_billion', 'Total trading volume of A-sha
 
 
 def get_db_engine():
-    return create_engine(DSN)
+    return get_engine(DSN)
 
 def get_market_volume_from_db():
     # 数据库连接配置
@@ -14,6 +14,7 @@ import multiprocessing as mp
 import numba
 from datetime import datetime
 from dotenv import load_dotenv
+from data_lake import lake_available, read_lake
 
 load_dotenv('.env')
 DSN = os.getenv('DB_DSN1')
@@ -157,100 +158,123 @@ def process_single_stock(symbol):
             AND trade_date >= '2010-01-01'
         """, conn)
         conn.close()
+        return build_features(symbol, pr, mv)
 
-        # 3.3 数据合并
-        pr['trade_date'] = pd.to_datetime(pr['trade_date'])
-        mv['trade_date'] = pd.to_datetime(mv['trade_date'])
-        
-        # Inner Join: 必须同时有价格和市值
-        df = pd.merge(pr, mv, on='trade_date', how='inner')
-        df = df.sort_values('trade_date').set_index('trade_date')
-        
-        # Join Benchmark
-        df = df.join(mkt_ret_global, how='left')
-        
-        if len(df) < 250: return None
-        
-        # ==========================================
-        # 4. 特征工程 (Factor Calculation)
-        # ==========================================
-        
-        # 基础收益率
-        df['ret'] = df['close'].pct_change()
-        
-        # --- A. 换手率因子 ---
-        # ✅ 修正：直接使用数据库里的 turnover (假设单位是%，需不需要除100看数值大小，做排名因子无所谓)
-        # 如果 turnover 有空值，用 0 填充
-        df['turnover'] = df['turnover'].fillna(0)
-        
-        # --- B. D-MOM 核心因子 ---
-        
-        # 1. 特质波动率 IV
-        valid_idx = (~np.isnan(df['ret'])) & (~np.isnan(df['mkt_ret']))
-        df['IV_20d'] = np.nan
-        if valid_idx.sum() > 30:
-            iv_vals = calc_rolling_iv_numba(
-                df.loc[valid_idx, 'ret'].values,
-                df.loc[valid_idx, 'mkt_ret'].values,
-                window=20
-            )
-            df.loc[valid_idx, 'IV_20d'] = iv_vals
-            
-        # 2. 连涨/连跌天数
-        up_s, down_s = calc_streaks(df['close'].values, window=20)
-        df['up_streak_20d'] = up_s
-        df['down_streak_20d'] = down_s
-        
-        # 3. 基础动量与反转
-        df['return_1m'] = df['close'].pct_change(20) # 月度反转
-        df['return_6m'] = df['close'].pct_change(120) # 中期动量
-        
-        # 4. 市值因子
-        df['log_mv'] = np.log(df['total_mv'])
+    except Exception as e:
+        # print(f"Error {symbol}: {e}")
+        return None
 
-        # ==========================================
-        # 5. 防作弊处理：Shift(1)
-        # ==========================================
-        feature_cols = []
-        
-        # 映射关系：原始列 -> 滞后列 (T1)
-        # 以后只用 _t1 结尾的列训练
-        raw_features = {
-            'log_mv': 'log_mv_t1',
-            'turnover': 'turnover_1m_t1', # 直接用turnover字段
-            'IV_20d': 'IV_20d_t1',
-            'up_streak_20d': 'up_streak_t1',
-            'down_streak_20d': 'down_streak_t1',
-            'return_1m': 'return_1m_t1',
-            'return_6m': 'return_6m_t1'
-        }
-        
-        for raw, t1 in raw_features.items():
-            df[t1] = df[raw].shift(1)
-            feature_cols.append(t1)
-            
-        # 对换手率做个平滑处理 (20日均值)，更稳定
-        df['turnover_1m_t1'] = df['turnover_1m_t1'].rolling(20).mean()
+def process_stock_frames(args):
+    """本地 parquet 镜像模式：行情与市值已在主进程一次性读出，按股票分发"""
+    symbol, pr, mv = args
+    try:
+        return build_features(symbol, pr, mv)
+    except Exception as e:
+        return None
 
-        # ==========================================
-        # 6. 生成标签 (Target)
-        # ==========================================
-        # 预测未来 20 天收益率
-        df['target_return'] = df['close'].shift(-20) / df['close'] - 1
-        df['target_label'] = (df['target_return'] > 0).astype(int)
-        
-        # 7. 整理输出
-        out_cols = feature_cols + ['target_label', 'close']
+def build_features(symbol, pr, mv):
+    """合并行情与市值，计算因子与标签"""
+    # 3.3 数据合并
+    pr['trade_date'] = pd.to_datetime(pr['trade_date'])
+    mv['trade_date'] = pd.to_datetime(mv['trade_date'])
+    
+    # Inner Join: 必须同时有价格和市值
+    df = pd.merge(pr, mv, on='trade_date', how='inner')
+    df = df.sort_values('trade_date').set_index('trade_date')
+    
+    # Join Benchmark
+    df = df.join(mkt_ret_global, how='left')
+    
+    if len(df) < 250: return None
+    
+    # ==========================================
+    # 4. 特征工程 (Factor Calculation)
+    # ==========================================
+    
+    # 基础收益率
+    df['ret'] = df['close'].pct_change()
+    
+    # --- A. 换手率因子 ---
+    # ✅ 修正：直接使用数据库里的 turnover (假设单位是%，需不需要除100看数值大小，做排名因子无所谓)
+    # 如果 turnover 有空值，用 0 填充
+    df['turnover'] = df['turnover'].fillna(0)
+    
+    # --- B. D-MOM 核心因子 ---
+    
+    # 1. 特质波动率 IV
+    valid_idx = (~np.isnan(df['ret'])) & (~np.isnan(df['mkt_ret']))
+    df['IV_20d'] = np.nan
+    if valid_idx.sum() > 30:
+        iv_vals = calc_rolling_iv_numba(
+            df.loc[valid_idx, 'ret'].values,
+            df.loc[valid_idx, 'mkt_ret'].values,
+            window=20
+        )
+        df.loc[valid_idx, 'IV_20d'] = iv_vals
         
-        # 截取有效时间段
-        res = df.loc['2014-01-01':'2026-05-09', out_cols].copy()
-        res['symbol'] = symbol
+    # 2. 连涨/连跌天数
+    up_s, down_s = calc_streaks(df['close'].values, window=20)
+    df['up_streak_20d'] = up_s
+    df['down_streak_20d'] = down_s
+    
+    # 3. 基础动量与反转
+    df['return_1m'] = df['close'].pct_change(20) # 月度反转
+    df['return_6m'] = df['close'].pct_change(120) # 中期动量
+    
+    # 4. 市值因子
+    df['log_mv'] = np.log(df['total_mv'])
+
+    # ==========================================
+    # 5. 防作弊处理：Shift(1)
+    # ==========================================
+    feature_cols = []
+    
+    # 映射关系：原始列 -> 滞后列 (T1)
+    # 以后只用 _t1 结尾的列训练
+    raw_features = {
+        'log_mv': 'log_mv_t1',
+        'turnover': 'turnover_1m_t1', # 直接用turnover字段
+        'IV_20d': 'IV_20d_t1',
+        'up_streak_20d': 'up_streak_t1',
+        'down_streak_20d': 'down_streak_t1',
+        'return_1m': 'return_1m_t1',
+        'return_6m': 'return_6m_t1'
+    }
+    
+    for raw, t1 in raw_features.items():
+        df[t1] = df[raw].shift(1)
+        feature_cols.append(t1)
         
-        return res.reset_index()
+    # 对换手率做个平滑处理 (20日均值)，更稳定
+    df['turnover_1m_t1'] = df['turnover_1m_t1'].rolling(20).mean()
 
-    except Exception as e:
-        # print(f"Error {symbol}: {e}")
-        return None
+    # ==========================================
+    # 6. 生成标签 (Target)
+    # ==========================================
+    # 预测未来 20 天收益率
+    df['target_return'] = df['close'].shift(-20) / df['close'] - 1
+    df['target_label'] = (df['target_return'] > 0).astype(int)
+    
+    # 7. 整理输出
+    out_cols = feature_cols + ['target_label', 'close']
+    
+    # 截取有效时间段
+    res = df.loc['2014-01-01':'2026-05-09', out_cols].copy()
+    res['symbol'] = symbol
+    
+    return res.reset_index()
+
+def load_lake_tasks():
+    """从本地镜像读出全市场后复权行情与市值，按股票切成 (symbol, pr, mv)"""
+    print("正在从本地 parquet 镜像加载行情与市值...")
+    pr_all = read_lake('stock_history', columns=['trade_date', 'symbol', 'close', 'open', 'high', 'low',
+                                                 'volume', 'turnover'],
+                       start='2010-01-01', split='hfq')
+    mv_all = read_lake('daily_basic', columns=['trade_date', 'ts_code', 'total_mv'], start='2010-01-01')
+    mv_all['symbol'] = mv_all['ts_code'].str[:6]
+    mv_groups = {sym: g[['trade_date', 'total_mv']] for sym, g in mv_all.groupby('symbol')}
+    return [(sym, g.drop(columns='symbol'), mv_groups[sym])
+            for sym, g in pr_all.groupby('symbol') if sym in mv_groups]
 
 def init_worker(mkt_data):
     """多进程初始化"""
@@ -262,14 +286,21 @@ def main_etl():
     mkt_ret = get_benchmark_data()
     print(f"基准数据加载完成，共 {len(mkt_ret)} 天")
     
-    # 2. 获取股票列表
-    symbols = get_all_symbols()
+    # 2. 获取股票列表（本地 parquet 镜像覆盖到基准最新交易日时一次性列式读取全市场，不再逐只查库）
+    last_day = mkt_ret.index.max()
+    if lake_available('stock_history', end=last_day, split='hfq') and lake_available('daily_basic', end=last_day):
+        tasks = load_lake_tasks()
+        worker = process_stock_frames
+    else:
+        tasks = get_all_symbols()
+        worker = process_single_stock
+    symbols = tasks
     print(f"开始处理 {len(symbols)} 只股票...")
     
     # 3. 并行计算
     results = []
     with mp.Pool(processes=mp.cpu_count(), initializer=init_worker, initargs=(mkt_ret,)) as pool:
-        for i, res in enumerate(pool.imap_unordered(process_single_stock, symbols, chunksize=20)):
+        for i, res in enumerate(pool.imap_unordered(worker, tasks, chunksize=20)):
             if res is not None:
                 results.append(res)
             if i > 0 and i % 500 == 0:
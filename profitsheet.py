@@ -11,6 +11,7 @@ import pandas as pd
 from retrying import retry
 import logging
 import akshare as ak
+from security_master import get_security_master
 import sys
 import argparse
 
@@ -160,9 +161,7 @@ class ProfitSheetCollector:
         """从东方财富获取利润表数据"""
         try:
             # 转换股票代码格式（如：600519.SH -> SH600519）
-            market = 'SH' if symbol.startswith('6') else 'SZ'
-            code = symbol.replace('.SH', '').replace('.SZ', '')
-            em_symbol = f"{market}{code}"
+            em_symbol = get_security_master(self.db_config).to_em_code(symbol).iloc[0]
             
             df = ak.stock_profit_sheet_by_report_em(symbol=em_symbol)
             logger.info(f"Successfully fetched profit sheet data for {symbol}")
@@ -303,12 +302,7 @@ class ProfitSheetCollector:
     def get_all_stocks(self) -> List[str]:
         """获取所有股票代码"""
         try:
-            df = ak.stock_info_a_code_name()
-            stock_list = [
-                f"{code}.{'SH' if str(code).startswith('6') else 'SZ'}"
-                for code in df['code'].tolist()
-                if str(code).startswith(('0', '3', '6'))
-            ]
+            stock_list = get_security_master(self.db_config).universe()
             logger.info(f"Successfully retrieved {len(stock_list)} stock codes")
             return stock_list
         except Exception as e:
@@ -362,9 +356,8 @@ def main():
             logger.info(f"开始并行初始数据采集（使用 {args.processes} 个进程）...")
             collector.initial_data_collection(num_processes=args.processes)
         else:  # single mode
-            # 处理股票代码格式
-            code = args.code
-            symbol = f"{code}.{'SH' if code.startswith('6') else 'SZ'}"
+            # 任意写法的代码统一转为 ts_code（北交所等由证券主数据判定）
+            symbol = get_security_master(db_config).to_ts_code(args.code).iloc[0]
             collector.update_single_stock(symbol)
     except KeyboardInterrupt:
         logger.info("程序被用户中断")
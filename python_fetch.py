@@ -15,16 +15,51 @@
 2. python python_fetch.py --api sf_month --arg start_m=202401 --arg end_m=202412 --save
 3. python python_fetch.py --api cn_m --arg start_m=202401 --arg end_m=202412 --arg fields=month,m0,m1,m2 --save
 4. python python_fetch.py --api us_tycr --arg start_date=20260101 --arg end_date=20260325 --save
+
+并发：
+python_fetch_many(requests, concurrency=N) 在单个事件循环里并发执行多个请求（线程池承载阻塞 HTTP），
+按完成顺序异步产出结果；同步代码可用 fetch_many(...)。
+
+缓存与离线回放：
+python_fetch 的返回结果按 (api_name, 归一化参数) 做内容寻址缓存，存为 zstd 压缩的 parquet，
+按接口 TTL 失效（API_CACHE_TTL / CLOSED_WINDOW_DAYS），总大小超过上限时按最近访问淘汰（LRU）。
+    PYTHON_FETCH_CACHE=0        关闭缓存
+    PYTHON_FETCH_CACHE_DIR=...  缓存目录
+    PYTHON_FETCH_CACHE_MB=...   缓存大小上限（MB）
+    PYTHON_FETCH_REPLAY=1       回放模式：只读缓存、不访问网络、忽略 TTL，未命中抛 CacheMissError
+    python python_fetch.py --api trade_cal --arg exchange=SSE --replay
+
+限频：
+所有经 python_fetch 的调用共享同一主机上的按接口令牌桶（文件锁实现，跨进程/线程生效），
+每分钟配额见 API_RATE_LIMITS，可用环境变量覆盖，例如：
+    TUSHARE_RATE_LIMITS="daily=500,income=200,default=200"
 """
 
 import argparse
+import asyncio
+import hashlib
+import json
 import os
-from typing import Any, Optional
+import struct
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 下退化为进程内限频
+    fcntl = None
 
 import tushare as ts
 import pandas as pd
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from db_pool import get_engine
+from resilience import TUSHARE, get_breaker, is_retryable
+from schema_registry import ensure_columns, get_columns
+from sqlalchemy import text
 from sqlalchemy.types import Date, Float, String, BigInteger
 
 load_dotenv('/data/akshare/.env')
@@ -84,11 +119,257 @@ MACRO_TABLES = {
 }
 
 
+# 各接口每分钟调用上限（按积分档位调整；未列出的接口使用 default）
+API_RATE_LIMITS = {
+    'default': 200,
+    'daily': 500,
+    'fina_mainbz': 55,
+    'fina_mainbz_vip': 55,
+    'namechange': 30,
+}
+
+# 令牌桶状态目录（同一主机上的所有采集进程共享）
+RATE_LIMIT_DIR = os.getenv('TUSHARE_RATE_DIR', os.path.join(tempfile.gettempdir(), 'tushare_rate'))
+
+_BUCKET_STATE = struct.Struct('dd')  # (剩余令牌数, 上次补充时间)
+
+
+def _load_rate_limits() -> dict:
+    limits = dict(API_RATE_LIMITS)
+    for item in (os.getenv('TUSHARE_RATE_LIMITS') or '').split(','):
+        if '=' in item:
+            key, value = item.split('=', 1)
+            limits[key.strip()] = float(value)
+    return limits
+
+
+class TokenBucket:
+    """
+    跨进程令牌桶：状态保存在 RATE_LIMIT_DIR/<api_name>.bucket，
+    通过 fcntl.flock 串行化读-改-写，线程间再加一把进程内锁。
+    - rate_per_min: 每分钟配额
+    - burst: 桶容量，默认 10 秒的配额，避免一分钟窗口的边界处突发翻倍
+    """
+
+    _thread_locks = {}
+    _thread_locks_guard = threading.Lock()
+
+    def __init__(self, api_name: str, rate_per_min: float, burst: Optional[float] = None):
+        self.api_name = api_name
+        self.rate = rate_per_min / 60.0
+        self.capacity = burst if burst is not None else max(1.0, rate_per_min / 6.0)
+        self.path = os.path.join(RATE_LIMIT_DIR, f'{api_name}.bucket')
+        with TokenBucket._thread_locks_guard:
+            self._lock = TokenBucket._thread_locks.setdefault(self.path, threading.Lock())
+        self._local_state = (self.capacity, time.time())
+
+    def _try_take(self, tokens: float) -> float:
+        """尝试取令牌，成功返回 0，否则返回需要等待的秒数"""
+        with self._lock:
+            if fcntl is None:
+                remaining, wait = self._take_from_state(self._local_state, tokens)
+                self._local_state = remaining
+                return wait
+
+            os.makedirs(RATE_LIMIT_DIR, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = os.pread(fd, _BUCKET_STATE.size, 0)
+                state = _BUCKET_STATE.unpack(raw) if len(raw) == _BUCKET_STATE.size else (self.capacity, time.time())
+                new_state, wait = self._take_from_state(state, tokens)
+                os.pwrite(fd, _BUCKET_STATE.pack(*new_state), 0)
+                return wait
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _take_from_state(self, state, tokens: float):
+        available, last = state
+        now = time.time()
+        available = min(self.capacity, available + max(0.0, now - last) * self.rate)
+        if available >= tokens:
+            return (available - tokens, now), 0.0
+        return (available, now), (tokens - available) / self.rate
+
+    def acquire(self, tokens: float = 1.0):
+        """阻塞直到取得令牌，等待时长恰为配额所需"""
+        while True:
+            wait = self._try_take(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+_BUCKETS = {}
+
+
+def get_rate_limiter(api_name: str) -> Optional[TokenBucket]:
+    """返回接口对应的令牌桶；配额 <= 0 表示不限频"""
+    bucket = _BUCKETS.get(api_name)
+    if bucket is None:
+        limits = _load_rate_limits()
+        rate = limits.get(api_name, limits.get('default', 0))
+        if not rate or rate <= 0:
+            return None
+        bucket = TokenBucket(api_name, rate)
+        _BUCKETS[api_name] = bucket
+    return bucket
+
+
+# ---------------- 响应缓存 ----------------
+# 各接口缓存有效期（秒）
+API_CACHE_TTL = {
+    'stock_basic': 12 * 3600,
+    'trade_cal': 24 * 3600,
+    'namechange': 24 * 3600,
+    'index_weight': 7 * 24 * 3600,
+}
+
+# 请求窗口（end_date / trade_date / period 等）早于 N 天的历史数据视为已封闭，永久缓存
+CLOSED_WINDOW_DAYS = {
+    'daily': 7,
+    'adj_factor': 7,
+    'daily_basic': 7,
+    'suspend_d': 7,
+    'index_daily': 7,
+    'index_dailybasic': 7,
+    'index_weight': 40,
+    'income': 400,
+    'income_vip': 400,
+    'balancesheet': 400,
+    'balancesheet_vip': 400,
+    'cashflow': 400,
+    'fina_mainbz': 400,
+    'fina_mainbz_vip': 400,
+}
+
+_WINDOW_END_KEYS = ('end_date', 'trade_date', 'period', 'end_m', 'm', 'date')
+
+CACHE_DIR = os.getenv('PYTHON_FETCH_CACHE_DIR',
+                      os.path.join(os.path.expanduser('~'), '.cache', 'python_fetch'))
+CACHE_MAX_BYTES = int(float(os.getenv('PYTHON_FETCH_CACHE_MB', '2048')) * 1024 * 1024)
+_EVICT_EVERY_N_WRITES = 50
+_cache_writes = 0
+
+
+class CacheMissError(LookupError):
+    """回放模式下缓存未命中"""
+
+
+def is_replay_mode() -> bool:
+    return os.getenv('PYTHON_FETCH_REPLAY', '0') == '1'
+
+
+def set_replay_mode(enabled: bool = True):
+    """开启/关闭回放模式（写环境变量，multiprocessing 子进程同样生效）"""
+    os.environ['PYTHON_FETCH_REPLAY'] = '1' if enabled else '0'
+
+
+def _cache_enabled() -> bool:
+    return os.getenv('PYTHON_FETCH_CACHE', '1') != '0'
+
+
+def _cache_key(api_name: str, kwargs: Dict[str, Any]) -> str:
+    """内容寻址：api_name + 归一化参数（去掉 None，值统一转字符串，键排序）"""
+    normalized = {k: str(v) for k, v in kwargs.items() if v is not None}
+    payload = json.dumps({'api': api_name, 'kwargs': normalized}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _cache_path(api_name: str, key: str) -> str:
+    return os.path.join(CACHE_DIR, api_name, key[:2], f'{key}.parquet')
+
+
+def _cache_ttl(api_name: str, kwargs: Dict[str, Any]) -> Optional[float]:
+    """返回缓存有效期（秒），None 表示不缓存，float('inf') 表示永久"""
+    closed_days = CLOSED_WINDOW_DAYS.get(api_name)
+    if closed_days is not None:
+        window_end = next((str(kwargs[k]).replace('-', '') for k in _WINDOW_END_KEYS if kwargs.get(k)), None)
+        if window_end:
+            cutoff = (datetime.now() - timedelta(days=closed_days)).strftime('%Y%m%d')
+            # 截断到相同长度比较，兼容 YYYYMM 形式的月份参数
+            if window_end < cutoff[:len(window_end)]:
+                return float('inf')
+    return API_CACHE_TTL.get(api_name)
+
+
+def _cache_read(api_name: str, kwargs: Dict[str, Any], ignore_ttl: bool = False) -> Optional[pd.DataFrame]:
+    path = _cache_path(api_name, _cache_key(api_name, kwargs))
+    try:
+        written_at = os.path.getmtime(path)
+    except OSError:
+        return None
+    if not ignore_ttl:
+        ttl = _cache_ttl(api_name, kwargs)
+        if ttl is None or time.time() - written_at > ttl:
+            return None
+    try:
+        df = pd.read_parquet(path)
+    except Exception:
+        return None
+    # atime 记录最近访问（LRU），mtime 保留写入时间（TTL）
+    os.utime(path, (time.time(), written_at))
+    return df
+
+
+def _cache_write(api_name: str, kwargs: Dict[str, Any], df: pd.DataFrame):
+    global _cache_writes
+    if df is None or _cache_ttl(api_name, kwargs) is None:
+        return
+    path = _cache_path(api_name, _cache_key(api_name, kwargs))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        df.to_parquet(tmp_path, compression='zstd', index=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"⚠️ {api_name}: 写缓存失败 - {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    _cache_writes += 1
+    if _cache_writes % _EVICT_EVERY_N_WRITES == 0:
+        evict_cache()
+
+
+def evict_cache(max_bytes: Optional[int] = None) -> int:
+    """按最近访问时间淘汰缓存文件直到总大小降到上限的 90%，返回删除的文件数"""
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            if not name.endswith('.parquet'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_atime, st.st_size, path))
+            total += st.st_size
+    if total <= max_bytes:
+        return 0
+    removed = 0
+    target = max_bytes * 0.9
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
 def get_db_engine():
-    """创建数据库连接引擎"""
+    """获取数据库连接引擎（进程内按 DSN 复用）"""
     if not DSN:
         raise ValueError("环境变量 DB_DSN1 未设置")
-    return create_engine(DSN)
+    return get_engine(DSN)
 
 
 def get_pro_client(token: Optional[str] = None):
@@ -103,49 +384,163 @@ def get_pro_client(token: Optional[str] = None):
     return client
 
 
-def python_fetch(api_name: str, pro=None, token: Optional[str] = None, **kwargs: Any):
+def python_fetch(api_name: str, pro=None, token: Optional[str] = None,
+                 use_cache: bool = True, **kwargs: Any):
     """
     统一 Tushare 接口调用入口：
     - api_name: 接口名，如 daily / daily_basic / index_daily / sf_month / cn_m / us_tycr
     - pro: 可选，已初始化的 ts.pro_api 客户端（推荐在批处理里复用）
     - token: 可选，不传时自动读取环境变量
+    - use_cache: 是否读写本地响应缓存（回放模式下忽略此参数，始终只读缓存）
     - kwargs: 透传给具体接口的参数
+    调用前会先从该接口的共享令牌桶取令牌，调用方无需再自行 sleep 限速；
+    Tushare 持续故障时熔断器打开，缓存未命中的调用直接抛 resilience.CircuitOpenError
     """
+    if is_replay_mode():
+        df = _cache_read(api_name, kwargs, ignore_ttl=True)
+        if df is None:
+            raise CacheMissError(f"回放模式缓存未命中: {api_name} {kwargs}")
+        return df
+
+    use_cache = use_cache and _cache_enabled()
+    if use_cache:
+        df = _cache_read(api_name, kwargs)
+        if df is not None:
+            return df
+
     client = pro or get_pro_client(token=token)
     if not hasattr(client, api_name):
         raise AttributeError(f"Tushare Pro has no API named '{api_name}'")
-    return getattr(client, api_name)(**kwargs)
+    breaker = get_breaker(TUSHARE)
+    breaker.before_call()
+    limiter = get_rate_limiter(api_name)
+    if limiter is not None:
+        limiter.acquire()
+    try:
+        df = getattr(client, api_name)(**kwargs)
+    except Exception as e:
+        if is_retryable(e):
+            breaker.record_failure(e)
+        raise
+    breaker.record_success()
+    if use_cache:
+        _cache_write(api_name, kwargs, df)
+    return df
+
+
+# 单接口默认并发上限（python_fetch_many 使用；未列出的接口使用 default）
+API_CONCURRENCY_LIMITS = {
+    'default': 4,
+    'daily': 8,
+    'adj_factor': 8,
+    'daily_basic': 8,
+}
+
+FetchRequest = Tuple[str, Dict[str, Any]]
+
+
+async def python_fetch_many(requests: Iterable[FetchRequest], concurrency: int = 8,
+                            per_api_concurrency: Optional[Dict[str, int]] = None,
+                            pro=None, token: Optional[str] = None,
+                            return_exceptions: bool = True) -> AsyncIterator[Tuple[FetchRequest, Any]]:
+    """
+    并发版 python_fetch，按完成顺序产出 (request, DataFrame)：
+    - requests: [(api_name, kwargs), ...]
+    - concurrency: 全局并发上限（即线程池大小）
+    - per_api_concurrency: 单接口并发上限，缺省取 API_CONCURRENCY_LIMITS
+    - return_exceptions: True 时失败请求产出 (request, Exception)，否则直接抛出
+    每个请求仍经过 python_fetch，因此共享令牌桶限频同样生效
+    """
+    client = pro if (pro is not None or is_replay_mode()) else get_pro_client(token=token)
+    limits = dict(API_CONCURRENCY_LIMITS)
+    limits.update(per_api_concurrency or {})
+    semaphores: Dict[str, asyncio.Semaphore] = {}
+    loop = asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='python_fetch') as executor:
+        async def run_one(request: FetchRequest):
+            api_name, kwargs = request
+            sem = semaphores.get(api_name)
+            if sem is None:
+                sem = asyncio.Semaphore(limits.get(api_name, limits['default']))
+                semaphores[api_name] = sem
+            async with sem:
+                try:
+                    df = await loop.run_in_executor(
+                        executor, lambda: python_fetch(api_name, pro=client, **kwargs))
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    return request, e
+            return request, df
+
+        tasks = [asyncio.ensure_future(run_one(req)) for req in requests]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def fetch_many(requests: Iterable[FetchRequest], concurrency: int = 8,
+               on_result: Optional[Callable[[FetchRequest, Any], None]] = None,
+               **kwargs: Any) -> List[Tuple[FetchRequest, Any]]:
+    """
+    python_fetch_many 的同步封装：
+    - 传入 on_result 时，每个请求完成即在调用线程内回调，结果不再保留（返回空列表）
+    - 否则返回按完成顺序排列的全部结果
+    """
+    async def _collect():
+        results = []
+        async for request, result in python_fetch_many(requests, concurrency=concurrency, **kwargs):
+            if on_result is not None:
+                on_result(request, result)
+            else:
+                results.append((request, result))
+        return results
+
+    return asyncio.run(_collect())
+
+
+def get_open_trade_dates(start_date: str, end_date: str, pro=None,
+                         token: Optional[str] = None, exchange: str = 'SSE') -> List[str]:
+    """
+    获取 [start_date, end_date] 区间内的开市日（YYYYMMDD，升序）
+    按交易日横截面拉取（trade_date=...）的采集模式依赖此函数计算待补的交易日
+    """
+    if start_date > end_date:
+        return []
+    df = python_fetch('trade_cal', pro=pro, token=token, exchange=exchange,
+                      start_date=start_date, end_date=end_date, is_open='1',
+                      fields='cal_date')
+    if df is None or df.empty:
+        return []
+    return sorted(df['cal_date'].astype(str).tolist())
 
 
 def ensure_columns_exist(conn, table_name: str, columns: dict):
     """
-    动态检查并添加缺失的列
+    动态检查并添加缺失的列（列信息按进程缓存，只有新列才执行一次 ALTER）
     """
-    # 获取现有列
-    result = conn.execute(text(f"""
-        SELECT column_name 
-        FROM information_schema.columns 
-        WHERE table_name = '{table_name}'
-    """))
-    existing_columns = {row[0] for row in result}
-    
-    # 需要添加的列
+    pg_columns = {}
     for col_name, col_type in columns.items():
-        if col_name not in existing_columns and col_name != 'update_time':
-            # 映射 SQLAlchemy 类型到 PostgreSQL 类型
-            if col_type == Float:
-                pg_type = 'FLOAT'
-            elif col_type == String:
-                pg_type = 'VARCHAR(255)'
-            elif col_type == Date:
-                pg_type = 'DATE'
-            elif col_type == BigInteger:
-                pg_type = 'BIGINT'
-            else:
-                pg_type = 'TEXT'
-            
-            conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {col_name} {pg_type}'))
-            print(f"  添加列: {table_name}.{col_name}")
+        if col_name == 'update_time':
+            continue
+        # 映射 SQLAlchemy 类型到 PostgreSQL 类型
+        if col_type == Float:
+            pg_columns[col_name] = 'FLOAT'
+        elif col_type == String:
+            pg_columns[col_name] = 'VARCHAR(255)'
+        elif col_type == Date:
+            pg_columns[col_name] = 'DATE'
+        elif col_type == BigInteger:
+            pg_columns[col_name] = 'BIGINT'
+        else:
+            pg_columns[col_name] = 'TEXT'
+
+    for col_name in ensure_columns(conn, table_name, pg_columns):
+        print(f"  添加列: {table_name}.{col_name}")
 
 
 def init_macro_tables():
@@ -234,13 +629,8 @@ def save_to_db(df: pd.DataFrame, api_name: str) -> bool:
         df = df.where(pd.notnull(df), None)
         
         with engine.connect() as conn:
-            # 获取 DataFrame 实际有的列（与数据库表取交集）
-            result = conn.execute(text(f"""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name = '{table_name}'
-            """))
-            db_columns = {row[0] for row in result}
+            # 获取 DataFrame 实际有的列（与数据库表取交集，列信息按进程缓存）
+            db_columns = set(get_columns(conn, table_name))
             
             # 过滤 DataFrame，只保留数据库中存在的列
             df_columns = [col for col in df.columns if col in db_columns]
@@ -375,8 +765,15 @@ def main():
     parser.add_argument('--token', default=None, help='Optional Tushare token')
     parser.add_argument('--head', type=int, default=5, help='Print first N rows')
     parser.add_argument('--save', action='store_true', help='Save data to database')
+    parser.add_argument('--replay', action='store_true', help='Serve only from local cache (no network)')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the local response cache')
     args = parser.parse_args()
 
+    if args.replay:
+        set_replay_mode(True)
+    if args.no_cache:
+        os.environ['PYTHON_FETCH_CACHE'] = '0'
+
     kwargs = _parse_kv(args.arg)
     
     # 如果是宏观数据接口，使用专门的函数
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+财报刷新计划：按披露日历决定每天该重新抓哪些股票的东方财富报表，
+替代 Profit / balance / balance_statement 中按月份猜报告期、再把近 7 天没更新的全市场股票都重抓一遍的做法。
+
+披露事件来源（同一 (股票, 报告期) 取优先级最高的一条作为预计披露日）：
+    report_schedule      百度财报日历的预约披露日        （最准确）
+    performance_express  业绩快报公告日                  （正式报表通常随后披露）
+    performance_forecast 业绩预告公告日                  （最早的信号）
+
+对每个 LOOKBACK_DAYS 内已到预计披露日、但目标表里还没有该报告期的 (股票, 报告期)：
+- 预计披露日当天及之后的第一周每天检查一次
+- 之后逐周放慢复查频率：2 天、4 天、8 天……最长 MAX_RECHECK_DAYS 天一次（延期披露的“拖延户”）
+- 每次检查记入 job_ledger（数据集 <表名>_refresh），下次按上次检查时间判断是否到期
+
+    planner = RefreshPlanner(db_config, 'profit_sheet')
+    for symbol in planner.stocks_to_update():          # 按优先级排好序，600519.SH 格式
+        ...抓取、入库...
+        planner.record_attempt(symbol)
+"""
+import logging
+import re
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from db_pool import pooled_connection
+from job_ledger import JobLedger
+from security_master import SecurityMaster, get_security_master
+
+logger = logging.getLogger(__name__)
+
+# 只看最近这么多天内到期的披露事件；更早仍未披露的视为放弃
+LOOKBACK_DAYS = 120
+MAX_RECHECK_DAYS = 8
+
+# 来源优先级（越小越优先）
+SOURCE_RANK = {'schedule': 0, 'express': 1, 'forecast': 2}
+
+_PERIOD_SUFFIX = (('一季', '03-31'), ('中报', '06-30'), ('半年', '06-30'),
+                  ('三季', '09-30'), ('年报', '12-31'), ('年度', '12-31'))
+
+
+@dataclass
+class RefreshItem:
+    symbol: str            # 600519.SH
+    period: str            # 报告期 YYYY-MM-DD
+    expected_date: date    # 预计披露日
+    source: str            # schedule / express / forecast
+
+
+def recheck_interval(days_overdue: int) -> int:
+    """预计披露日之后第 days_overdue 天的复查间隔：第一周每天，之后每周翻倍，封顶 MAX_RECHECK_DAYS"""
+    return min(MAX_RECHECK_DAYS, 2 ** max(0, days_overdue // 7))
+
+
+def parse_schedule_period(label: str, expected_date) -> Optional[str]:
+    """'2024年报' / '2025一季报' 等 -> 报告期 YYYY-MM-DD；解析不了时取预计披露日之前最近的季末"""
+    label = str(label or '')
+    year = re.search(r'(\d{4})', label)
+    if year:
+        for suffix, month_day in _PERIOD_SUFFIX:
+            if suffix in label:
+                return f"{year.group(1)}-{month_day}"
+    if expected_date is None or pd.isna(expected_date):
+        return None
+    quarter = pd.Timestamp(expected_date).to_period('Q') - 1
+    return quarter.end_time.strftime('%Y-%m-%d')
+
+
+def _query(conn, sql: str, params) -> pd.DataFrame:
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        return pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+
+
+def load_disclosure_events(conn, start: date, today: date, master: SecurityMaster) -> pd.DataFrame:
+    """[start, today] 内到期的披露事件，每个 (symbol, period) 一行；symbol 由证券主数据转为 ts_code"""
+    schedule = _query(conn, """
+        SELECT stock_code AS code, report_period AS label, report_date AS expected_date
+        FROM report_schedule
+        WHERE report_date >= %s AND stock_code ~ '^[036][0-9]{5}$'
+    """, (start,))
+    schedule['period'] = [parse_schedule_period(l, d) for l, d in
+                          zip(schedule['label'], schedule['expected_date'])]
+    schedule['source'] = 'schedule'
+
+    announced = _query(conn, """
+        SELECT symbol AS code, report_period::text AS period, announce_date::date AS expected_date,
+               'express' AS source
+        FROM performance_express
+        WHERE announce_date::date >= %s AND symbol ~ '^[036][0-9]{5}$'
+        UNION ALL
+        SELECT DISTINCT symbol, report_period::text, announce_date::date, 'forecast'
+        FROM performance_forecast
+        WHERE announce_date::date >= %s AND symbol ~ '^[036][0-9]{5}$'
+    """, (start, start))
+    if not announced.empty:
+        announced['period'] = pd.to_datetime(announced['period'], errors='coerce').dt.strftime('%Y-%m-%d')
+
+    events = pd.concat([schedule[['code', 'period', 'expected_date', 'source']], announced],
+                       ignore_index=True).dropna(subset=['period', 'expected_date'])
+    if events.empty:
+        return events
+    events['expected_date'] = pd.to_datetime(events['expected_date']).dt.date
+    events['rank'] = events['source'].map(SOURCE_RANK)
+    # 同一报告期有预约披露日时以它为准：预约在未来的，即便已出快报也还不到抓正式报表的时候
+    events = events.sort_values(['rank', 'expected_date']).drop_duplicates(['code', 'period'], keep='first')
+    events = events[events['expected_date'] <= today]
+    events['symbol'] = master.to_ts_code(events['code'].astype(str).str.zfill(6)).values
+    return events.drop(columns=['code']).reset_index(drop=True)
+
+
+def existing_periods(conn, table_name: str, symbols: Sequence[str], periods: Sequence[str]) -> set:
+    """目标表中已有的 (symbol, 报告期)"""
+    if not symbols:
+        return set()
+    rows = _query(conn, f"""
+        SELECT DISTINCT symbol, LEFT(report_date::text, 10) AS period
+        FROM {table_name}
+        WHERE symbol = ANY(%s) AND LEFT(report_date::text, 10) = ANY(%s)
+    """, (list(symbols), list(periods)))
+    return set(zip(rows['symbol'], rows['period']))
+
+
+class RefreshPlanner:
+    def __init__(self, db_params: Dict, table_name: str, lookback_days: int = LOOKBACK_DAYS):
+        self.db_params = db_params
+        self.table_name = table_name
+        self.lookback_days = lookback_days
+        self.ledger = JobLedger(db_params, f'{table_name}_refresh')
+        self._pending: Dict[str, List[str]] = {}
+
+    def plan(self, today: Optional[date] = None) -> List[RefreshItem]:
+        """今天需要检查的 (股票, 报告期)，按来源优先级、逾期天数从少到多排序"""
+        today = today or date.today()
+        start = today - timedelta(days=self.lookback_days)
+        master = get_security_master(self.db_params)
+        with pooled_connection(self.db_params) as conn:
+            events = load_disclosure_events(conn, start, today, master)
+            if events.empty:
+                logger.info(f"{self.table_name}: 最近 {self.lookback_days} 天没有到期的披露事件")
+                return []
+            have = existing_periods(conn, self.table_name, events['symbol'].unique().tolist(),
+                                    events['period'].unique().tolist())
+
+        missing = events[[(s, p) not in have for s, p in zip(events['symbol'], events['period'])]]
+        self.ledger.init_table()
+        attempts = self.ledger.load_finished(missing['symbol'].unique().tolist())
+
+        items, waiting = [], 0
+        for row in missing.sort_values(['rank', 'expected_date'], ascending=[True, False]).itertuples():
+            period_key = row.period.replace('-', '')
+            last = attempts.get((row.symbol, period_key, period_key))
+            overdue = (today - row.expected_date).days
+            if last is not None and last.date() >= row.expected_date \
+                    and (today - last.date()).days < recheck_interval(overdue):
+                waiting += 1
+                continue
+            items.append(RefreshItem(row.symbol, row.period, row.expected_date, row.source))
+
+        logger.info(f"{self.table_name}: 到期披露事件 {len(events)} 个，已入库 {len(events) - len(missing)}，"
+                    f"今日检查 {len(items)}，等待下次复查 {waiting}")
+        self._pending = {}
+        for item in items:
+            self._pending.setdefault(item.symbol, []).append(item.period)
+        return items
+
+    def stocks_to_update(self, today: Optional[date] = None) -> List[str]:
+        """今天需要重新抓取的股票（去重，保持优先级顺序）；东方财富接口一次返回全部报告期"""
+        items = self.plan(today)
+        return list(dict.fromkeys(item.symbol for item in items))
+
+    def record_attempt(self, symbol: str):
+        """抓取完成（无论是否已披露）后记账，决定下次复查时间"""
+        for period in self._pending.get(symbol, []):
+            period_key = period.replace('-', '')
+            self.ledger.record(symbol, period_key, period_key)
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+统一的重试与熔断策略，替代各采集脚本里复制粘贴的 retry_on_exception 和手写的 sleep 循环。
+
+- is_retryable: 区分上游故障（超时、连接重置、429、接口配额）与代码/数据错误（KeyError、字段缺失……），
+  后者重试没有意义，立即抛出
+- backoff_delay: 指数退避 + 抖动，避免多个 worker 同步重试
+- CircuitBreaker: 每个上游一个熔断器（东方财富、新浪、Tushare、百度……），连续失败达到阈值后打开，
+  冷却期内的调用直接抛 CircuitOpenError，不再逐只股票地 sleep 重试；冷却结束放行一个探测请求，
+  成功则关闭，失败则以加倍的冷却时间重新打开
+
+熔断状态保存在 BREAKER_DIR/<upstream>.breaker，通过 fcntl.flock 在同一主机的所有采集进程间共享
+（与 python_fetch 的令牌桶相同做法），一个进程发现上游故障后，其余进程的排队任务同样快速失败。
+
+    @retry_on_exception(retries=3, delay=5, backoff=2, upstream=EASTMONEY)
+    def fetch_stock_data(symbol, ...):
+        return ak.stock_zh_a_hist(...)
+
+    try:
+        df = fetch_stock_data('000001', ...)
+    except CircuitOpenError as e:
+        ...  # 上游熔断中：记为 deferred，e.retry_after 秒后再排队
+"""
+import logging
+import os
+import random
+import socket
+import struct
+import tempfile
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 下退化为进程内熔断
+    fcntl = None
+
+import requests
+
+from adaptive_concurrency import is_throttle_error
+
+logger = logging.getLogger(__name__)
+
+# 上游名称（熔断器按上游划分，同一上游的不同接口共享一个熔断器）
+EASTMONEY = 'eastmoney'
+SINA = 'sina'
+TUSHARE = 'tushare'
+BAIDU = 'baidu'
+LEGU = 'legu'
+
+# 默认熔断参数
+FAILURE_THRESHOLD = 5       # 连续失败次数
+RESET_TIMEOUT = 60.0        # 首次打开的冷却时间（秒）
+MAX_RESET_TIMEOUT = 600.0   # 反复打开时冷却时间翻倍的上限
+
+# 默认退避上限（秒）
+MAX_BACKOFF = 60.0
+
+BREAKER_DIR = os.getenv('UPSTREAM_BREAKER_DIR', os.path.join(tempfile.gettempdir(), 'upstream_breaker'))
+
+_BREAKER_STATE = struct.Struct('dddd')  # (连续失败次数, 打开截止时间, 连续打开次数, 探测中)
+_CLOSED = (0.0, 0.0, 0.0, 0.0)
+
+# 代码或数据本身的错误：重试结果不会变（json.JSONDecodeError 虽是 ValueError，但先被判为限流）
+_NON_RETRYABLE = (KeyError, IndexError, AttributeError, TypeError, ValueError, NameError,
+                  LookupError, NotImplementedError, AssertionError, ZeroDivisionError)
+# Tushare 配额、网关类报错只体现在异常文本里
+_RETRYABLE_TEXT = ('最多访问', '频率', 'Max retries exceeded', 'RemoteDisconnected',
+                   'Connection aborted', '502', '504')
+
+
+class CircuitOpenError(RuntimeError):
+    """上游熔断中，调用未发出"""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} 熔断中，{retry_after:.0f}s 后恢复探测")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """异常是否值得重试：网络/超时/限流/上游 5xx 为 True，代码与数据错误为 False"""
+    if isinstance(exc, CircuitOpenError):
+        return False
+    if is_throttle_error(exc):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code >= 500
+    if isinstance(exc, (requests.RequestException, socket.error, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(exc, _NON_RETRYABLE):
+        return False
+    text = str(exc)
+    if any(marker in text for marker in _RETRYABLE_TEXT):
+        return True
+    # 其余未分类的异常（akshare 的裸 Exception、调用方主动抛的“返回空数据”等）按可重试处理
+    return type(exc) is Exception
+
+
+def backoff_delay(attempt: int, delay: float = 5.0, backoff: float = 2.0,
+                  max_delay: float = MAX_BACKOFF) -> float:
+    """第 attempt 次重试（从 0 计）前的等待：指数增长、封顶，并在 [1/2, 1] 倍之间随机抖动"""
+    ceiling = min(max_delay, delay * backoff ** attempt)
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class CircuitBreaker:
+    """
+    跨进程熔断器：closed -> open（连续失败达到阈值）-> half-open（冷却结束，放行一个探测）
+    - 只有 is_retryable 的失败才计数，代码错误不影响上游状态
+    - half-open 探测期间其他调用仍快速失败，探测请求的时限同样为当前冷却时间
+    """
+
+    _thread_locks: Dict[str, threading.Lock] = {}
+    _thread_locks_guard = threading.Lock()
+
+    def __init__(self, upstream: str, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT, max_reset_timeout: float = MAX_RESET_TIMEOUT):
+        self.upstream = upstream
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.path = os.path.join(BREAKER_DIR, f'{upstream}.breaker')
+        with CircuitBreaker._thread_locks_guard:
+            self._lock = CircuitBreaker._thread_locks.setdefault(self.path, threading.Lock())
+        self._local_state = _CLOSED
+
+    # ---------- 共享状态 ----------
+    def _update(self, func: Callable[[tuple, float], tuple]) -> tuple:
+        """在锁内读取状态、交给 func 计算新状态并写回，返回新状态"""
+        with self._lock:
+            now = time.time()
+            if fcntl is None:
+                self._local_state = func(self._local_state, now)
+                return self._local_state
+
+            os.makedirs(BREAKER_DIR, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = os.pread(fd, _BREAKER_STATE.size, 0)
+                state = _BREAKER_STATE.unpack(raw) if len(raw) == _BREAKER_STATE.size else _CLOSED
+                new_state = func(state, now)
+                if new_state != state:
+                    os.pwrite(fd, _BREAKER_STATE.pack(*new_state), 0)
+                return new_state
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _cooldown(self, trips: float) -> float:
+        return min(self.max_reset_timeout, self.reset_timeout * 2 ** max(trips - 1, 0))
+
+    # ---------- 状态转换 ----------
+    def before_call(self):
+        """放行则返回，熔断中抛 CircuitOpenError；冷却结束时本次调用成为探测请求"""
+        outcome = {}
+
+        def step(state, now):
+            failures, open_until, trips, _ = state
+            if open_until and now < open_until:
+                outcome['retry_after'] = open_until - now
+                return state
+            if open_until:
+                # half-open：占住探测名额，其他调用在探测结束前继续快速失败
+                outcome['probe'] = True
+                return failures, now + self._cooldown(trips), trips, 1.0
+            return state
+
+        self._update(step)
+        if 'retry_after' in outcome:
+            raise CircuitOpenError(self.upstream, outcome['retry_after'])
+        if outcome.get('probe'):
+            logger.info(f"[{self.upstream}] 熔断冷却结束，放行探测请求")
+
+    def record_success(self):
+        recovered = {}
+
+        def step(state, now):
+            if state[1]:
+                recovered['yes'] = True
+            return _CLOSED
+
+        self._update(step)
+        if recovered:
+            logger.info(f"[{self.upstream}] 探测成功，熔断关闭")
+
+    def record_failure(self, exc: Optional[BaseException] = None):
+        tripped = {}
+
+        def step(state, now):
+            failures, open_until, trips, probing = state
+            if open_until and now < open_until and not probing:
+                # 已经打开：熔断前就在途的请求陆续失败，不重复计数
+                return state
+            failures += 1
+            # 探测失败，或连续失败达到阈值：打开（连续打开时冷却时间翻倍）
+            if probing or failures >= self.failure_threshold:
+                trips += 1
+                tripped['cooldown'] = self._cooldown(trips)
+                return failures, now + tripped['cooldown'], trips, 0.0
+            return failures, open_until, trips, probing
+
+        self._update(step)
+        if tripped:
+            logger.warning(f"[{self.upstream}] 上游连续失败，熔断 {tripped['cooldown']:.0f}s"
+                           f"{f'（最近错误: {exc}）' if exc is not None else ''}")
+
+    # ---------- 查询 ----------
+    def _read(self) -> tuple:
+        return self._update(lambda state, now: state)
+
+    def retry_after(self) -> float:
+        """距离允许探测还有多少秒；未熔断时为 0"""
+        _, open_until, _, _ = self._read()
+        return max(0.0, open_until - time.time()) if open_until else 0.0
+
+    def state(self) -> str:
+        _, open_until, _, _ = self._read()
+        if not open_until:
+            return 'closed'
+        return 'open' if time.time() < open_until else 'half_open'
+
+    def reset(self):
+        self._update(lambda state, now: _CLOSED)
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在熔断器下执行一次调用（不重试）"""
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if is_retryable(e):
+                self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+
+_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(upstream: str, **kwargs) -> CircuitBreaker:
+    """按上游取进程内共享的熔断器（首次创建时 kwargs 生效，状态本身跨进程共享）"""
+    with _lock:
+        breaker = _breakers.get(upstream)
+        if breaker is None:
+            breaker = CircuitBreaker(upstream, **kwargs)
+            _breakers[upstream] = breaker
+        return breaker
+
+
+def retry_on_exception(retries=3, delay=5, backoff=2, exceptions=(Exception,),
+                       upstream: Optional[str] = None, max_delay: float = MAX_BACKOFF):
+    """
+    重试装饰器（参数与原各脚本中的版本兼容）
+    - 只重试 exceptions 中且 is_retryable 的异常，代码/数据错误立即抛出
+    - 退避带抖动并封顶 max_delay
+    - 指定 upstream 时经过该上游的熔断器：熔断中直接抛 CircuitOpenError，
+      重试过程中熔断器打开则停止重试，不再等满退避时间
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            breaker = get_breaker(upstream) if upstream else None
+            for attempt in range(retries + 1):
+                if breaker is not None:
+                    breaker.before_call()
+                try:
+                    result = func(*args, **kwargs)
+                except exceptions as e:
+                    if not is_retryable(e):
+                        raise
+                    if breaker is not None:
+                        breaker.record_failure(e)
+                        wait_for = breaker.retry_after()
+                        if wait_for > 0:
+                            raise CircuitOpenError(upstream, wait_for) from e
+                    if attempt == retries:
+                        raise
+                    wait_time = backoff_delay(attempt, delay, backoff, max_delay)
+                    logger.warning(f"{func.__name__} 尝试 {attempt + 1}/{retries + 1} 失败: {e}，"
+                                   f"{wait_time:.2f}s 后重试...")
+                    time.sleep(wait_time)
+                    continue
+                if breaker is not None:
+                    breaker.record_success()
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+进程级表结构缓存：每个进程对每张表只查一次 information_schema.columns，
+之后的列检查都在内存里完成；只有出现真正的新列时才做一次协调的 ALTER TABLE。
+
+    cols = get_columns(conn, 'income')                        # {column: data_type}
+    added = ensure_columns(conn, 'income', {'new_col': 'DECIMAL(20,4)'})
+
+ensure_columns 的协调方式：
+1. 先用缓存判断，全部已存在直接返回（绝大多数调用走这里，无数据库往返）
+2. 有新列时取该表的事务级 advisory lock，重新读取目录（其他进程可能刚加过）
+3. 剩余缺失列合并成一条 ALTER TABLE ... ADD COLUMN IF NOT EXISTS ..., ... 执行，刷新缓存
+多个 worker 同时发现同一新列时只有一个真正执行 ALTER，其余在锁上排队后发现无需再加。
+
+conn 可以是 psycopg2 连接，也可以是 SQLAlchemy Connection；本模块不 commit，由调用方控制事务。
+"""
+import logging
+import threading
+from typing import Dict, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# (数据库标识, 表名) -> {column_name: data_type}
+_COLUMNS: Dict[tuple, Dict[str, str]] = {}
+
+
+def _db_id(conn) -> str:
+    dsn = getattr(conn, 'dsn', None)
+    if dsn:
+        return dsn
+    return str(conn.engine.url)
+
+
+def _execute(conn, sql: str, params: tuple = ()):
+    """兼容 psycopg2 连接与 SQLAlchemy Connection（%s 占位符）"""
+    if hasattr(conn, 'cursor'):
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall() if cur.description else []
+    result = conn.exec_driver_sql(sql, params)
+    return result.fetchall() if result.returns_rows else []
+
+
+def _load(conn, table_name: str) -> Dict[str, str]:
+    rows = _execute(conn, """
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+    """, (table_name,))
+    columns = dict(rows)
+    with _lock:
+        _COLUMNS[(_db_id(conn), table_name)] = columns
+    return columns
+
+
+def get_columns(conn, table_name: str) -> Dict[str, str]:
+    """表的列及类型，进程内首次访问时查询目录，之后走缓存"""
+    columns = _COLUMNS.get((_db_id(conn), table_name))
+    if columns is None:
+        columns = _load(conn, table_name)
+    return columns
+
+
+def refresh_columns(conn, table_name: str) -> Dict[str, str]:
+    """强制重新读取某张表的列（表被外部修改后调用）"""
+    return _load(conn, table_name)
+
+
+def invalidate_columns(table_name: Optional[str] = None):
+    """丢弃缓存；不传表名时清空全部"""
+    with _lock:
+        for key in list(_COLUMNS):
+            if table_name is None or key[1] == table_name:
+                del _COLUMNS[key]
+
+
+def ensure_columns(conn, table_name: str, columns: Mapping[str, str]) -> List[str]:
+    """
+    确保 columns（列名 -> 建列类型）都存在，返回本次实际新增的列
+    - 已存在的列不做任何检查，不会修改类型
+    """
+    missing = [c for c in columns if c not in get_columns(conn, table_name)]
+    if not missing:
+        return []
+
+    # 协调：同一张表的结构变更串行执行，拿到锁后以目录为准重新判断
+    _execute(conn, "SELECT pg_advisory_xact_lock(hashtext(%s))", (table_name,))
+    existing = refresh_columns(conn, table_name)
+    missing = [c for c in missing if c not in existing]
+    if not missing:
+        return []
+
+    adds = ', '.join(f'ADD COLUMN IF NOT EXISTS "{c}" {columns[c]}' for c in missing)
+    _execute(conn, f'ALTER TABLE {table_name} {adds}')
+    refresh_columns(conn, table_name)
+    logger.info(f"{table_name} 新增列: {missing}")
+    return missing
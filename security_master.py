@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+证券主数据：股票代码三种写法的互转、板块、上市/退市日期与状态，替代各采集脚本里
+反复下载 ak.stock_info_a_code_name() / stock_basic 再用各自的字符串规则拼 .SH/.SZ 的做法。
+
+    sm = get_security_master(db_params)              # 进程内单例：本地缓存 -> security_master 表
+    sm.universe()                                    # 当前上市的沪深 A 股（0/3/6 开头），ts_code 格式
+    sm.universe(boards=('main', 'chinext'), fmt='symbol', as_of='2020-06-30')
+    sm.to_ts_code(['600519', 'SZ000001'])            # 向量化：-> ['600519.SH', '000001.SZ']
+    sm.to_em_code(df['ts_code'])                     # -> SH600519 / SZ000001（东方财富报表接口）
+    sm.lookup(['000001'])                            # 名称、板块、上市/退市日期、状态
+
+三种代码写法：
+    symbol   600519        六位代码
+    ts_code  600519.SH     tushare / 本仓库大部分表
+    em_code  SH600519      东方财富 *_by_report_em 接口
+
+主数据由 `python security_master.py --refresh` 从 tushare stock_basic（L/D/P 三种状态）刷新入库；
+读取时优先本地 CSV 缓存（CACHE_TTL 内），过期读表，表为空或最近一次刷新早于 MASTER_TTL 时先从 tushare 刷新
+（新股上市、退市不依赖另行调度），刷新失败沿用表内数据，表不可用时退回过期缓存。
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from typing import Iterable, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from bulk_loader import copy_upsert
+from db_pool import get_engine, pooled_connection
+
+logger = logging.getLogger(__name__)
+
+MASTER_TABLE = 'security_master'
+CACHE_DIR = os.getenv('SECURITY_MASTER_CACHE_DIR',
+                      os.path.join(os.path.expanduser('~'), '.cache', 'security_master'))
+CACHE_TTL = 12 * 3600
+# 表内数据超过这个时长（按 MAX(update_time)）视为过期，读取时从 tushare 重新刷新
+MASTER_TTL = float(os.getenv('SECURITY_MASTER_TTL_HOURS', '24')) * 3600
+
+MASTER_COLUMNS = ['ts_code', 'symbol', 'em_code', 'name', 'exchange', 'board', 'industry',
+                  'list_status', 'list_date', 'delist_date']
+
+# 板块：main 主板 / chinext 创业板 / star 科创板 / bse 北交所
+A_SHARE_BOARDS = ('main', 'chinext', 'star')
+ALL_BOARDS = A_SHARE_BOARDS + ('bse',)
+
+_SUFFIX_TO_EM = {'SH': 'SH', 'SZ': 'SZ', 'BJ': 'BJ'}
+
+# 可重入：get_security_master 持锁加载时，过期刷新会在 refresh_master 里再次取锁
+_lock = threading.RLock()
+_master: Optional['SecurityMaster'] = None
+
+Codes = Union[str, Sequence[str], pd.Series, np.ndarray]
+
+
+# ---------- 代码规则（向量化，不依赖主数据） ----------
+def _as_series(codes: Codes) -> pd.Series:
+    if isinstance(codes, str):
+        codes = [codes]
+    if isinstance(codes, pd.Series):
+        return codes.astype(str).str.strip().str.upper()
+    return pd.Series(list(codes), dtype=object).astype(str).str.strip().str.upper()
+
+
+def normalize_symbol(codes: Codes) -> pd.Series:
+    """任意写法 -> 六位代码"""
+    s = _as_series(codes)
+    return s.str.extract(r'(\d{6})', expand=False)
+
+
+def exchange_suffix(symbols: Codes) -> pd.Series:
+    """六位代码 -> SH / SZ / BJ（6、9 开头沪市，4、8、92 开头北交所，其余深市）"""
+    s = normalize_symbol(symbols)
+    suffix = np.where(s.str[:1].isin(['6', '9']) & ~s.str[:2].eq('92'), 'SH',
+                      np.where(s.str[:1].isin(['4', '8']) | s.str[:2].eq('92'), 'BJ', 'SZ'))
+    return pd.Series(suffix, index=s.index).where(s.notna())
+
+
+def board_of(symbols: Codes) -> pd.Series:
+    """六位代码 -> 板块"""
+    s = normalize_symbol(symbols)
+    board = np.select(
+        [s.str[:3].isin(['688', '689']), s.str[:3].isin(['300', '301']),
+         s.str[:1].isin(['4', '8']) | s.str[:2].eq('92')],
+        ['star', 'chinext', 'bse'], default='main')
+    return pd.Series(board, index=s.index).where(s.notna())
+
+
+def _rule_ts_code(codes: Codes) -> pd.Series:
+    s = _as_series(codes)
+    symbol = normalize_symbol(s)
+    # 已带后缀/前缀的保留原交易所，否则按代码规则推断
+    explicit = s.str.extract(r'(SH|SZ|BJ)', expand=False)
+    return symbol + '.' + explicit.fillna(exchange_suffix(symbol))
+
+
+# ---------- 缓存 ----------
+def _cache_path() -> str:
+    return os.path.join(CACHE_DIR, f'{MASTER_TABLE}.csv')
+
+
+def _read_cache(ignore_ttl: bool = False) -> Optional[pd.DataFrame]:
+    path = _cache_path()
+    try:
+        if not ignore_ttl and time.time() - os.path.getmtime(path) > CACHE_TTL:
+            return None
+        return pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[''])
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(df: pd.DataFrame):
+    path = _cache_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+
+# ---------- 表 ----------
+def init_table(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {MASTER_TABLE} (
+                ts_code     VARCHAR(10) PRIMARY KEY,
+                symbol      VARCHAR(6),
+                em_code     VARCHAR(8),
+                name        VARCHAR(50),
+                exchange    VARCHAR(2),
+                board       VARCHAR(10),
+                industry    VARCHAR(30),
+                list_status VARCHAR(1),
+                list_date   DATE,
+                delist_date DATE,
+                update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {MASTER_TABLE}_symbol_idx ON {MASTER_TABLE} (symbol)")
+
+
+def build_master(stock_basic: pd.DataFrame) -> pd.DataFrame:
+    """tushare stock_basic（含 L/D/P）-> 主数据表结构"""
+    df = stock_basic.drop_duplicates(subset=['ts_code'], keep='last').copy()
+    df['symbol'] = normalize_symbol(df['ts_code']).values
+    df['exchange'] = df['ts_code'].str[-2:].str.upper()
+    df['em_code'] = df['exchange'].map(_SUFFIX_TO_EM) + df['symbol']
+    df['board'] = board_of(df['symbol']).values
+    for col in ('list_date', 'delist_date'):
+        df[col] = pd.to_datetime(df.get(col), format='%Y%m%d', errors='coerce').dt.date
+    for col in ('name', 'industry', 'list_status'):
+        if col not in df.columns:
+            df[col] = None
+    return df[MASTER_COLUMNS].reset_index(drop=True)
+
+
+def refresh_master(db_params, pro=None) -> int:
+    """从 tushare stock_basic 全量刷新主数据表（上市/退市/暂停上市各一次调用），返回行数"""
+    from python_fetch import python_fetch
+
+    fields = 'ts_code,symbol,name,industry,list_status,list_date,delist_date'
+    frames = [python_fetch('stock_basic', pro=pro, exchange='', list_status=status, fields=fields)
+              for status in ('L', 'D', 'P')]
+    master = build_master(pd.concat([f for f in frames if f is not None], ignore_index=True))
+    with pooled_connection(db_params) as conn:
+        init_table(conn)
+        written = copy_upsert(conn, master, MASTER_TABLE, pk_columns=['ts_code'], touch_update_time=True)
+    _write_cache(master)
+    global _master
+    with _lock:
+        _master = None
+    logger.info(f"{MASTER_TABLE} 已刷新：{len(master)} 只（上市 {(master['list_status'] == 'L').sum()}）")
+    return written
+
+
+def _read_table(db_params=None) -> pd.DataFrame:
+    sql = f"SELECT {', '.join(MASTER_COLUMNS)} FROM {MASTER_TABLE}"
+    if db_params is None:
+        return pd.read_sql_query(sql, get_engine())
+    with pooled_connection(db_params) as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            return pd.DataFrame(cur.fetchall(), columns=MASTER_COLUMNS)
+
+
+def _table_age(db_params) -> Optional[float]:
+    """距表内最近一次刷新的秒数，表不存在或为空时返回 None"""
+    with pooled_connection(db_params) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)", (MASTER_TABLE,))
+            if cur.fetchone()[0] is None:
+                return None
+            cur.execute(f"SELECT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - MAX(update_time)) FROM {MASTER_TABLE}")
+            age = cur.fetchone()[0]
+    return None if age is None else float(age)
+
+
+def _refresh_if_stale(db_params):
+    """表为空或过期时从 tushare 刷新；表里已有数据时刷新失败只告警"""
+    age = _table_age(db_params)
+    if age is not None and age <= MASTER_TTL:
+        return
+    if age is None:
+        logger.warning(f"{MASTER_TABLE} 为空，从 tushare 初始化")
+        refresh_master(db_params)
+        return
+    logger.info(f"{MASTER_TABLE} 已 {age / 3600:.1f} 小时未刷新，从 tushare 更新")
+    try:
+        refresh_master(db_params)
+    except Exception as e:
+        logger.warning(f"刷新 {MASTER_TABLE} 失败，沿用表内数据: {e}")
+
+
+# ---------- 查询 ----------
+class SecurityMaster:
+    def __init__(self, master: pd.DataFrame):
+        df = master.copy()
+        for col in ('list_date', 'delist_date'):
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        # 极少数六位代码被退市公司用过又重新分配，同一代码以在市的那条为准
+        live = df['list_status'].eq('L')
+        df = df.assign(_live=live).sort_values(['_live', 'list_date'])
+        df = df.drop_duplicates(subset=['symbol'], keep='last').drop(columns='_live')
+        self._df = df.set_index('symbol', drop=False)
+        self._by_symbol_ts = df.set_index('symbol')['ts_code']
+
+    def __len__(self) -> int:
+        return len(self._df)
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        return self._df.reset_index(drop=True)
+
+    def to_ts_code(self, codes: Codes) -> pd.Series:
+        """任意写法 -> ts_code；主数据里没有的按代码规则推断"""
+        symbols = normalize_symbol(codes)
+        known = symbols.map(self._by_symbol_ts)
+        return known.fillna(_rule_ts_code(codes).set_axis(symbols.index))
+
+    def to_symbol(self, codes: Codes) -> pd.Series:
+        return normalize_symbol(codes)
+
+    def to_em_code(self, codes: Codes) -> pd.Series:
+        ts_code = self.to_ts_code(codes)
+        return ts_code.str[-2:].map(_SUFFIX_TO_EM) + ts_code.str[:6]
+
+    def lookup(self, codes: Codes) -> pd.DataFrame:
+        """按输入顺序返回主数据行（未知代码为空行）"""
+        symbols = normalize_symbol(codes)
+        return self._df.reindex(symbols.values).reset_index(drop=True)
+
+    def universe(self, boards: Iterable[str] = A_SHARE_BOARDS, as_of=None,
+                 fmt: str = 'ts_code', include_paused: bool = False) -> list:
+        """
+        股票池
+        - as_of 为空：当前上市（list_status='L'，include_paused 时含暂停上市 P）
+        - as_of 指定：该日已上市且未退市（含此后退市的，用于回测时避免幸存者偏差）
+        - fmt: 'ts_code' / 'symbol' / 'em_code'
+        """
+        df = self._df[self._df['board'].isin(list(boards))]
+        if as_of is None:
+            statuses = ['L', 'P'] if include_paused else ['L']
+            df = df[df['list_status'].isin(statuses)]
+        else:
+            day = pd.Timestamp(as_of)
+            df = df[(df['list_date'] <= day) & (df['delist_date'].isna() | (df['delist_date'] > day))]
+        df = df.sort_values('ts_code')
+        if fmt == 'symbol':
+            return df['symbol'].tolist()
+        if fmt == 'em_code':
+            return df['em_code'].tolist()
+        return df['ts_code'].tolist()
+
+
+def load_master(db_params=None, use_cache: bool = True) -> SecurityMaster:
+    """
+    读本地缓存，过期或缺失时读 security_master 表并回写缓存；db_params 缺省使用 DB_DSN1 引擎
+    给了 db_params 时，表为空或超过 MASTER_TTL 未刷新先从 tushare 刷新
+    """
+    df = _read_cache() if use_cache else None
+    if df is None:
+        try:
+            if db_params is not None:
+                _refresh_if_stale(db_params)
+            df = _read_table(db_params)
+            _write_cache(df)
+            logger.info(f"证券主数据已从 {MASTER_TABLE} 加载：{len(df)} 只")
+        except Exception as e:
+            df = _read_cache(ignore_ttl=True)
+            if df is None:
+                raise
+            logger.warning(f"读取 {MASTER_TABLE} 失败，使用过期的本地缓存: {e}")
+    return SecurityMaster(df)
+
+
+def get_security_master(db_params=None) -> SecurityMaster:
+    """进程内单例"""
+    global _master
+    if _master is None:
+        with _lock:
+            if _master is None:
+                _master = load_master(db_params)
+    return _master
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='证券主数据')
+    parser.add_argument('--refresh', action='store_true', help='从 tushare stock_basic 刷新主数据表')
+    parser.add_argument('--lookup', type=str, default=None, help='查询代码，逗号分隔，任意写法')
+    args = parser.parse_args()
+
+    from double_single_growth_selector import load_db_config
+    db_config = load_db_config()
+    if args.refresh:
+        refresh_master(db_config)
+    if args.lookup:
+        print(get_security_master(db_config).lookup(args.lookup.split(',')).to_string())
+
+
+if __name__ == '__main__':
+    main()
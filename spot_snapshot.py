@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+收盘快照模式：收盘后一次 ak.stock_zh_a_spot_em 拉取全市场当日行情，规整成 stock_history /
+daily_basic 的表结构一次写入，替代每只股票一次 ak.stock_zh_a_hist 的日常追加。
+
+    trade_date = snapshot_trade_date()               # 今天不是交易日或尚未收盘时为 None
+    spot = fetch_spot_snapshot()
+    bars = snapshot_to_bars(spot, trade_date)        # stock_history 不复权行（adjust_type=''）
+    basic = snapshot_to_daily_basic(spot, trade_date)
+    gaps = gap_tasks(watermarks.get, bars['symbol'], trade_date, '20170101')
+
+快照只能补“今天”这一根 K 线。某只股票在今天之前还缺交易日（采集中断、新上市、复牌）时，
+按交易日历比对水位得出缺口，只对这些股票走逐只历史接口补齐。
+"""
+import logging
+from datetime import date, datetime, time as dtime
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import akshare as ak
+import pandas as pd
+
+from resilience import EASTMONEY, retry_on_exception
+from trade_calendar import get_calendar
+
+logger = logging.getLogger(__name__)
+
+# 快照视为收盘价的最早时间（留出收盘集合竞价后行情落定的几分钟）
+SNAPSHOT_READY_TIME = dtime(15, 5)
+
+_BAR_MAP = {
+    '代码': 'symbol',
+    '今开': 'open',
+    '最新价': 'close',
+    '最高': 'high',
+    '最低': 'low',
+    '成交量': 'volume',
+    '成交额': 'amount',
+    '振幅': 'amplitude',
+    '涨跌幅': 'pct_change',
+    '涨跌额': 'change',
+    '换手率': 'turnover',
+}
+BAR_COLUMNS = ['trade_date', 'symbol', 'open', 'close', 'high', 'low', 'volume', 'amount',
+               'amplitude', 'pct_change', 'change', 'turnover', 'adjust_type']
+
+DAILY_BASIC_COLUMNS = ['close', 'turnover_rate', 'volume_ratio', 'pe', 'pe_ttm', 'pb',
+                       'ps', 'ps_ttm', 'dv_ratio', 'dv_ttm',
+                       'total_share', 'float_share', 'free_share', 'total_mv', 'circ_mv']
+
+
+@retry_on_exception(retries=3, delay=5, backoff=2, upstream=EASTMONEY)
+def fetch_spot_snapshot() -> pd.DataFrame:
+    """全市场实时行情快照（一次请求）"""
+    df = ak.stock_zh_a_spot_em()
+    if df is None or df.empty:
+        raise Exception("全市场快照返回空数据")
+    logger.info(f"全市场快照: {len(df)} 只")
+    return df
+
+
+def snapshot_trade_date(now: Optional[datetime] = None) -> Optional[str]:
+    """快照可作为收盘数据的交易日（YYYYMMDD）：今天是交易日且已过 SNAPSHOT_READY_TIME，否则 None"""
+    now = now or datetime.now()
+    if not get_calendar().is_open(now.date()):
+        logger.info(f"{now.date()} 不是交易日，没有收盘快照")
+        return None
+    if now.time() < SNAPSHOT_READY_TIME:
+        logger.info(f"尚未收盘（{SNAPSHOT_READY_TIME:%H:%M} 之后快照才是收盘价）")
+        return None
+    return now.strftime('%Y%m%d')
+
+
+def _traded(spot: pd.DataFrame) -> pd.DataFrame:
+    """只保留 0/3/6 开头、当日有成交的 A 股（停牌股最新价为空或成交量为 0）"""
+    df = spot.copy()
+    df['代码'] = df['代码'].astype(str).str.zfill(6)
+    volume = pd.to_numeric(df['成交量'], errors='coerce')
+    price = pd.to_numeric(df['最新价'], errors='coerce')
+    mask = df['代码'].str[:1].isin(['0', '3', '6']) & (volume > 0) & price.notna()
+    return df[mask].drop_duplicates(subset=['代码'])
+
+
+def snapshot_to_bars(spot: pd.DataFrame, trade_date: str) -> pd.DataFrame:
+    """快照 -> stock_history 不复权行；成交量单位与 stock_zh_a_hist 一致（手）"""
+    df = _traded(spot).rename(columns=_BAR_MAP)
+    for col in BAR_COLUMNS[2:-1]:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['volume'] = df['volume'].round().astype('int64')
+    df['trade_date'] = pd.Timestamp(trade_date).date()
+    df['adjust_type'] = ''
+    return df[BAR_COLUMNS].reset_index(drop=True)
+
+
+def snapshot_to_daily_basic(spot: pd.DataFrame, trade_date: str) -> pd.DataFrame:
+    """快照 -> daily_basic 行（ts_code 为 6 位代码，市值由元换算为万元，与 tushare daily_basic 一致）"""
+    df = _traded(spot)
+    out = pd.DataFrame({'ts_code': df['代码'].values})
+    out['trade_date'] = pd.Timestamp(trade_date).date()
+    for col in DAILY_BASIC_COLUMNS:
+        out[col] = None
+    out['close'] = pd.to_numeric(df['最新价'], errors='coerce').values
+    out['turnover_rate'] = pd.to_numeric(df['换手率'], errors='coerce').values
+    out['volume_ratio'] = pd.to_numeric(df['量比'], errors='coerce').values
+    out['pb'] = pd.to_numeric(df['市净率'], errors='coerce').values
+    out['total_mv'] = pd.to_numeric(df['总市值'], errors='coerce').values / 10000
+    out['circ_mv'] = pd.to_numeric(df['流通市值'], errors='coerce').values / 10000
+    return out[['ts_code', 'trade_date'] + DAILY_BASIC_COLUMNS]
+
+
+def gap_tasks(latest_for: Callable[[str], Optional[date]], symbols: Iterable[str],
+              trade_date: str, default_start: str) -> List[Tuple[str, str, str]]:
+    """
+    对照交易日历找出 trade_date 之前还缺交易日的股票，返回 [(symbol, 起始日, 截止日)]（YYYYMMDD）
+    - latest_for(symbol): 该股票库中最新交易日，没有数据时为 None（新股从 default_start 补）
+    - 截止日为 trade_date 的上一交易日，trade_date 当天由快照写入
+    """
+    cal = get_calendar()
+    expected = cal.prev_open(trade_date)
+    end = expected.strftime('%Y%m%d')
+    tasks = []
+    for symbol in symbols:
+        latest = latest_for(symbol)
+        if latest is None:
+            start = default_start
+        elif pd.Timestamp(latest) >= expected:
+            continue
+        else:
+            start = cal.next_open(latest).strftime('%Y%m%d')
+        if start <= end:
+            tasks.append((symbol, start, end))
+    return tasks
@@ -8,6 +8,7 @@ python stock_basic.py --tushare_token YOUR_TOKEN
 import tushare as ts
 import pandas as pd
 import psycopg2
+from db_pool import pooled_connection
 from psycopg2.extras import execute_values
 import logging
 import argparse
@@ -39,7 +40,7 @@ class StockBasicCollector:
 
     # ---------- PG 连接 ----------
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def init_table(self):
         sql = f"""
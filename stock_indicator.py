@@ -2,6 +2,7 @@ import akshare as ak
 import pandas as pd
 from datetime import datetime
 import psycopg2
+from db_pool import pooled_connection
 from psycopg2.extras import execute_values
 import logging
 from typing import List, Optional
@@ -54,7 +55,7 @@ class StockIndicatorCollector:
 
     def get_db_connection(self):
         """获取数据库连接"""
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     @retry(stop_max_attempt_number=3, wait_fixed=2000)
     def get_stock_list(self) -> List[str]:
@@ -2,6 +2,7 @@ import akshare as ak
 import pandas as pd
 from datetime import datetime, timedelta
 import psycopg2
+from db_pool import pooled_connection
 from psycopg2.extras import execute_values
 import logging
 from typing import List, Optional, Dict, Any
@@ -72,7 +73,7 @@ class EnhancedStockIndicatorCollector:
 
     def get_db_connection(self):
         """获取数据库连接"""
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     @retry(stop_max_attempt_number=3, wait_exponential_multiplier=1000, wait_exponential_max=10000)
     def get_stock_list(self) -> List[str]:
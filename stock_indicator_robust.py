@@ -2,6 +2,7 @@ import akshare as ak
 import pandas as pd
 from datetime import datetime, timedelta
 import psycopg2
+from db_pool import pooled_connection
 from psycopg2.extras import execute_values
 import logging
 from typing import List, Optional, Dict, Any
@@ -11,9 +12,9 @@ import json
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-import random
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
+from adaptive_concurrency import get_controller, log_rate_report
 
 # 设置日志
 logging.basicConfig(
@@ -27,16 +28,19 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class RobustStockIndicatorCollector:
-    def __init__(self, db_params: dict, max_workers: int = 3):
+    def __init__(self, db_params: dict, max_workers: int = 8):
         """初始化健壮版数据采集器
         
         Args:
             db_params: 数据库连接参数
-            max_workers: 最大并发工作线程数（降低以减少API压力）
+            max_workers: 并发上限；实际并发由 AIMD 控制器根据上游状态在 1 ~ max_workers 之间自适应
+                         抓取并发与数据库连接数无关：线程多于连接池上限时，写库前在池上排队等待归还
         """
         self.db_params = db_params
         self.table_name = 'stock_indicator'
         self.max_workers = max_workers
+        # 乐咕接口的自适应并发控制器：延迟稳定时加并发，限流/超时/连接重置时减半
+        self.legu = get_controller('legu_indicator', initial=2, max_limit=max_workers)
         self.session = self._create_session()
         self.lock = threading.Lock()
         
@@ -75,14 +79,14 @@ class RobustStockIndicatorCollector:
 
     def get_db_connection(self):
         """获取数据库连接"""
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     @retry(stop_max_attempt_number=3, wait_exponential_multiplier=2000, wait_exponential_max=15000)
     def get_stock_list(self) -> List[str]:
         """获取股票列表，带重试机制"""
         try:
             logger.info("正在获取股票列表...")
-            df = ak.stock_a_indicator_lg(symbol="all")
+            df = self.legu.call(ak.stock_a_indicator_lg, symbol="all")
             
             if df is None or df.empty:
                 logger.warning("获取股票列表返回空数据，重试...")
@@ -97,27 +101,18 @@ class RobustStockIndicatorCollector:
             raise
 
     def get_latest_trade_date(self, symbol: str) -> Optional[str]:
-        """获取数据库中最新的交易日期"""
-        try:
-            with self.get_db_connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(f"""
-                        SELECT trade_date 
-                        FROM {self.table_name}
-                        WHERE symbol = %s
-                        ORDER BY trade_date DESC
-                        LIMIT 1
-                    """, (symbol,))
-                    result = cur.fetchone()
-                    return result[0] if result else None
-        except Exception as e:
-            logger.warning(f"获取股票 {symbol} 最新交易日期失败: {str(e)}")
-            return None
-
-    def _smart_delay(self, base_delay: float = 2.0, jitter: float = 1.0):
-        """智能延时，增加基础延时避免API限流"""
-        delay = base_delay + random.uniform(0, jitter)
-        time.sleep(delay)
+        """获取数据库中最新的交易日期；查询失败直接抛出，不能当作“没有数据”去全量重抓"""
+        with self.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT trade_date 
+                    FROM {self.table_name}
+                    WHERE symbol = %s
+                    ORDER BY trade_date DESC
+                    LIMIT 1
+                """, (symbol,))
+                result = cur.fetchone()
+                return result[0] if result else None
 
     def _validate_dataframe(self, df, symbol: str) -> bool:
         """验证DataFrame的有效性"""
@@ -167,11 +162,8 @@ class RobustStockIndicatorCollector:
             股票数据DataFrame或None
         """
         try:
-            # 智能延时
-            self._smart_delay(2.0, 1.0)
-            
-            # 获取数据
-            df = ak.stock_a_indicator_lg(symbol=symbol)
+            # 获取数据（并发由自适应控制器放行，不再固定 sleep）
+            df = self.legu.call(ak.stock_a_indicator_lg, symbol=symbol)
             
             # 验证数据有效性
             if not self._validate_dataframe(df, symbol):
@@ -274,15 +266,16 @@ class RobustStockIndicatorCollector:
         }
         
         try:
+            # 增量模式先取水位：查询失败时该股票记为 error 跳过，不会被当成新股票全量重抓
+            latest_date = self.get_latest_trade_date(symbol) if mode == 'incremental' else None
+
             # 获取数据
             df = self.get_stock_data(symbol)
             
             if df is not None and not df.empty:
                 # 如果是增量模式，只保留最新数据
-                if mode == 'incremental':
-                    latest_date = self.get_latest_trade_date(symbol)
-                    if latest_date:
-                        df = df[df['trade_date'] > latest_date]
+                if latest_date:
+                    df = df[df['trade_date'] > latest_date]
                 
                 if not df.empty:
                     df = self.process_data(df, symbol)
@@ -344,7 +337,7 @@ class RobustStockIndicatorCollector:
         try:
             stock_list = self.get_stock_list()
             total_stocks = len(stock_list)
-            logger.info(f"开始{mode}模式的并行数据采集，共 {total_stocks} 只股票，使用 {self.max_workers} 个线程")
+            logger.info(f"开始{mode}模式的并行数据采集，共 {total_stocks} 只股票，并发上限 {self.max_workers}（自适应）")
             
             # 重置统计信息
             self.stats = {
@@ -444,6 +437,7 @@ class RobustStockIndicatorCollector:
                    f"成功: {self.stats['success_count']}, "
                    f"错误: {self.stats['error_count']}, "
                    f"跳过: {self.stats['skipped_count']}")
+        log_rate_report()
 
     def _log_final_stats(self):
         """输出最终统计信息"""
@@ -451,6 +445,7 @@ class RobustStockIndicatorCollector:
                    f"成功: {self.stats['success_count']}, "
                    f"错误: {self.stats['error_count']}, "
                    f"跳过: {self.stats['skipped_count']}")
+        log_rate_report()
 
 def main():
     # 数据库连接参数
@@ -462,8 +457,8 @@ def main():
         'database': 'Financialdata'
     }
     
-    # 创建健壮版采集器实例（降低并发数）
-    collector = RobustStockIndicatorCollector(db_params, max_workers=3)
+    # 创建健壮版采集器实例（并发在 1 ~ 8 之间自适应）
+    collector = RobustStockIndicatorCollector(db_params, max_workers=8)
     
     # 执行采集
     try:
@@ -477,4 +472,4 @@ def main():
         logger.error(f"数据采集失败: {str(e)}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
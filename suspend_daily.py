@@ -5,22 +5,26 @@
 python suspend_daily.py --mode incremental          \
                         --processes 4               \
                         --start_date 20040101
+按交易日横截面（每个缺失交易日一次 suspend_d 调用）：
+python suspend_daily.py --mode incremental --by-date
 """
 import os
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
+from db_pool import pooled_connection
 import logging
-import random
-import time
 import multiprocessing
 import argparse
 import sys
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from functools import wraps
 from typing import List, Dict, Optional
-from python_fetch import python_fetch, get_pro_client
+from watermark import WatermarkStore
+from bulk_loader import copy_upsert
+from collector_framework import DatasetConfig, PipelineCollector
+from resilience import retry_on_exception
+from python_fetch import python_fetch, get_pro_client, get_open_trade_dates
+from security_master import ALL_BOARDS, get_security_master
 
 load_dotenv('.env')
 
@@ -35,31 +39,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ---------------- 工具 ----------------
-def chunks(lst: List, n: int) -> List[List]:
-    if not lst:
-        return []
-    chunk_size = (len(lst) + n - 1) // n
-    return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
-
-def retry_on_exception(retries=3, delay=5, backoff=2, exceptions=(Exception,)):
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            retry_delay = delay
-            for retry in range(retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except exceptions as e:
-                    if retry == retries:
-                        raise
-                    wait_time = retry_delay + random.uniform(0, 1)
-                    logger.warning(f"尝试 {retry + 1}/{retries} 失败: {e}，{wait_time:.2f}s 后重试...")
-                    time.sleep(wait_time)
-                    retry_delay *= backoff
-        return wrapper
-    return decorator
-
 # ---------------- 采集器 ----------------
 class SuspendDailyCollector:
     def __init__(self, db_params: dict):
@@ -72,7 +51,7 @@ class SuspendDailyCollector:
 
     # ---------- PG 连接 ----------
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def init_table(self):
         sql = f"""
@@ -93,23 +72,24 @@ class SuspendDailyCollector:
     # ---------- 股票列表 ----------
     def get_stock_list(self) -> List[str]:
         """获取当日可交易股票列表（可自己扩展）"""
-        df = python_fetch('stock_basic', pro=self.pro, exchange='', list_status='L',
-                                 fields='ts_code')
-        return df['ts_code'].tolist()
+        return get_security_master(self.db_params).universe(boards=ALL_BOARDS)
 
     # ---------- 增量用 ----------
-    def get_latest_trade_date(self, ts_code: str) -> Optional[datetime]:
-        sql = f"""
-            SELECT MAX(trade_date)
-            FROM {self.table_name}
-            WHERE ts_code = %s
-        """
+    def get_table_watermark(self) -> Optional[datetime]:
+        sql = f"SELECT MAX(trade_date) FROM {self.table_name}"
         with self.get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(sql, (ts_code,))
+                cur.execute(sql)
                 row = cur.fetchone()
                 return row[0] if row and row[0] else None
 
+    def load_watermarks(self) -> WatermarkStore:
+        """一次分组查询加载全部 ts_code 的最新交易日"""
+        store = WatermarkStore(self.table_name, key_columns=('ts_code',))
+        with self.get_db_connection() as conn:
+            store.load(conn)
+        return store
+
     # ---------- 拉数据 ----------
     @retry_on_exception(retries=3, delay=5, backoff=2)
     def fetch_data(self, ts_code: str, start_date: str, end_date: str) -> pd.DataFrame:
@@ -118,6 +98,34 @@ class SuspendDailyCollector:
                                end_date=end_date)
         return df
 
+    @retry_on_exception(retries=3, delay=5, backoff=2)
+    def fetch_data_by_trade_date(self, trade_date: str) -> pd.DataFrame:
+        return python_fetch('suspend_d', pro=self.pro, trade_date=trade_date)
+
+    # ---------- 按交易日横截面 ----------
+    def collect_by_trade_date(self, start_date: str, end_date: str, mode: str = 'incremental'):
+        if mode == 'incremental':
+            latest = self.get_table_watermark()
+            if latest:
+                start_date = max(start_date, (latest + timedelta(days=1)).strftime('%Y%m%d'))
+        trade_dates = get_open_trade_dates(start_date, end_date, pro=self.pro)
+        if not trade_dates:
+            logger.info(f"{start_date} ~ {end_date} 无待补交易日")
+            return
+        logger.info(f"按交易日采集：{len(trade_dates)} 个交易日 ({trade_dates[0]} ~ {trade_dates[-1]})")
+        ok, ng = 0, 0
+        for idx, trade_date in enumerate(trade_dates, 1):
+            try:
+                df = self.fetch_data_by_trade_date(trade_date)
+                if df is not None and not df.empty:
+                    self.save_to_db(self.process_data(df))
+                ok += 1
+                logger.info(f"[{idx}/{len(trade_dates)}]  {trade_date} 完成，{0 if df is None else len(df)} 条")
+            except Exception as e:
+                ng += 1
+                logger.error(f"{trade_date} 出错: {e}", exc_info=True)
+        logger.info(f"按交易日采集结束，成功 {ok}，失败 {ng}")
+
     # ---------- 清洗 ----------
     def process_data(self, df: pd.DataFrame) -> pd.DataFrame:
         if df.empty:
@@ -138,57 +146,34 @@ class SuspendDailyCollector:
         df = df.sort_values(['ts_code', 'trade_date'])
         df = df.drop_duplicates(subset=['ts_code', 'trade_date'], keep='last')
 
-        # 3. 生成 SQL
-        vals = [tuple(x) for x in df.values]
-        sql = f"""
-            INSERT INTO {self.table_name} ({','.join(cols)})
-            VALUES %s
-            ON CONFLICT (ts_code, trade_date)
-            DO UPDATE SET
-            {','.join(f"{c}=EXCLUDED.{c}" for c in cols if c not in ['ts_code','trade_date'])}
-        """
-
-        # 4. 写入
+        # 3. COPY 到暂存表后一次合并写入
         with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                execute_values(cur, sql, vals)
-                conn.commit()
+            copy_upsert(conn, df, self.table_name, pk_columns=['ts_code', 'trade_date'])
+            conn.commit()
         logger.info(f"Upsert {len(df)} 条记录")
 
-# ---------------- 多进程任务 ----------------
-def process_stock_batch(db_params: Dict, stock_batch: List[str],
-                       batch_id: int, start_date: str, end_date: str, mode: str):
-    if not stock_batch:
-        logger.warning(f"Batch {batch_id} 空列表，跳过")
-        return
-    collector = SuspendDailyCollector(db_params)
-    ok, ng = 0, 0
-    for idx, ts_code in enumerate(stock_batch, 1):
-        try:
-            time.sleep(random.uniform(0.6, 1.8))          # 限速
-            if mode == 'incremental':
-                latest = collector.get_latest_trade_date(ts_code)
-                if latest:
-                    start_date = (latest + timedelta(days=1)).strftime('%Y%m%d')
-            df = collector.fetch_data(ts_code, start_date, end_date)
-            if df is not None and not df.empty:
-                collector.save_to_db(collector.process_data(df))
-                ok += 1
-                logger.info(f"Batch {batch_id}  [{idx}/{len(stock_batch)}]  {ts_code} 完成")
-            else:
-                logger.warning(f"Batch {batch_id}  {ts_code} 无数据")
-        except Exception as e:
-            ng += 1
-            logger.error(f"Batch {batch_id}  {ts_code} 出错: {e}", exc_info=True)
-    logger.info(f"Batch {batch_id} 结束，成功 {ok}，失败 {ng}")
+    # ---------- 流水线配置 ----------
+    def dataset_config(self, fetch_workers: int = 4) -> DatasetConfig:
+        cols = ['ts_code', 'trade_date', 'suspend_timing', 'suspend_type']
+
+        def transform(df: pd.DataFrame) -> pd.DataFrame:
+            df = self.process_data(df)
+            return df[cols] if not df.empty else df
+
+        return DatasetConfig(name='suspend_daily', table_name=self.table_name,
+                             pk_columns=['ts_code', 'trade_date'],
+                             fetch=self.fetch_data, transform=transform,
+                             fetch_workers=fetch_workers)
 
 # ---------------- main ----------------
 def main():
     parser = argparse.ArgumentParser(description='每日停复牌信息采集（suspend_d）')
     parser.add_argument('--mode', choices=['incremental', 'full'], default='incremental')
-    parser.add_argument('--processes', type=int, default=4, help='并行进程数')
+    parser.add_argument('--processes', type=int, default=4, help='并发拉取线程数')
     parser.add_argument('--start_date', type=str, default='20040101')
     parser.add_argument('--end_date', type=str, default=datetime.now().strftime('%Y%m%d'))
+    parser.add_argument('--by-date', action='store_true',
+                        help='按交易日拉取全市场横截面，替代逐只股票循环')
     args = parser.parse_args()
 
     db_params = dict(host='192.168.50.149', port=5432, user='postgres',
@@ -197,15 +182,15 @@ def main():
     collector = SuspendDailyCollector(db_params)
     collector.init_table()
 
+    if args.by_date:
+        collector.collect_by_trade_date(args.start_date, args.end_date, args.mode)
+        logger.info("全部完成")
+        return
+
     stocks = collector.get_stock_list()
-    num = min(args.processes, len(stocks))
-    batches = chunks(stocks, num)
-    tasks = [(db_params, b, i, args.start_date, args.end_date, args.mode)
-            for i, b in enumerate(batches) if b]
-
-    logger.info(f"共 {len(stocks)} 只股票，{num} 进程，{len(tasks)} 个批次，模式={args.mode}")
-    with multiprocessing.Pool(processes=num) as pool:
-        pool.starmap(process_stock_batch, tasks)
+    num = max(1, min(args.processes, len(stocks)))
+    PipelineCollector(collector.dataset_config(num), db_params).run(
+        stocks, args.start_date, args.end_date, mode=args.mode)
     logger.info("全部完成")
 
 if __name__ == '__main__':
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""cn_number 解析规则的单元测试（不依赖数据库）：python -m pytest test_cn_number.py"""
+import math
+
+import pandas as pd
+import pytest
+
+from cn_number import parse_cn_number, parse_numeric_columns, unparsed_count
+
+
+def _parse(*values):
+    return parse_cn_number(pd.Series(list(values), dtype=object)).tolist()
+
+
+def test_unit_suffixes():
+    assert _parse('1.5万亿', '12.3亿', '-1234.5万', '2千') == pytest.approx([1.5e12, 1.23e9, -12345000.0, 2000.0])
+
+
+def test_percent_keeps_percentage_points():
+    assert _parse('45.6%', '-3.2%') == pytest.approx([45.6, -3.2])
+
+
+def test_dimension_words_are_dropped():
+    assert _parse('0.52元', '12.5倍', '3次', '1.2亿元') == pytest.approx([0.52, 12.5, 3.0, 1.2e8])
+
+
+def test_thousands_separators():
+    assert _parse('1,234,567', '-1,234.5万', '1，000') == pytest.approx([1234567.0, -12345000.0, 1000.0])
+
+
+def test_placeholders_and_garbage_are_nan():
+    assert all(math.isnan(v) for v in _parse('--', '-', '', None, 'False', 'abc', '1.2.3'))
+
+
+def test_numeric_column_passes_through():
+    s = pd.Series([1, 2, 3], index=[10, 11, 12])
+    out = parse_cn_number(s)
+    assert out.dtype == 'float64'
+    assert out.index.tolist() == [10, 11, 12]
+    assert out.tolist() == [1.0, 2.0, 3.0]
+
+
+def test_unparsed_count_ignores_placeholders():
+    raw = pd.Series(['abc', '--', None, '1亿', ''], dtype=object)
+    assert unparsed_count(raw, parse_cn_number(raw)) == 1
+
+
+def test_parse_numeric_columns_skips_excluded():
+    df = pd.DataFrame({'symbol': ['000001'], 'eps': ['0.52元'], 'revenue': ['12.3亿']})
+    out = parse_numeric_columns(df, exclude=['symbol'])
+    assert out['symbol'].tolist() == ['000001']
+    assert out['eps'].tolist() == pytest.approx([0.52])
+    assert out['revenue'].tolist() == pytest.approx([1.23e9])
+    assert df['eps'].tolist() == ['0.52元']
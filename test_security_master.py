@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""security_master 代码互转与板块规则的单元测试（用内存主数据，不连数据库）：python -m pytest test_security_master.py"""
+import pandas as pd
+import pytest
+
+from security_master import ALL_BOARDS, SecurityMaster, board_of, build_master, exchange_suffix
+
+
+@pytest.fixture
+def master():
+    stock_basic = pd.DataFrame({
+        'ts_code': ['600519.SH', '000001.SZ', '688981.SH', '300750.SZ', '920118.BJ'],
+        'name': ['贵州茅台', '平安银行', '中芯国际', '宁德时代', '太湖远大'],
+        'industry': ['白酒', '银行', '半导体', '电气设备', '化工原料'],
+        'list_status': ['L', 'L', 'L', 'L', 'L'],
+        'list_date': ['20010827', '19910403', '20200716', '20180611', '20240102'],
+        'delist_date': [None, None, None, None, None],
+    })
+    return SecurityMaster(build_master(stock_basic))
+
+
+def test_exchange_suffix_rules():
+    codes = ['600519', '900901', '000001', '300750', '830799', '430047', '920118']
+    assert exchange_suffix(codes).tolist() == ['SH', 'SH', 'SZ', 'SZ', 'BJ', 'BJ', 'BJ']
+
+
+def test_board_rules():
+    codes = ['600519', '688981', '300750', '301001', '830799', '920118']
+    assert board_of(codes).tolist() == ['main', 'star', 'chinext', 'chinext', 'bse', 'bse']
+
+
+def test_to_ts_code_any_notation(master):
+    codes = ['600519', 'SZ000001', '688981.SH', 'sh600519', '920118']
+    assert master.to_ts_code(codes).tolist() == ['600519.SH', '000001.SZ', '688981.SH', '600519.SH', '920118.BJ']
+
+
+def test_to_ts_code_falls_back_to_rules_for_unknown_codes(master):
+    assert master.to_ts_code(['920002', '830799', '002594', '601318']).tolist() == \
+        ['920002.BJ', '830799.BJ', '002594.SZ', '601318.SH']
+
+
+def test_to_em_code(master):
+    assert master.to_em_code(['600519.SH', '000001', '920118', '920002']).tolist() == \
+        ['SH600519', 'SZ000001', 'BJ920118', 'BJ920002']
+
+
+def test_universe_boards_and_formats(master):
+    assert master.universe() == ['000001.SZ', '300750.SZ', '600519.SH', '688981.SH']
+    assert master.universe(boards=ALL_BOARDS, fmt='em_code') == \
+        ['SZ000001', 'SZ300750', 'SH600519', 'SH688981', 'BJ920118']
+    assert master.universe(boards=('main',), fmt='symbol') == ['000001', '600519']
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+交易日历服务：从 sync_trade_cal.py 维护的 trade_cal 表加载一次，本地文件缓存，之后全部内存计算。
+替代各脚本里 SELECT DISTINCT trade_date FROM index_daily WHERE ts_code='000300.SH' 的临时拼日历。
+
+    cal = get_calendar()                        # 进程内单例
+    cal.is_open('20240102')
+    cal.next_open('2024-01-05')                 # 严格晚于该日的下一个交易日
+    cal.prev_open('2024-01-06')
+    cal.offset('20240105', 5)                   # 往后第 5 个交易日（负数往前）
+    cal.range('20240101', '20240331')           # DatetimeIndex
+    cal.month_ends('20200101', '20241231')      # 每月最后一个交易日
+    cal.quarter_ends('20200101', '20241231')
+
+日期参数接受 'YYYYMMDD' / 'YYYY-MM-DD' / date / datetime / Timestamp；查询为 O(1)（is_open）或 O(log n)。
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from db_pool import get_engine
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_TABLE = 'trade_cal'
+CACHE_DIR = os.getenv('TRADE_CALENDAR_CACHE_DIR',
+                      os.path.join(os.path.expanduser('~'), '.cache', 'trade_calendar'))
+# 本地缓存有效期（秒）；过期后重新读库，读库失败时继续使用过期缓存
+CACHE_TTL = 12 * 3600
+
+_lock = threading.Lock()
+_calendars: Dict[str, 'TradingCalendar'] = {}
+
+
+def _to_day(value) -> np.datetime64:
+    return np.datetime64(pd.Timestamp(value).date(), 'D')
+
+
+class TradingCalendar:
+    def __init__(self, open_dates):
+        days = np.unique(np.array([_to_day(d) for d in open_dates], dtype='datetime64[D]'))
+        self._days = days
+        self._index = {d: i for i, d in enumerate(days.tolist())}
+
+    def __len__(self) -> int:
+        return len(self._days)
+
+    @property
+    def first(self) -> pd.Timestamp:
+        return pd.Timestamp(self._days[0])
+
+    @property
+    def last(self) -> pd.Timestamp:
+        return pd.Timestamp(self._days[-1])
+
+    def _check_bounds(self, pos: int, value) -> int:
+        if pos < 0 or pos >= len(self._days):
+            raise ValueError(f"{value} 超出交易日历范围 {self.first.date()} ~ {self.last.date()}")
+        return pos
+
+    # ---------- 单日查询 ----------
+    def is_open(self, value) -> bool:
+        return _to_day(value).item() in self._index
+
+    def next_open(self, value, inclusive: bool = False) -> pd.Timestamp:
+        """下一个交易日；inclusive=True 时当天是交易日则返回当天"""
+        side = 'left' if inclusive else 'right'
+        pos = int(np.searchsorted(self._days, _to_day(value), side=side))
+        return pd.Timestamp(self._days[self._check_bounds(pos, value)])
+
+    def prev_open(self, value, inclusive: bool = False) -> pd.Timestamp:
+        """上一个交易日；inclusive=True 时当天是交易日则返回当天"""
+        side = 'right' if inclusive else 'left'
+        pos = int(np.searchsorted(self._days, _to_day(value), side=side)) - 1
+        return pd.Timestamp(self._days[self._check_bounds(pos, value)])
+
+    def offset(self, value, n: int, clip: bool = False) -> pd.Timestamp:
+        """
+        第 n 个交易日偏移：n>0 往后、n<0 往前、n=0 为当天或之前最近的交易日
+        非交易日先对齐到之前最近的交易日再偏移；clip=True 时越界截到日历首尾
+        """
+        pos = int(np.searchsorted(self._days, _to_day(value), side='right')) - 1 + n
+        if clip:
+            pos = min(max(pos, 0), len(self._days) - 1)
+        return pd.Timestamp(self._days[self._check_bounds(pos, value)])
+
+    def count(self, start, end) -> int:
+        """[start, end] 之间的交易日数"""
+        lo = np.searchsorted(self._days, _to_day(start), side='left')
+        hi = np.searchsorted(self._days, _to_day(end), side='right')
+        return int(max(hi - lo, 0))
+
+    # ---------- 区间 ----------
+    def range(self, start, end) -> pd.DatetimeIndex:
+        """[start, end] 内的全部交易日"""
+        lo = np.searchsorted(self._days, _to_day(start), side='left')
+        hi = np.searchsorted(self._days, _to_day(end), side='right')
+        return pd.DatetimeIndex(self._days[lo:hi], name='trade_date')
+
+    def _period_ends(self, start, end, freq: str) -> pd.DatetimeIndex:
+        days = self.range(start, end)
+        if days.empty:
+            return days
+        periods = days.to_period(freq)
+        last_of_period = np.append(periods[1:] != periods[:-1], True)
+        ends = days[last_of_period]
+        # 区间末尾所在周期可能尚未结束（end 之后还有交易日），此时不算期末
+        if len(ends) and ends[-1] == days[-1] and ends[-1] != self.last:
+            nxt = self.next_open(ends[-1])
+            if nxt.to_period(freq) == ends[-1].to_period(freq):
+                ends = ends[:-1]
+        return ends
+
+    def month_ends(self, start, end) -> pd.DatetimeIndex:
+        """区间内每月最后一个交易日"""
+        return self._period_ends(start, end, 'M')
+
+    def quarter_ends(self, start, end) -> pd.DatetimeIndex:
+        """区间内每季度最后一个交易日"""
+        return self._period_ends(start, end, 'Q')
+
+
+def _cache_path(exchange: str) -> str:
+    return os.path.join(CACHE_DIR, f'{exchange or "all"}.csv')
+
+
+def _read_cache(exchange: str, ignore_ttl: bool = False) -> Optional[pd.Series]:
+    path = _cache_path(exchange)
+    try:
+        if not ignore_ttl and time.time() - os.path.getmtime(path) > CACHE_TTL:
+            return None
+        return pd.read_csv(path, dtype=str)['cal_date']
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _write_cache(exchange: str, dates: pd.Series):
+    path = _cache_path(exchange)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    pd.DataFrame({'cal_date': dates}).to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def _read_table(conn, exchange: str) -> pd.Series:
+    sql = f"SELECT cal_date FROM {CALENDAR_TABLE} WHERE is_open::text = '1'"
+    params = None
+    if exchange:
+        sql += " AND exchange = %(exchange)s"
+        params = {'exchange': exchange}
+    df = pd.read_sql_query(sql, conn if conn is not None else get_engine(), params=params)
+    return pd.to_datetime(df['cal_date']).dt.strftime('%Y%m%d')
+
+
+def load_calendar(conn=None, exchange: str = 'SSE', use_cache: bool = True) -> TradingCalendar:
+    """读本地缓存，过期或缺失时从 trade_cal 表加载并回写缓存；conn 缺省使用 DB_DSN1 引擎"""
+    dates = _read_cache(exchange) if use_cache else None
+    if dates is None:
+        try:
+            dates = _read_table(conn, exchange)
+            _write_cache(exchange, dates)
+            logger.info(f"交易日历已从 {CALENDAR_TABLE} 加载：{len(dates)} 个交易日")
+        except Exception as e:
+            dates = _read_cache(exchange, ignore_ttl=True)
+            if dates is None:
+                raise
+            logger.warning(f"读取 {CALENDAR_TABLE} 失败，使用过期的本地缓存: {e}")
+    return TradingCalendar(dates)
+
+
+def get_calendar(conn=None, exchange: str = 'SSE') -> TradingCalendar:
+    """进程内单例"""
+    cal = _calendars.get(exchange)
+    if cal is None:
+        with _lock:
+            cal = _calendars.get(exchange)
+            if cal is None:
+                cal = load_calendar(conn, exchange)
+                _calendars[exchange] = cal
+    return cal
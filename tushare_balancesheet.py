@@ -2,16 +2,20 @@ import tushare as ts
 import akshare as ak
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
+from db_pool import pooled_connection
 import logging
 from typing import List, Dict, Optional
 import time
-import random
 import multiprocessing
 import argparse
 import sys
 from datetime import datetime, timedelta
-from functools import wraps
+from python_fetch import python_fetch
+from bulk_loader import copy_upsert_changed
+from period_sync import fetch_period_paged, load_period_rows, diff_changed_rows, latest_report_version
+from job_ledger import JobLedger
+from resilience import retry_on_exception
+from security_master import get_security_master
 
 # 设置日志
 logging.basicConfig(
@@ -24,32 +28,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def retry_on_exception(retries=3, delay=5, backoff=2, exceptions=(Exception,)):
-    """重试装饰器"""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            retry_delay = delay
-            last_exception = None
-            
-            for retry in range(retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except exceptions as e:
-                    last_exception = e
-                    if retry == retries:
-                        raise last_exception
-                    
-                    wait_time = retry_delay + random.uniform(0, 1)
-                    logger.warning(f"尝试 {retry + 1}/{retries} 失败: {str(e)}. "
-                                 f"{wait_time:.2f} 秒后重试...")
-                    
-                    time.sleep(wait_time)
-                    retry_delay *= backoff
-                    
-            raise last_exception
-        return wrapper
-    return decorator
 
 class BalanceSheetCollector:
     def __init__(self, db_params: dict, tushare_token: str):
@@ -58,7 +36,7 @@ class BalanceSheetCollector:
         self.pro = ts.pro_api(tushare_token)
         
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def init_table(self):
         """初始化数据表"""
@@ -233,12 +211,7 @@ class BalanceSheetCollector:
     def get_all_stocks(self) -> List[str]:
         """获取所有股票代码"""
         try:
-            df = ak.stock_info_a_code_name()
-            stock_list = [
-                f"{code}.{'SH' if str(code).startswith('6') else 'SZ'}"
-                for code in df['code'].tolist()
-                if str(code).startswith(('0', '3', '6'))
-            ]
+            stock_list = get_security_master(self.db_params).universe()
             logger.info(f"成功获取 {len(stock_list)} 个股票代码")
             return stock_list
         except Exception as e:
@@ -297,14 +270,31 @@ class BalanceSheetCollector:
         """获取指定股票和报告期的资产负债表数据"""
         try:
             logger.info(f"获取 {ts_code} 在 {period} 期间的资产负债表数据")
-            df = self.pro.balancesheet(ts_code=ts_code, period=period)
-            # 添加延时以避免频率限制
-            time.sleep(0.3)
+            # 频率限制由 python_fetch 的共享令牌桶统一控制
+            df = python_fetch('balancesheet', pro=self.pro, ts_code=ts_code, period=period)
             return df
         except Exception as e:
             logger.error(f"获取 {ts_code} 在 {period} 资产负债表数据失败: {str(e)}")
             raise
 
+    def sync_period(self, period: str) -> int:
+        """报告期横截面同步：balancesheet_vip 分页拉取全部公司，只写入新增或变化的行，返回写入行数"""
+        df = fetch_period_paged('balancesheet_vip', period, pro=self.pro)
+        if df.empty:
+            logger.warning(f"{period} 期间没有可用的资产负债表数据")
+            return 0
+        # 与逐只采集保持一致：只要 0/3/6 开头的 A 股
+        df = df[df['ts_code'].str[:1].isin(['0', '3', '6'])]
+        df = self.process_data(df)
+        df = latest_report_version(df, ['ts_code', 'end_date'])
+
+        with self.get_db_connection() as conn:
+            stored = load_period_rows(conn, self.table_name, 'end_date', period)
+        changed = diff_changed_rows(df, stored, pk_columns=['ts_code', 'end_date'])
+        logger.info(f"{period}: 拉取 {len(df)} 行，库中已有 {len(stored)} 行，新增/变化 {len(changed)} 行")
+        self.save_to_db(changed)
+        return len(changed)
+
     def process_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """处理数据"""
         if df.empty:
@@ -325,31 +315,19 @@ class BalanceSheetCollector:
         
         # 确保数据没有重复的主键
         if len(df) != len(df.drop_duplicates(subset=['ts_code', 'end_date'])):
-            logger.warning(f"检测到重复的主键，正在删除重复项...")
-            df = df.drop_duplicates(subset=['ts_code', 'end_date'])
+            logger.warning(f"检测到重复的主键，只保留最新版本...")
+            df = latest_report_version(df, ['ts_code', 'end_date'])
                 
         with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                columns = df.columns.tolist()
-                values = [tuple(x) for x in df.values]
-                
-                insert_stmt = f"""
-                    INSERT INTO {self.table_name} ({','.join(columns)})
-                    VALUES %s
-                    ON CONFLICT (ts_code, end_date)
-                    DO UPDATE SET
-                    {','.join(f"{col}=EXCLUDED.{col}" for col in columns 
-                             if col not in ['ts_code', 'end_date'])}
-                """
-                
-                try:
-                    execute_values(cur, insert_stmt, values)
-                    conn.commit()
-                    logger.info(f"成功保存 {len(df)} 条记录")
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"保存数据失败: {str(e)}")
-                    raise
+            try:
+                stats = copy_upsert_changed(conn, df, self.table_name, pk_columns=['ts_code', 'end_date'])
+                conn.commit()
+                logger.info(f"成功保存 {len(df)} 条记录：新增 {stats.inserted}，更新 {stats.updated}，"
+                            f"未变化 {stats.unchanged}")
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"保存数据失败: {str(e)}")
+                raise
 
 def process_stock_period(db_params: Dict, tushare_token: str, ts_code: str, period: str):
     """处理单个股票和报告期的数据采集"""
@@ -365,6 +343,9 @@ def process_stock_period(db_params: Dict, tushare_token: str, ts_code: str, peri
             logger.info(f"成功处理 {ts_code} 在 {period} 期间的资产负债表数据，共 {len(df)} 条记录")
         else:
             logger.warning(f"股票 {ts_code} 在期间 {period} 没有可用数据")
+
+        # 记入任务台账，--resume 时跳过
+        JobLedger(db_params, collector.table_name).record(ts_code, period, period, df)
             
     except Exception as e:
         logger.error(f"处理股票 {ts_code} 在期间 {period} 时出错: {str(e)}")
@@ -425,6 +406,16 @@ def main():
         default=4,
         help='并行进程数'
     )
+    parser.add_argument(
+        '--by-period',
+        action='store_true',
+        help='按报告期横截面批量拉取（vip 接口分页），替代逐只股票循环'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='断点续跑：跳过任务台账中已完成的 (股票, 报告期)'
+    )
     
     try:
         args = parser.parse_args()
@@ -445,13 +436,15 @@ def main():
         collector = BalanceSheetCollector(db_params, args.tushare_token)
         collector.init_table()
         
-        # 获取所有股票列表
-        stock_list = collector.get_all_stocks()
-        if not stock_list:
-            logger.error("没有找到股票列表，程序退出")
-            return
-            
-        logger.info(f"共获取到 {len(stock_list)} 只股票")
+        # 获取所有股票列表（按报告期横截面模式不需要）
+        stock_list = []
+        if not args.by_period:
+            stock_list = collector.get_all_stocks()
+            if not stock_list:
+                logger.error("没有找到股票列表，程序退出")
+                return
+                
+            logger.info(f"共获取到 {len(stock_list)} 只股票")
         
         # 确定开始日期
         start_date = args.start_date
@@ -462,7 +455,10 @@ def main():
                 year = int(latest_period[:4])
                 month = int(latest_period[4:6])
                 
-                if month == 3:
+                if args.resume:
+                    # 续跑：最新期间可能只写了一部分，从它本身开始，由台账过滤已完成股票
+                    start_date = latest_period
+                elif month == 3:
                     start_date = f"{year}0401"
                 elif month == 6:
                     start_date = f"{year}0701"
@@ -483,14 +479,40 @@ def main():
         
         logger.info(f"开始处理 {len(periods)} 个报告期的资产负债表数据")
         
+        if args.by_period:
+            ledger = JobLedger(db_params, collector.table_name)
+            ledger.init_table()
+            done = ledger.load_completed() if args.resume else set()
+            for period in periods:
+                if ('*', period, period) in done:
+                    logger.info(f"{period}: 台账中已完成，跳过")
+                    continue
+                try:
+                    collector.sync_period(period)
+                    ledger.record('*', period, period)
+                except Exception as e:
+                    logger.error(f"处理期间 {period} 时出错: {str(e)}")
+            logger.info("所有报告期处理完成")
+            return
+        
+        # 任务台账
+        ledger = JobLedger(db_params, collector.table_name)
+        ledger.init_table()
+        done = ledger.load_completed() if args.resume else set()
+        
         # 调整进程数
         num_processes = min(args.processes, len(periods) * len(stock_list))
         
         # 创建任务列表
         tasks = []
         for period in periods:
+            remaining = [s for s in stock_list if (s, period, period) not in done]
+            if len(remaining) < len(stock_list):
+                logger.info(f"{period}: 台账中已完成 {len(stock_list) - len(remaining)} 只，剩余 {len(remaining)} 只")
+            if not remaining:
+                continue
             for worker_id in range(args.processes):
-                tasks.append((db_params, args.tushare_token, period, stock_list, worker_id, args.processes))
+                tasks.append((db_params, args.tushare_token, period, remaining, worker_id, args.processes))
         
         # 创建进程池执行任务
         with multiprocessing.Pool(processes=num_processes) as pool:
@@ -24,6 +24,7 @@ from collections import defaultdict
 import time
 import gc
 import csv
+from data_lake import lake_available, read_lake
 
 load_dotenv('.env')
 POSTGRES_CONFIG = os.getenv("DB_DSN1")
@@ -577,11 +578,16 @@ if __name__ == '__main__':
     
     # 加载个股数据
     stock_syms = [s for s in symbols_to_run if s != BENCHMARK_SYMBOL]
-    placeholders = ','.join(['%s'] * len(stock_syms))
-    df_stocks = pd.read_sql_query(
-        f"SELECT trade_date, symbol, open, high, low, close, volume FROM stock_history WHERE symbol IN ({placeholders}) AND trade_date BETWEEN %s AND %s AND adjust_type=%s",
-        conn, params=[*stock_syms, min_date, max_date, ADJUST_TYPE]
-    )
+    if lake_available('stock_history', end=max_date, split=ADJUST_TYPE):
+        # 本地 parquet 镜像：按月分区裁剪 + 列裁剪，不走局域网
+        df_stocks = read_lake('stock_history', columns=['trade_date', 'symbol', 'open', 'high', 'low', 'close', 'volume'],
+                              start=min_date, end=max_date, symbols=stock_syms, split=ADJUST_TYPE)
+    else:
+        placeholders = ','.join(['%s'] * len(stock_syms))
+        df_stocks = pd.read_sql_query(
+            f"SELECT trade_date, symbol, open, high, low, close, volume FROM stock_history WHERE symbol IN ({placeholders}) AND trade_date BETWEEN %s AND %s AND adjust_type=%s",
+            conn, params=[*stock_syms, min_date, max_date, ADJUST_TYPE]
+        )
 
     # -----------------------------------------------------------
     # 🔥 新增：加载 IPO 上市日期数据
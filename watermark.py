@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+批量水位加载：用一次 GROUP BY 查询取出 (主键...) -> MAX(日期)，
+替代逐只股票 ORDER BY trade_date DESC LIMIT 1 的查询。
+
+用法：
+    store = WatermarkStore('stock_history', key_columns=('symbol', 'adjust_type'))
+    store.load(conn, where='adjust_type = %s', params=('hfq',))
+    start = store.start_date_for(('000001', 'hfq'), default_start='20100101')
+    ...保存成功后...
+    store.update_from_frame(df)
+
+WatermarkStore 只含普通 dict，可直接 pickle 传给 multiprocessing 子进程；
+也可用 subset(keys) 只把本批次用到的部分传下去。
+"""
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+Key = Union[str, Tuple[Any, ...]]
+
+
+class WatermarkStore:
+    def __init__(self, table_name: str, key_columns: Sequence[str] = ('ts_code',),
+                 date_column: str = 'trade_date', watermarks: Optional[Dict[Key, date]] = None):
+        self.table_name = table_name
+        self.key_columns = tuple(key_columns)
+        self.date_column = date_column
+        self.watermarks: Dict[Key, date] = dict(watermarks or {})
+
+    def _key(self, key: Key) -> Key:
+        # 单列主键用标量作为字典键，多列主键用元组
+        if len(self.key_columns) == 1 and isinstance(key, tuple):
+            return key[0]
+        return key
+
+    def load(self, conn, where: Optional[str] = None, params: Optional[Sequence] = None) -> 'WatermarkStore':
+        """一次分组查询加载全部水位（psycopg2 连接）"""
+        keys = ', '.join(self.key_columns)
+        sql = f"SELECT {keys}, MAX({self.date_column}) FROM {self.table_name}"
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" GROUP BY {keys}"
+        with conn.cursor() as cur:
+            cur.execute(sql, tuple(params or ()))
+            rows = cur.fetchall()
+        n = len(self.key_columns)
+        for row in rows:
+            key = row[0] if n == 1 else tuple(row[:n])
+            self.watermarks[key] = row[n]
+        return self
+
+    def get(self, key: Key) -> Optional[date]:
+        return self.watermarks.get(self._key(key))
+
+    def start_date_for(self, key: Key, default_start: str) -> str:
+        """水位的下一天（YYYYMMDD）；无水位时返回 default_start"""
+        latest = self.get(key)
+        if latest is None:
+            return default_start
+        return max(default_start, (latest + timedelta(days=1)).strftime('%Y%m%d'))
+
+    def update(self, key: Key, latest: Union[date, datetime, str, None]):
+        """保存成功后推进内存中的水位（只前进不后退）"""
+        if latest is None or (not isinstance(latest, str) and pd.isna(latest)):
+            return
+        latest = pd.Timestamp(latest).date()
+        key = self._key(key)
+        current = self.watermarks.get(key)
+        if current is None or latest > current:
+            self.watermarks[key] = latest
+
+    def update_from_frame(self, df: pd.DataFrame):
+        """按主键分组取最大日期，批量推进水位"""
+        if df is None or df.empty:
+            return
+        cols = list(self.key_columns)
+        latest = df.groupby(cols)[self.date_column].max()
+        for key, value in latest.items():
+            self.update(key, value)
+
+    def subset(self, keys: Iterable[Key]) -> 'WatermarkStore':
+        """只保留给定主键的水位，用于分发给子进程"""
+        wanted = {self._key(k) for k in keys}
+        return WatermarkStore(self.table_name, self.key_columns, self.date_column,
+                              {k: v for k, v in self.watermarks.items() if k in wanted})
+
+    def max_date(self) -> Optional[date]:
+        return max(self.watermarks.values()) if self.watermarks else None
+
+    def __len__(self) -> int:
+        return len(self.watermarks)
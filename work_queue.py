@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+动态工作队列：替代 chunks(stocks, N) 静态切分 + pool.starmap。
+
+静态切分时某个分片慢（限频惩罚、历史长的股票扎堆），整个 starmap 都要等它，其余进程空转。
+这里改为：
+1. order_by_cost: 按预估成本降序排列任务（最长任务优先），大任务先开跑，尾部只剩小任务
+2. run_work_queue: imap_unordered + 小 chunksize，空闲进程随时领取下一个任务
+
+用法：
+    tasks = [(symbol, watermarks.start_date_for(symbol, start), end) for symbol in stocks]
+    tasks = order_by_cost(tasks, cost=lambda t: missing_days(t[1], t[2]))
+    stats = run_work_queue(process_stock, tasks, processes=10,
+                           initializer=init_worker, initargs=(db_params,))
+
+worker 返回 (key, status, rows)，status 取 'ok' / 'empty' / 'error' / 'skip' / 'deferred'。
+'deferred' 表示上游熔断中（resilience.CircuitOpenError），该任务在本轮结束后等待冷却再重新排队。
+"""
+import logging
+import multiprocessing
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple
+
+from resilience import RESET_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+TaskResult = Tuple[Any, str, int]
+
+
+def missing_days(start_date: str, end_date: str) -> int:
+    """[start_date, end_date] 的自然日数（YYYYMMDD），作为待补数据量的估计；起点晚于终点时为 0"""
+    try:
+        start = datetime.strptime(start_date, '%Y%m%d')
+        end = datetime.strptime(end_date, '%Y%m%d')
+    except (TypeError, ValueError):
+        return 0
+    return max((end - start).days + 1, 0)
+
+
+def order_by_cost(tasks: Iterable, cost: Callable[[Any], float]) -> List:
+    """按成本降序排列（稳定排序，同成本保持原顺序）"""
+    return sorted(tasks, key=cost, reverse=True)
+
+
+def _run_task(item: Tuple[Callable[[Any], TaskResult], Any]) -> Tuple[Any, TaskResult]:
+    """在子进程里执行 worker，并把原任务一起带回，便于把 deferred 任务重新排队"""
+    worker, task = item
+    return task, worker(task)
+
+
+def run_work_queue(worker: Callable[[Any], TaskResult], tasks: Sequence,
+                   processes: int, initializer: Optional[Callable] = None,
+                   initargs: tuple = (), chunksize: int = 1,
+                   label: str = '', log_every: int = 100,
+                   defer_rounds: int = 2, defer_wait: float = RESET_TIMEOUT) -> Counter:
+    """
+    多进程动态分发任务，返回各状态计数（Counter）及 'rows' 总行数
+    - chunksize 保持很小（默认 1），任务领取粒度越细尾部越短
+    - worker 内部应自行捕获异常并返回 'error'，未捕获的异常会中断整个队列
+    - 返回 'deferred' 的任务在本轮跑完后等待 defer_wait 秒（熔断冷却）重新排队，最多 defer_rounds 轮；
+      最终仍未完成的计入 stats['deferred']
+    """
+    stats: Counter = Counter()
+    total = len(tasks)
+    if total == 0:
+        logger.info(f"{label} 无待处理任务")
+        return stats
+    processes = max(1, min(processes, total))
+    started = time.time()
+    logger.info(f"{label} 动态队列启动：{total} 个任务，{processes} 个进程，chunksize={chunksize}")
+
+    pending = list(tasks)
+    done = 0
+    with multiprocessing.Pool(processes=processes, initializer=initializer, initargs=initargs) as pool:
+        for round_no in range(defer_rounds + 1):
+            if round_no:
+                logger.warning(f"{label} {len(pending)} 个任务因上游熔断延后，{defer_wait:.0f}s 后第 {round_no} 次重排")
+                time.sleep(defer_wait)
+            deferred = []
+            items = [(worker, task) for task in pending]
+            for task, result in pool.imap_unordered(_run_task, items, chunksize=chunksize):
+                key, status, rows = result
+                if status == 'deferred' and round_no < defer_rounds:
+                    deferred.append(task)
+                    continue
+                done += 1
+                stats[status] += 1
+                stats['rows'] += rows or 0
+                if done % log_every == 0 or done == total:
+                    elapsed = time.time() - started
+                    logger.info(f"{label} 进度 {done}/{total}，成功 {stats['ok']}，无数据 {stats['empty']}，"
+                                f"失败 {stats['error']}，{elapsed:.0f}s")
+            if not deferred:
+                break
+            pending = deferred
+
+    if stats['deferred']:
+        logger.warning(f"{label} {stats['deferred']} 个任务在 {defer_rounds} 轮重排后上游仍未恢复，留待下次运行")
+    logger.info(f"{label} 完成：{dict(stats)}，耗时 {time.time() - started:.1f}s")
+    return stats
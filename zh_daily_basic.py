@@ -2,16 +2,20 @@
 import akshare as ak
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
+from db_pool import pooled_connection
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Tuple
 import time
 import random
 import multiprocessing
 import argparse
 import sys
 from datetime import datetime, timedelta
-from functools import wraps
+from watermark import WatermarkStore
+from bulk_loader import copy_upsert
+from work_queue import missing_days, order_by_cost, run_work_queue
+from resilience import CircuitOpenError, EASTMONEY, LEGU, retry_on_exception
+from spot_snapshot import fetch_spot_snapshot, gap_tasks, snapshot_to_daily_basic, snapshot_trade_date
 
 # -------------------- 日志 --------------------
 logging.basicConfig(
@@ -24,28 +28,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# -------------------- 重试装饰器 --------------------
-def retry_on_exception(retries=3, delay=5, backoff=2, exceptions=(Exception,)):
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            retry_delay = delay
-            last_exception = None
-            for retry in range(retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except exceptions as e:
-                    last_exception = e
-                    if retry == retries:
-                        raise last_exception
-                    wait_time = retry_delay + random.uniform(0, 1)
-                    logger.warning(f"尝试 {retry + 1}/{retries} 失败: {str(e)}. "
-                                   f"{wait_time:.2f} 秒后重试...")
-                    time.sleep(wait_time)
-                    retry_delay *= backoff
-            raise last_exception
-        return wrapper
-    return decorator
 
 # -------------------- 采集器 --------------------
 class DailyBasicCollector:
@@ -54,7 +36,7 @@ class DailyBasicCollector:
         self.table_name = 'daily_basic'
 
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_params)
+        return pooled_connection(self.db_params)
 
     def init_table(self):
         create_table_sql = f"""
@@ -87,7 +69,7 @@ class DailyBasicCollector:
                 logger.info("数据表初始化完成")
 
     # -------------------- 股票列表 --------------------
-    @retry_on_exception(retries=3, delay=5, backoff=2)
+    @retry_on_exception(retries=3, delay=5, backoff=2, upstream=LEGU)
     def get_stock_list(self) -> List[str]:
         """获取股票列表，带重试机制"""
         try:
@@ -106,21 +88,15 @@ class DailyBasicCollector:
             logger.error(f"获取股票列表失败: {str(e)}")
             raise
 
-    def get_latest_trade_date(self, ts_code: str) -> Optional[datetime]:
+    def load_watermarks(self) -> WatermarkStore:
+        """一次分组查询加载全部代码的最新交易日"""
+        store = WatermarkStore(self.table_name, key_columns=('ts_code',))
         with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(f"""
-                    SELECT trade_date 
-                    FROM {self.table_name}
-                    WHERE ts_code = %s
-                    ORDER BY trade_date DESC
-                    LIMIT 1
-                """, (ts_code,))
-                result = cur.fetchone()
-                return result[0] if result else None
+            store.load(conn)
+        return store
 
     # -------------------- 核心：用 ak.stock_zh_a_hist --------------------
-    @retry_on_exception(retries=3, delay=5, backoff=2)
+    @retry_on_exception(retries=3, delay=5, backoff=2, upstream=EASTMONEY)
     def fetch_data(self, ts_code: str, start_date: str, end_date: str) -> pd.DataFrame:
         df = ak.stock_zh_a_hist(
             symbol=ts_code,
@@ -166,65 +142,59 @@ class DailyBasicCollector:
         if df.empty:
             return
         with self.get_db_connection() as conn:
-            with conn.cursor() as cur:
-                columns = df.columns.tolist()
-                values = [tuple(x) for x in df.values]
-                sql = f"""
-                    INSERT INTO {self.table_name} ({','.join(columns)})
-                    VALUES %s
-                    ON CONFLICT (ts_code, trade_date)
-                    DO UPDATE SET
-                    {','.join(f"{c}=EXCLUDED.{c}" for c in columns
-                             if c not in ['ts_code', 'trade_date'])}
-                """
-                try:
-                    execute_values(cur, sql, values)
-                    conn.commit()
-                    logger.info(f"成功保存 {len(df)} 条记录")
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"保存数据失败: {str(e)}")
-                    raise
+            try:
+                copy_upsert(conn, df, self.table_name, pk_columns=['ts_code', 'trade_date'])
+                conn.commit()
+                logger.info(f"成功保存 {len(df)} 条记录")
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"保存数据失败: {str(e)}")
+                raise
 
 # -------------------- 多进程辅助 --------------------
-def process_stock_batch(db_params: Dict, stock_batch: List[str],
-                        batch_id: int, start_date: str, end_date: str, mode: str):
-    if not stock_batch:
-        logger.warning(f"Batch {batch_id}: Empty stock batch, skipping")
-        return
+_worker_collector = None
+
+def init_worker(db_params: Dict):
+    global _worker_collector
+    _worker_collector = DailyBasicCollector(db_params)
+
+def process_stock(task: Tuple[str, str, str]) -> Tuple[str, str, int]:
+    """单只股票任务，返回 (code, 状态, 行数)"""
+    code, code_start, end_date = task
     try:
-        collector = DailyBasicCollector(db_params)
-        total = len(stock_batch)
-        logger.info(f"Batch {batch_id}: Starting {total} stocks")
-        succ = err = 0
-        for idx, code in enumerate(stock_batch, 1):
-            try:
-                time.sleep(random.uniform(1, 3))
-                if mode == 'incremental':
-                    latest = collector.get_latest_trade_date(code)
-                    if latest:
-                        start_date = (latest + timedelta(days=1)).strftime('%Y%m%d')
-                df = collector.fetch_data(code, start_date, end_date)
-                if not df.empty:
-                    df = collector.process_data(df)
-                    collector.save_to_db(df)
-                    succ += 1
-                    logger.info(f"Batch {batch_id}: {idx}/{total} - {code} OK")
-                else:
-                    logger.warning(f"Batch {batch_id}: No data {code}")
-            except Exception as e:
-                err += 1
-                logger.error(f"Batch {batch_id}: {code} failed - {e}")
-        logger.info(f"Batch {batch_id} done. Success: {succ}, Errors: {err}")
+        time.sleep(random.uniform(1, 3))
+        df = _worker_collector.fetch_data(code, code_start, end_date)
+        if df.empty:
+            logger.warning(f"No data {code}")
+            return code, 'empty', 0
+        df = _worker_collector.process_data(df)
+        _worker_collector.save_to_db(df)
+        logger.info(f"{code} OK")
+        return code, 'ok', len(df)
+    except CircuitOpenError as e:
+        # 上游熔断中，不占用重试时间，交回队列稍后再排
+        logger.warning(f"{code} 延后处理: {e}")
+        return code, 'deferred', 0
     except Exception as e:
-        logger.error(f"Batch {batch_id} fatal: {e}")
+        logger.error(f"{code} failed - {e}")
+        return code, 'error', 0
 
-def chunks(lst: List, n: int) -> List[List]:
-    if not lst:
-        return []
-    size = len(lst)
-    chunk_size = (size + n - 1) // n
-    return [lst[i:i + chunk_size] for i in range(0, size, chunk_size)]
+def run_daily_close(collector: DailyBasicCollector, start_date: str, processes: int):
+    """收盘快照模式：一次全市场快照写入当日数据，只逐只补交易日历上缺数据的股票"""
+    trade_date = snapshot_trade_date()
+    if trade_date is None:
+        return
+    basic = snapshot_to_daily_basic(fetch_spot_snapshot(), trade_date)
+    # 写入快照前取水位，当天的数据不应掩盖更早的缺口
+    watermarks = collector.load_watermarks()
+    gaps = gap_tasks(watermarks.get, basic['ts_code'], trade_date, start_date)
+    collector.save_to_db(basic)
+    logger.info(f"{trade_date} 收盘快照已写入 {len(basic)} 只，{len(gaps)} 只需要补缺口")
+    if gaps:
+        gaps = order_by_cost(gaps, cost=lambda t: missing_days(t[1], t[2]))
+        run_work_queue(process_stock, gaps, processes=min(processes, len(gaps)),
+                       initializer=init_worker, initargs=(collector.db_params,),
+                       label='daily_basic_gaps')
 
 # -------------------- 入口 --------------------
 def main():
@@ -233,6 +203,8 @@ def main():
     parser.add_argument('--processes', type=int, default=10)
     parser.add_argument('--start_date', type=str, default='20100101')
     parser.add_argument('--end_date', type=str, default=datetime.now().strftime('%Y%m%d'))
+    parser.add_argument('--daily-close', action='store_true',
+                        help='收盘快照模式：一次全市场快照写入当日数据，只逐只补缺交易日的股票')
     args = parser.parse_args()
 
     db_params = {
@@ -246,6 +218,9 @@ def main():
     try:
         collector = DailyBasicCollector(db_params)
         collector.init_table()
+        if args.daily_close:
+            run_daily_close(collector, args.start_date, args.processes)
+            return
         stocks = collector.get_stock_list()
         total = len(stocks)
         if total == 0:
@@ -253,13 +228,17 @@ def main():
             return
         num_proc = min(args.processes, total)
         logger.info(f"开始 {args.mode} 模式，{num_proc} 进程")
-        batches = chunks(stocks, num_proc)
-        tasks = [
-            (db_params, batch, i, args.start_date, args.end_date, args.mode)
-            for i, batch in enumerate(batches) if batch
-        ]
-        with multiprocessing.Pool(processes=num_proc) as pool:
-            pool.starmap(process_stock_batch, tasks)
+        watermarks = collector.load_watermarks() if args.mode == 'incremental' else None
+        tasks = []
+        for code in stocks:
+            code_start = watermarks.start_date_for(code, args.start_date) if watermarks else args.start_date
+            if code_start <= args.end_date:
+                tasks.append((code, code_start, args.end_date))
+        # 缺失天数多的先跑，空闲进程从队列里领下一只
+        tasks = order_by_cost(tasks, cost=lambda t: missing_days(t[1], t[2]))
+        run_work_queue(process_stock, tasks, processes=num_proc,
+                       initializer=init_worker, initargs=(db_params,),
+                       label='daily_basic')
         logger.info("全部完成")
     except KeyboardInterrupt:
         logger.info("用户中断")